@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+"""
+Benchmark employ's controller against local stand-in SSH servers
+
+Starts the given numbers of local paramiko SSH servers, see sshserver.py,
+and measures how long employ itself takes to run commands on them,
+upload to them, collect large output from them and aggregate results,
+printing the results as JSON.
+
+Usage:
+  run.py --help
+  run.py [options] [<benchmark> ...]
+
+Benchmarks:
+  fanout                        Run a no-op command on every host
+  upload                        Upload a new file to every host
+  output                        Collect large stdout from every host,
+                                with both the threads and poll backends
+  aggregate                     Aggregate ab, wrk and httpload results,
+                                without any hosts
+
+Options:
+  -h, --help                    Show this message
+  --hosts=<counts>              Comma separated numbers of hosts to
+                                benchmark against [default: 1,8,32]
+  --repeat=<repeat>             Times to repeat each benchmark [default: 5]
+  --max-parallel=<max>          max_parallel for the manager, 0 for one
+                                per host [default: 0]
+  --upload-size=<mb>            Megabytes to upload to each host [default: 8]
+  --distribution=<mode>         How to upload, "direct" or "tree" [default: direct]
+  --output-size=<mb>            Megabytes of stdout from each host [default: 4]
+  --results=<results>           Results to aggregate per command [default: 1000]
+  --output=<file>               Write the JSON results to <file> instead of stdout
+  --baseline=<file>             Compare against earlier JSON results and exit
+                                non-zero when any benchmark got slower
+  --tolerance=<fraction>        How much slower than the baseline is still
+                                fine [default: 0.1]
+
+"""
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from docopt import docopt
+import paramiko
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import employ
+from employ.commands.ab import ABCommand
+from employ.commands.histogram import Histogram
+from employ.commands.httpload import HTTPLoadCommand
+from employ.commands.wrk import WrkCommand
+from employ.managers.hosts import HostsManager
+from employ.result import Result
+from sshserver import SSHServer
+
+BENCHMARKS = ("fanout", "upload", "output", "aggregate")
+MEGABYTE = 1024 * 1024
+
+SAMPLE_AB = """Concurrency Level:      10
+Time taken for tests:   1.234 seconds
+Complete requests:      1000
+Failed requests:        2
+Requests per second:    810.37 [#/sec] (mean)
+Time per request:       12.340 [ms] (mean)
+Time per request:       1.234 [ms] (mean, across all concurrent requests)
+Transfer rate:          200.12 [Kbytes/sec] received
+
+Connection Times (ms)
+              min  mean[+/-sd] median   max
+Connect:        0    1   0.5      1       3
+Processing:     2   11   3.1     10      30
+Waiting:        1   10   3.0     10      29
+Total:          3   12   3.2     11      31
+
+Percentage of the requests served within a certain time (ms)
+  50%     11
+  66%     12
+  75%     13
+  80%     14
+  90%     16
+  95%     18
+  98%     22
+  99%     25
+ 100%     31 (longest request)
+"""
+
+SAMPLE_WRK = """Running 30s test @ http://127.0.0.1:8080/index.html
+  12 threads and 400 connections
+  Thread Stats   Avg      Stdev     Max   +/- Stdev
+    Latency   635.91us    0.89ms  12.92ms   93.69%
+    Req/Sec    56.20k     8.07k   62.00k    86.54%
+  Latency Distribution
+     50%  250.00us
+     75%  491.00us
+     90%  700.00us
+     99%    5.80ms
+  22464657 requests in 30.00s, 17.76GB read
+  Socket errors: connect 0, read 0, write 0, timeout 4
+  Non-2xx or 3xx responses: 12
+Requests/sec: 748868.53
+Transfer/sec:    606.33MB
+"""
+
+
+def log(message, *args):
+    sys.stderr.write((message % args) + "\n")
+
+
+def summarize(samples):
+    """
+    Summarize a list of timings in seconds
+
+    :returns: dict - {"min", "median", "mean", "max"}
+    """
+    samples = sorted(samples)
+    middle = len(samples) // 2
+    median = samples[middle]
+    if len(samples) % 2 == 0:
+        median = (samples[middle - 1] + median) / 2.0
+    return {
+        "min": samples[0],
+        "median": median,
+        "mean": sum(samples) / len(samples),
+        "max": samples[-1],
+    }
+
+
+def timed(func, repeat):
+    """
+    Call `func` `repeat` times
+
+    :returns: list - [seconds, ...]
+    """
+    samples = []
+    for _ in xrange(repeat):
+        start = time.time()
+        func()
+        samples.append(time.time() - start)
+    return samples
+
+
+def record(benchmark, variant, hosts, samples, **extra):
+    """
+    Build a single benchmark result
+
+    :returns: dict
+    """
+    result = {
+        "benchmark": benchmark,
+        "variant": variant,
+        "hosts": hosts,
+        "seconds": summarize(samples),
+    }
+    result.update(extra)
+    log(
+        "%-10s %-10s %5s hosts: %.4f seconds median",
+        benchmark, variant or "", hosts, result["seconds"]["median"]
+    )
+    return result
+
+
+class Fleet(object):
+    """
+    Local stand-in SSH servers and an employ manager connected to them
+    """
+
+    def __init__(self, count, key_file, max_parallel, **settings):
+        self.directory = tempfile.mkdtemp(prefix="employ-bench-")
+        host_key = paramiko.RSAKey.from_private_key_file(key_file)
+        self.servers = [
+            SSHServer(host_key, os.path.join(self.directory, str(index)))
+            for index in xrange(count)
+        ]
+        self.settings = settings
+        self.settings.update(
+            hosts=[server.host for server in self.servers],
+            host_key=key_file,
+            max_parallel=max_parallel or count,
+        )
+        self.manager = None
+
+    def connect(self, **settings):
+        """
+        Connect a new manager to all servers
+
+        :returns: :class:`employ.managers.hosts.HostsManager`
+        """
+        options = dict(self.settings)
+        options.update(settings)
+        self.manager = HostsManager(**options)
+        self.manager.setup_instances()
+        return self.manager
+
+    def disconnect(self):
+        if self.manager:
+            self.manager.cleanup_instances()
+            self.manager.shutdown()
+            self.manager = None
+
+    def close(self):
+        self.disconnect()
+        for server in self.servers:
+            server.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def bench_fanout(fleet, arguments):
+    repeat = int(arguments["--repeat"])
+    hosts = len(fleet.servers)
+    connect = []
+    for _ in xrange(repeat):
+        fleet.disconnect()
+        start = time.time()
+        manager = fleet.connect()
+        connect.append(time.time() - start)
+    results = [record("connect", None, hosts, connect)]
+
+    samples = timed(lambda: manager._run_multi("true"), repeat)
+    results.append(record("fanout", None, hosts, samples))
+    return results
+
+
+def bench_upload(fleet, arguments):
+    repeat = int(arguments["--repeat"])
+    size = int(float(arguments["--upload-size"]) * MEGABYTE)
+    hosts = len(fleet.servers)
+    manager = fleet.connect(distribution=arguments["--distribution"])
+    fd, filename = tempfile.mkstemp(prefix="employ-bench-upload-")
+    os.close(fd)
+    samples = []
+    try:
+        for _ in xrange(repeat):
+            # new content every time so nothing is skipped as up to date
+            with open(filename, "wb") as fp:
+                fp.write(os.urandom(size))
+            start = time.time()
+            manager.upload(filename, "/tmp/employ-bench-upload")
+            samples.append(time.time() - start)
+    finally:
+        os.remove(filename)
+    median = summarize(samples)["median"]
+    return [record(
+        "upload", arguments["--distribution"], hosts, samples, bytes=size * hosts,
+        megabytes_per_second=size * hosts / MEGABYTE / median if median else None,
+    )]
+
+
+def bench_output(fleet, arguments):
+    repeat = int(arguments["--repeat"])
+    size = int(float(arguments["--output-size"]) * MEGABYTE)
+    hosts = len(fleet.servers)
+    command = "head -c %s /dev/zero" % size
+    results = []
+    for backend in ("threads", "poll"):
+        manager = fleet.connect(backend=backend)
+        samples = []
+        for _ in xrange(repeat):
+            start = time.time()
+            collected = manager._run_multi(command)
+            samples.append(time.time() - start)
+            received = sum(len(result.stdout) for result in collected)
+            if received != size * hosts:
+                raise AssertionError("collected %s of %s bytes" % (received, size * hosts))
+        median = summarize(samples)["median"]
+        results.append(record(
+            "output", backend, hosts, samples, bytes=size * hosts,
+            megabytes_per_second=size * hosts / MEGABYTE / median if median else None,
+        ))
+    return results
+
+
+def sample_httpload():
+    histogram = Histogram()
+    for _ in xrange(10000):
+        histogram.record(int(random.lognormvariate(8, 0.5)))
+    return "\n".join([
+        "requests: 10000",
+        "errors: 0",
+        "bytes: 1000000",
+        "elapsed: 10.000000",
+        "requests_per_second: 1000.000",
+        "status_200: 10000",
+        "%s %s" % (Histogram.marker, histogram.encode()),
+    ])
+
+
+def bench_aggregate(arguments):
+    repeat = int(arguments["--repeat"])
+    count = int(arguments["--results"])
+    commands = [
+        ("ab", ABCommand("http://127.0.0.1/", 1000), SAMPLE_AB),
+        ("wrk", WrkCommand("http://127.0.0.1/"), SAMPLE_WRK),
+        ("httpload", HTTPLoadCommand("http://127.0.0.1/"), sample_httpload()),
+    ]
+    results = []
+    stdout = sys.stdout
+    for name, command, output in commands:
+        samples = []
+        for _ in xrange(repeat):
+            # new results every time, so output is parsed again instead
+            # of reusing what the last repeat parsed
+            start = time.time()
+            outputs = [
+                Result("host-%s" % index, 0, output, "", start, start + 1)
+                for index in xrange(count)
+            ]
+            # commands print their combined results
+            sys.stdout = open(os.devnull, "w")
+            try:
+                start = time.time()
+                command.aggregate(outputs)
+                samples.append(time.time() - start)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+        median = summarize(samples)["median"]
+        results.append(record(
+            "aggregate", name, 0, samples, results=count,
+            results_per_second=count / median if median else None,
+        ))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare median timings of `results` against `baseline`
+
+    :returns: bool - whether nothing got slower than `tolerance` allows
+    """
+    previous = dict(
+        ((result["benchmark"], result["variant"], result["hosts"]), result)
+        for result in baseline["benchmarks"]
+    )
+    ok = True
+    log("%-10s %-10s %5s %12s %12s %8s", "benchmark", "variant", "hosts", "baseline", "now", "ratio")
+    for result in results:
+        key = (result["benchmark"], result["variant"], result["hosts"])
+        if key not in previous:
+            continue
+        before = previous[key]["seconds"]["median"]
+        after = result["seconds"]["median"]
+        ratio = after / before if before else 1.0
+        slower = ratio > 1 + tolerance
+        ok = ok and not slower
+        log(
+            "%-10s %-10s %5s %12.4f %12.4f %8.2f%s",
+            key[0], key[1] or "", key[2], before, after, ratio, " SLOWER" if slower else ""
+        )
+    return ok
+
+
+def main(arguments):
+    benchmarks = arguments["<benchmark>"] or list(BENCHMARKS)
+    for benchmark in benchmarks:
+        if benchmark not in BENCHMARKS:
+            sys.exit("Unknown benchmark: '%s'" % benchmark)
+
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    fd, key_file = tempfile.mkstemp(prefix="employ-bench-key-")
+    os.close(fd)
+    paramiko.RSAKey.generate(2048).write_private_key_file(key_file)
+
+    results = []
+    try:
+        if "aggregate" in benchmarks:
+            results.extend(bench_aggregate(arguments))
+        for count in [int(count) for count in arguments["--hosts"].split(",")]:
+            if not set(benchmarks) - set(["aggregate"]):
+                break
+            fleet = Fleet(count, key_file, int(arguments["--max-parallel"]))
+            try:
+                if "fanout" in benchmarks:
+                    results.extend(bench_fanout(fleet, arguments))
+                if "upload" in benchmarks:
+                    results.extend(bench_upload(fleet, arguments))
+                if "output" in benchmarks:
+                    results.extend(bench_output(fleet, arguments))
+            finally:
+                fleet.close()
+    finally:
+        os.remove(key_file)
+
+    report = {
+        "employ": employ.__version__,
+        "python": platform.python_version(),
+        "paramiko": paramiko.__version__,
+        "platform": platform.platform(),
+        "settings": dict(
+            (key.lstrip("-"), value) for key, value in arguments.iteritems()
+            if key.startswith("--") and key not in ("--help", "--output", "--baseline")
+        ),
+        "benchmarks": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if arguments["--output"]:
+        with open(arguments["--output"], "w") as fp:
+            fp.write(output + "\n")
+    else:
+        print output
+
+    if arguments["--baseline"]:
+        with open(arguments["--baseline"], "r") as fp:
+            baseline = json.load(fp)
+        if not compare(results, baseline, float(arguments["--tolerance"])):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__, help=True))
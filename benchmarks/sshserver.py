@@ -0,0 +1,209 @@
+"""
+Local stand-in SSH server for benchmarking employ's controller
+
+Each :class:`SSHServer` listens on 127.0.0.1, accepts any credentials,
+runs exec requests with /bin/sh and serves SFTP from the local
+filesystem. Every server can be given its own root directory, paths
+under /tmp/ in commands and SFTP requests are moved under it so
+servers do not share uploads. Never expose these servers to a network.
+"""
+import os
+import socket
+import subprocess
+import threading
+
+import paramiko
+
+
+def _rewrite(text, root):
+    """
+    Helper function to move /tmp/ paths in `text` under `root`
+    """
+    if root is None:
+        return text
+    return text.replace("/tmp/", root + "/tmp/")
+
+
+class _Handle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class _SFTPServer(paramiko.SFTPServerInterface):
+    def __init__(self, server, root=None, *args, **kwargs):
+        paramiko.SFTPServerInterface.__init__(self, server, *args, **kwargs)
+        self.root = root
+
+    def open(self, path, flags, attr):
+        path = _rewrite(path, self.root)
+        fd = os.open(path, flags, 0644)
+        if flags & os.O_APPEND:
+            mode = "ab"
+        elif flags & os.O_RDWR:
+            mode = "r+b"
+        elif flags & os.O_WRONLY:
+            mode = "wb"
+        else:
+            mode = "rb"
+        handle = _Handle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def stat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.stat(_rewrite(path, self.root)))
+
+    lstat = stat
+
+    def remove(self, path):
+        os.remove(_rewrite(path, self.root))
+        return paramiko.SFTP_OK
+
+    def rename(self, old, new):
+        os.rename(_rewrite(old, self.root), _rewrite(new, self.root))
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        os.mkdir(_rewrite(path, self.root))
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        return paramiko.SFTP_OK
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self, root=None):
+        self.root = root
+
+    def get_allowed_auths(self, username):
+        return "publickey,password"
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED_OPEN_REQUEST
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        thread = threading.Thread(
+            target=_execute, args=(channel, _rewrite(command, self.root))
+        )
+        thread.daemon = True
+        thread.start()
+        return True
+
+
+def _pump(source, send):
+    """
+    Helper function to send everything read from `source` with `send`
+    """
+    while True:
+        data = os.read(source.fileno(), 32768)
+        if not data:
+            break
+        send(data)
+
+
+def _execute(channel, command):
+    """
+    Helper function to run `command` for an exec request on `channel`
+    """
+    process = subprocess.Popen(
+        command, shell=True, stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+
+    def feed():
+        try:
+            while True:
+                data = channel.recv(32768)
+                if not data:
+                    break
+                process.stdin.write(data)
+        except (IOError, OSError):
+            pass
+        finally:
+            process.stdin.close()
+
+    threads = [
+        threading.Thread(target=feed),
+        threading.Thread(target=_pump, args=(process.stdout, channel.sendall)),
+        threading.Thread(target=_pump, args=(process.stderr, channel.sendall_stderr)),
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    threads[1].join()
+    threads[2].join()
+    channel.send_exit_status(process.wait())
+    channel.shutdown_write()
+    channel.close()
+
+
+class SSHServer(object):
+    """
+    SSH server on a random port of 127.0.0.1 run from background threads
+    """
+
+    def __init__(self, host_key, root=None):
+        """
+        Constructor for :class:`SSHServer`
+
+        :param host_key: the server's host key
+        :type host_key: :class:`paramiko.PKey`
+        :param root: optional directory to move /tmp/ paths under
+        :type root: str
+        """
+        self.host_key = host_key
+        self.root = root
+        if root is not None and not os.path.isdir(os.path.join(root, "tmp")):
+            os.makedirs(os.path.join(root, "tmp"))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(128)
+        self.port = self.sock.getsockname()[1]
+        self.transports = []
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    @property
+    def host(self):
+        """
+        The "<address>:<port>" of this server, as used by employ's managers
+
+        :returns: str
+        """
+        return "127.0.0.1:%s" % self.port
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _SFTPServer, self.root)
+            transport.start_server(event=threading.Event(), server=_ServerInterface(self.root))
+            self.transports.append(transport)
+
+    def close(self):
+        """
+        Stop accepting connections and close all open connections
+        """
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
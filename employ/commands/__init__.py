@@ -1,25 +1,138 @@
+import copy
 from pkgutil import extend_path
 __path__ = extend_path(__path__, __name__)
 
+from employ.exceptions import EmployError
+
 
 class Command(object):
     """
     Base Command class that all command plugins must inherit from.
     """
     name = "command"
+    # name of the setting which can be a schedule, see :func:`stages`
+    schedule = None
+    # the config section this command was created from
+    section = None
+    # the share of instances to run on, see :func:`from_config`
+    instances = None
+    _results = None
+
+    def stages(self):
+        """
+        Method to get the commands to run one after another for this command.
+
+        When the setting named by `schedule` is a schedule of values,
+        see :func:`parse_schedule`, there is one stage per value with
+        that setting, otherwise there is a single stage, this command.
+
+        :returns: list - [:class:`employ.commands.Command`, ...]
+        """
+        if self.schedule is None:
+            return [self]
+        stages = []
+        for value in parse_schedule(getattr(self, self.schedule)):
+            stage = copy.copy(self)
+            setattr(stage, self.schedule, value)
+            stages.append(stage)
+        return stages
+
+    def begin(self):
+        """
+        Method called before results are passed to :func:`add`.
+
+        By default results are kept until :func:`finish` passes them all
+        to :func:`aggregate`, override :func:`begin`, :func:`add` and
+        :func:`finish` together to combine results as they arrive instead.
+        """
+        self._results = []
+
+    def add(self, result):
+        """
+        Method called with the result of running :func:`command` on each
+        instance as soon as it finishes.
+
+        :param result: the result from a single instance
+        :type result: :class:`employ.result.Result`
+        """
+        self._results.append(result)
+
+    def finish(self):
+        """
+        Method called after all results were passed to :func:`add`.
+
+        :returns: the combined results
+        """
+        results, self._results = self._results, None
+        return self.aggregate(results)
 
     def aggregate(self, results):
         """
         Method to join together the results of running :func:`command`
 
-        Method which must be overridden by child class.
+        Method which must be overridden by child class, unless
+        :func:`begin`, :func:`add` and :func:`finish` are.
 
-        :param results: list of (status, stdout, stderr) for each
-            result of running :func:`command`
-        :type results: list
+        :param results: the result of running :func:`command` on each instance,
+            these can also be unpacked as (status, stdout, stderr) tuples
+        :type results: list - [:class:`employ.result.Result`, ...]
         """
         raise NotImplementedError()
 
+    def parse(self, result):
+        """
+        Parse the stdout of a single instance with :func:`_parse_result`
+
+        The output is only parsed once, the parsed output is kept on
+        `result` so :func:`add` and :func:`metrics` can both use it.
+
+        :param result: the result from a single instance
+        :type result: :class:`employ.result.Result`
+        :returns: the parsed output, do not modify it
+        """
+        if result.parsed is None:
+            result.parsed = self._parse_result(result.stdout)
+        return result.parsed
+
+    def _parse_result(self, stdout):
+        """
+        Method to parse the stdout of a single instance for :func:`parse`
+
+        Method which must be overridden by child classes which use :func:`parse`.
+
+        :param stdout: the stdout of running :func:`command`
+        :type stdout: str
+        """
+        raise NotImplementedError()
+
+    def metrics(self, result):
+        """
+        Method to parse the numbers from the result of a single instance
+        for :mod:`employ.sinks` to write.
+
+        Returns no metrics by default, override to return the metrics
+        worth analyzing for each instance.
+
+        :param result: the result from a single instance
+        :type result: :class:`employ.result.Result`
+        :returns: dict - {name: int or float}
+        """
+        return {}
+
+    def output(self, stream, data):
+        """
+        Method called with each chunk of output as it is read from an instance.
+
+        Does nothing by default, override to process output while
+        the command is still running. This may be called concurrently
+        from multiple threads, one per instance.
+
+        :param stream: either "stdout" or "stderr"
+        :type stream: str
+        :param data: the chunk of output read
+        :type data: str
+        """
+
     def command(self):
         """
         Method to generate the command to run.
@@ -31,16 +144,91 @@ class Command(object):
         raise NotImplementedError()
 
     @classmethod
-    def from_config(cls, config):
+    def from_config(cls, config, section=None):
         """
         Helper classmethod to create an instance of :class:`employ.commands.Command`
         from the provided config.
 
+        Every command's section can set `instances` to a number or a
+        percentage, e.g. "30%", of instances to run the command on at the
+        same time as the other commands which set `instances`, see
+        :func:`employ.managers.Manager.partition_hosts`.
+
         :param config: the config to get the :class:`employ.commands.Command` instance
         :type config: :class:`ConfigParser.RawConfigParser`
+        :param section: the section to use, defaults to the command's name
+        :type section: str
         :returns: :class:`employ.commands.Command`
         """
+        section = section or cls.name
         settings = {}
-        if config.has_section(cls.name):
-            settings = dict(config.items(cls.name))
-        return cls(**settings)
+        if config.has_section(section):
+            settings = dict(config.items(section))
+        instances = settings.pop("instances", None)
+        command = cls(**settings)
+        command.section = section
+        command.instances = instances
+        return command
+
+
+def parse_schedule(value):
+    """
+    Helper function to parse a schedule of values for a setting
+
+    A schedule is a comma separated list of values and ramps, where the
+    ramp "<start>-<stop>:<step>" is every `step` from `start` up to `stop`,
+    e.g. "10,50,100-200:50" is [10, 50, 100, 150, 200]. A single value
+    is a schedule with one stage.
+
+    :param value: the schedule to parse
+    :type value: str
+    :returns: list - [int or float, ...]
+    :raises: :class:`employ.exceptions.EmployError`
+    """
+    values = []
+    for part in str(value).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                span, _, step = part.partition(":")
+                start, _, stop = span.partition("-")
+                start, stop, step = _number(start), _number(stop), _number(step or "1")
+                if step <= 0 or stop < start:
+                    raise ValueError()
+                count = int((stop - start) / step + 1e-9) + 1
+                values.extend(start + step * index for index in xrange(count))
+            else:
+                values.append(_number(part))
+        except ValueError:
+            raise EmployError("Invalid schedule: '%s'" % value)
+    if not values:
+        raise EmployError("Invalid schedule: '%s'" % value)
+    return values
+
+
+def percentile_metrics(percentiles):
+    """
+    Helper function to name latency percentiles as metrics,
+    see :func:`employ.commands.Command.metrics`
+
+    :param percentiles: the latency percentiles
+    :type percentiles: list - [(percent, ms), ...]
+    :returns: dict - e.g. {"latency_p50_ms": 1.2, "latency_p99_9_ms": 8.1}
+    """
+    return dict(
+        ("latency_p%s_ms" % ("%g" % percent).replace(".", "_"), ms)
+        for percent, ms in percentiles
+    )
+
+
+def _number(value):
+    """
+    Helper function to parse an int, or a float if it is not an int
+    """
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
@@ -1,6 +1,8 @@
 import re
 
-from employ.commands import Command
+from employ.commands import Command, percentile_metrics
+from employ.commands.histogram import mixture_cdf, mixture_quantile
+from employ.logger import logger
 
 
 class ABCommand(Command):
@@ -12,8 +14,14 @@ class ABCommand(Command):
       [ab]
       target=<target>
       requests=<requests>
-      concurrency=<concurrency>
+      concurrency=<concurrency or schedule>
       keepalive=(True|False)
+      timelimit=<seconds>
+
+    `concurrency` can be a schedule, "<value>,<value>,..." and/or
+    "<start>-<stop>:<step>" ramps, to run one stage per value one after
+    another, with `timelimit` each stage stops after `timelimit`
+    seconds or `requests` requests, whichever comes first.
 
     Example::
 
@@ -24,14 +32,23 @@ class ABCommand(Command):
       concurrency=100
       keepalive=False
 
+      ; or step from 50 to 400 concurrency for 30 seconds each
+      [ab]
+      target=http://127.0.0.1:8000/test.html
+      requests=1000000
+      concurrency=50-400:50
+      timelimit=30
+
     Running::
 
       employ <manager> run run_ab.ini
 
     """
     name = "ab"
+    schedule = "concurrency"
+    _combined = None
 
-    def __init__(self, target, requests, concurrency=1, keepalive=True):
+    def __init__(self, target, requests, concurrency=1, keepalive=True, timelimit=None):
         """
         Constructor for this command
 
@@ -43,11 +60,14 @@ class ABCommand(Command):
         :type concurrency: int
         :param keepalive: whether or not to enable keepalive
         :type keepalive: bool
+        :param timelimit: max seconds to spend on requests
+        :type timelimit: int
         """
         self.target = target
         self.requests = requests
         self.concurrency = concurrency
         self.keepalive = keepalive
+        self.timelimit = timelimit
 
     def command(self):
         """
@@ -56,7 +76,11 @@ class ABCommand(Command):
         :returns: str
         """
         keepalive = " -k" if self.keepalive else ""
-        return "ab -n %s -c %s%s %s" % (self.requests, self.concurrency, keepalive, self.target)
+        # -t must come before -n since it also sets the number of requests
+        timelimit = "-t %s " % self.timelimit if self.timelimit else ""
+        return "ab %s-n %s -c %s%s %s" % (
+            timelimit, self.requests, self.concurrency, keepalive, self.target
+        )
 
     def _parse_result(self, stdout):
         """
@@ -64,55 +88,304 @@ class ABCommand(Command):
 
         :param stdout: the stdout of the command
         :type stdout: str
-        :returns: tuple - (completed, failed, req_sec, time_req)
+        :returns: dict - with the keys "completed", "failed", "time_taken",
+            "requests_per_second", "time_per_request", "transfer_rate",
+            "connection_times" ({row: (min, mean, sd, median, max)})
+            and "percentiles" ([(percent, ms), ...])
         """
-        completed = 0
-        failed = 0
-        req_sec = 0
-        time_req = 0
+        stats = {
+            "completed": 0,
+            "failed": 0,
+            "time_taken": 0,
+            "requests_per_second": 0,
+            "time_per_request": 0,
+            "transfer_rate": 0,
+            "connection_times": {},
+            "percentiles": [],
+        }
+
+        match = re.search("Time taken for tests:\s+([0-9\.]+)", stdout)
+        if match and match.groups():
+            stats["time_taken"] = float(match.group(1))
 
         match = re.search("Complete requests:\s+([0-9]+)", stdout)
         if match and match.groups():
-            completed = int(match.group(1))
+            stats["completed"] = int(match.group(1))
 
         match = re.search("Failed requests:\s+([0-9]+)", stdout)
         if match and match.groups():
-            failed = int(match.group(1))
+            stats["failed"] = int(match.group(1))
 
         match = re.search("Requests per second:\s+([0-9\.]+)", stdout)
         if match and match.groups():
-            req_sec = float(match.group(1))
+            stats["requests_per_second"] = float(match.group(1))
 
         match = re.search("Time per request:\s+([0-9\.]+)", stdout)
         if match and match.groups():
-            time_req = float(match.group(1))
+            stats["time_per_request"] = float(match.group(1))
+
+        match = re.search("Transfer rate:\s+([0-9\.]+)", stdout)
+        if match and match.groups():
+            stats["transfer_rate"] = float(match.group(1))
 
-        return (completed, failed, req_sec, time_req)
+        for match in re.finditer(
+                "^(Connect|Processing|Waiting|Total):" + "\s+([0-9\.]+)" * 5,
+                stdout, re.MULTILINE
+        ):
+            stats["connection_times"][match.group(1)] = tuple(
+                float(value) for value in match.groups()[1:]
+            )
+
+        for match in re.finditer("^\s*([0-9]+)%\s+([0-9\.]+)", stdout, re.MULTILINE):
+            stats["percentiles"].append((int(match.group(1)), float(match.group(2))))
+
+        return stats
+
+    def metrics(self, result):
+        """
+        Parse the numbers from a single execution of `ab`
+
+        :param result: the result of running :func:`command`
+        :type result: :class:`employ.result.Result`
+        :returns: dict
+        """
+        stats = self.parse(result)
+        metrics = percentile_metrics(stats["percentiles"])
+        for key in (
+                "completed", "failed", "time_taken", "requests_per_second",
+                "time_per_request", "transfer_rate",
+        ):
+            metrics[key] = stats[key]
+        for row, times in stats["connection_times"].iteritems():
+            metrics["%s_mean_ms" % row.lower()] = times[1]
+        return metrics
 
     def aggregate(self, results):
         """
         The aggregate the results of multiple executions of `ab`
 
-        :param results: list of (status, stdout, stderr) from the
-            results of running :func:`command`
-        :type results: list
-        """
-        total_completed = 0
-        total_failed = 0
-        avg_req_sec = 0
-        avg_time_req = 0
-
-        for status, stdout, stderr in results:
-            completed, failed, req_sec, time_req = self._parse_result(stdout)
-            total_completed += completed
-            total_failed += failed
-            avg_req_sec += req_sec
-            avg_time_req += time_req
-
-        avg_req_sec = avg_req_sec / len(results)
-        avg_time_req = avg_time_req / len(results)
-        print "Results:"
-        print "  Total Completed Requests: %s" % total_completed
-        print "  Total Failed Requests: %s" % total_failed
-        print "  Average Requests per Second: %s" % avg_req_sec
-        print "  Average Time per Second: %s" % avg_time_req
+        :param results: the results of running :func:`command`
+        :type results: list - [:class:`employ.result.Result`, ...]
+        :returns: :class:`employ.commands.ab.ABResult`
+        """
+        self.begin()
+        for result in results:
+            self.add(result)
+        return self.finish()
+
+    def begin(self):
+        """
+        Start combining the results of multiple executions of `ab`
+        """
+        self._combined = ABResult()
+
+    def add(self, result):
+        """
+        Add the result of a single execution of `ab`, only the parsed
+        numbers are kept
+
+        :param result: the result of running :func:`command`
+        :type result: :class:`employ.result.Result`
+        """
+        self._combined.add(self.parse(result), result)
+        logger.info(
+            "provisional results from %s instances: %s completed, %.2f requests per second",
+            self._combined.hosts, self._combined.completed,
+            self._combined.requests_per_second,
+        )
+
+    def finish(self):
+        """
+        Print and return the combined results of all executions of `ab`
+
+        :returns: :class:`employ.commands.ab.ABResult`
+        """
+        combined, self._combined = self._combined, None
+        print combined
+        return combined
+
+
+class ABResult(object):
+    """
+    Results of `ab` combined across instances.
+
+    Throughput is summed across instances, mean latency is weighted by the
+    number of completed requests on each instance and the percentiles
+    are those of the combined latency distribution of all instances.
+
+    Summing throughput assumes every instance sent load at the same time,
+    `wall_requests_per_second` instead divides all completed requests by
+    the time from the first instance starting to send load until the
+    last one finished, so it drops when instances start out of step.
+    """
+    # the percentiles reported by `ab`
+    levels = (50, 66, 75, 80, 90, 95, 98, 99, 100)
+
+    def __init__(self):
+        """
+        Constructor for :class:`employ.commands.ab.ABResult`
+        """
+        self.hosts = 0
+        self.completed = 0
+        self.failed = 0
+        self.requests_per_second = 0.0
+        self.transfer_rate = 0.0
+        self.slowest = None
+        self._latency = 0.0
+        self._first = None
+        self._last = None
+        self._times = {}
+        self._tables = []
+        self.host_requests_per_second = []
+
+    def add(self, stats, result=None):
+        """
+        Add the results of running `ab` on a single instance.
+
+        :param stats: the parsed results of running `ab`
+        :type stats: dict
+        :param result: the result `stats` were parsed from
+        :type result: :class:`employ.result.Result`
+        """
+        completed = stats["completed"]
+        if result is not None:
+            # ab only sends load at the end of the command's run time
+            first = result.end - stats["time_taken"]
+            self._first = first if self._first is None else min(self._first, first)
+            self._last = result.end if self._last is None else max(self._last, result.end)
+            if self.slowest is None or result.duration > self.slowest.duration:
+                self.slowest = result
+        self.hosts += 1
+        self.completed += completed
+        self.failed += stats["failed"]
+        self.requests_per_second += stats["requests_per_second"]
+        self.host_requests_per_second.append(stats["requests_per_second"])
+        self.transfer_rate += stats["transfer_rate"]
+        self._latency += stats["time_per_request"] * completed
+
+        for row, (low, mean, sd, median, high) in stats["connection_times"].iteritems():
+            times = self._times.setdefault(row, [low, high, 0, 0.0, 0.0])
+            times[0] = min(times[0], low)
+            times[1] = max(times[1], high)
+            times[2] += completed
+            times[3] += mean * completed
+            times[4] += (sd ** 2 + mean ** 2) * completed
+
+        if completed and stats["percentiles"]:
+            # anchor each distribution at its fastest request
+            low = stats["connection_times"].get("Total", (0, ))[0]
+            points = [(low, 0.0)] + [
+                (value, percent / 100.0) for percent, value in stats["percentiles"]
+            ]
+            self._tables.append((completed, points))
+
+    @property
+    def time_per_request(self):
+        """
+        Mean time per request in ms, weighted by completed requests.
+
+        :returns: float
+        """
+        if not self.completed:
+            return 0.0
+        return self._latency / self.completed
+
+    @property
+    def wall_requests_per_second(self):
+        """
+        Completed requests per second from the first instance starting
+        to send load until the last one finished.
+
+        :returns: float
+        """
+        if self._first is None or self._last <= self._first:
+            return self.requests_per_second
+        return self.completed / (self._last - self._first)
+
+    @property
+    def connection_times(self):
+        """
+        Combined connection times in ms.
+
+        :returns: dict - {row: {"min", "mean", "sd", "max"}}
+        """
+        connection_times = {}
+        for row, (low, high, weight, total, squares) in self._times.iteritems():
+            mean = total / weight if weight else 0.0
+            variance = squares / weight - mean ** 2 if weight else 0.0
+            connection_times[row] = {
+                "min": low,
+                "mean": mean,
+                "sd": max(variance, 0.0) ** 0.5,
+                "max": high,
+            }
+        return connection_times
+
+    @property
+    def percentiles(self):
+        """
+        Percentiles in ms of the combined latency distribution.
+
+        Each instance's distribution is interpolated between the
+        percentiles `ab` reports for it.
+
+        :returns: list - [(percent, ms), ...]
+        """
+        if not self._tables:
+            return []
+        return [(level, mixture_quantile(self._tables, level / 100.0)) for level in self.levels]
+
+    def to_dict(self):
+        """
+        Export the combined results, see :class:`employ.store.ResultStore`
+
+        :returns: dict - with the keys "hosts", "requests", "failed",
+            "requests_per_second", "wall_requests_per_second", "transfer_rate",
+            "time_per_request", "connection_times", "percentiles" ([[percent, ms], ...]),
+            "latency_cdf" ([[ms, fraction], ...]) and "host_requests_per_second"
+        """
+        return {
+            "hosts": self.hosts,
+            "requests": self.completed,
+            "failed": self.failed,
+            "requests_per_second": self.requests_per_second,
+            "wall_requests_per_second": self.wall_requests_per_second,
+            "transfer_rate": self.transfer_rate,
+            "time_per_request": self.time_per_request,
+            "connection_times": self.connection_times,
+            "percentiles": [list(point) for point in self.percentiles],
+            "latency_cdf": [list(point) for point in mixture_cdf(self._tables)],
+            "host_requests_per_second": list(self.host_requests_per_second),
+        }
+
+    def __str__(self):
+        lines = [
+            "Results:",
+            "  Total Completed Requests: %s" % self.completed,
+            "  Total Failed Requests: %s" % self.failed,
+            "  Total Requests per Second: %.2f" % self.requests_per_second,
+            "  Wall Clock Requests per Second: %.2f" % self.wall_requests_per_second,
+            "  Mean Time per Request: %.3f [ms]" % self.time_per_request,
+            "  Total Transfer Rate: %.2f [Kbytes/sec]" % self.transfer_rate,
+        ]
+        if self.slowest is not None:
+            lines.append("  Slowest Instance: %s (%.2f seconds)" % (
+                self.slowest.host, self.slowest.duration
+            ))
+        connection_times = self.connection_times
+        if connection_times:
+            lines.append("  Connection Times (ms):")
+            lines.append("    %-12s %8s %8s %8s %8s" % ("", "min", "mean", "sd", "max"))
+            for row in ("Connect", "Processing", "Waiting", "Total"):
+                if row in connection_times:
+                    times = connection_times[row]
+                    lines.append("    %-12s %8.0f %8.1f %8.1f %8.0f" % (
+                        row + ":", times["min"], times["mean"], times["sd"], times["max"]
+                    ))
+        percentiles = self.percentiles
+        if percentiles:
+            lines.append("  Percentage of the requests served within a certain time (ms):")
+            for percent, value in percentiles:
+                lines.append("    %3s%% %8.1f" % (percent, value))
+        return "\n".join(lines)
+
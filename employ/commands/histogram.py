@@ -0,0 +1,285 @@
+import array
+import base64
+import zlib
+
+
+class Histogram(object):
+    """
+    Mergeable histogram of non-negative integer values, e.g. latencies in
+    microseconds, for combining distributions from many instances.
+
+    Buckets are log-linear, like HdrHistogram: values below
+    2 ** `precision` each get their own bucket and larger values are
+    grouped into buckets no wider than 2 ** -(`precision` - 1) of their
+    value. Counts are kept in an array, so merging two histograms costs
+    one addition per bucket no matter how many values were recorded.
+
+    Commands running on instances can print :func:`encode` prefixed by
+    `marker` on a line of their output, to be read back by
+    :func:`from_output` when aggregating::
+
+      histogram = Histogram()
+      for result in results:
+          histogram.merge(Histogram.from_output(result.stdout))
+      histogram.percentile(99.9)
+
+    """
+    marker = "employ-histogram:"
+
+    def __init__(self, precision=8):
+        """
+        Constructor for :class:`employ.commands.histogram.Histogram`
+
+        :param precision: number of bits of each value to keep
+        :type precision: int
+        """
+        self.precision = int(precision)
+        self.counts = array.array("L")
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        """
+        Helper method to get the index of the bucket for `value`
+        """
+        if value < 1 << self.precision:
+            return value
+        shift = value.bit_length() - self.precision
+        half = 1 << (self.precision - 1)
+        return (1 << self.precision) + (shift - 1) * half + (value >> shift) - half
+
+    def _range(self, index):
+        """
+        Helper method to get the lowest and highest value in the bucket at `index`
+        """
+        if index < 1 << self.precision:
+            return (index, index)
+        half = 1 << (self.precision - 1)
+        shift, offset = divmod(index - (1 << self.precision), half)
+        shift += 1
+        low = (half + offset) << shift
+        return (low, low + (1 << shift) - 1)
+
+    def _grow(self, size):
+        """
+        Helper method to make sure there are at least `size` buckets
+        """
+        if len(self.counts) < size:
+            self.counts.extend([0] * (size - len(self.counts)))
+
+    def record(self, value, count=1):
+        """
+        Record `value` `count` times.
+
+        :param value: the value to record
+        :type value: int
+        :param count: the number of times to record `value`
+        :type count: int
+        """
+        value = int(value)
+        if value < 0:
+            raise ValueError("Histogram values must be non-negative: %s" % value)
+        index = self._index(value)
+        self._grow(index + 1)
+        self.counts[index] += count
+        self.total += count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """
+        Add all values recorded in `other` to this histogram.
+
+        :param other: the histogram to merge, ignored if None
+        :type other: :class:`employ.commands.histogram.Histogram`
+        :returns: :class:`employ.commands.histogram.Histogram` - this histogram
+        """
+        if other is None or not other.total:
+            return self
+        if other.precision != self.precision:
+            raise ValueError(
+                "Cannot merge histograms with precision %s and %s" % (
+                    self.precision, other.precision
+                )
+            )
+        self._grow(len(other.counts))
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def percentile(self, percent):
+        """
+        Get the value below which `percent` of the recorded values fall.
+
+        :param percent: the percentile to get, 0 - 100
+        :type percent: float
+        :returns: int - the highest value of the matching bucket,
+            or None if nothing was recorded
+        """
+        if not self.total:
+            return None
+        target = max(1, self.total * percent / 100.0)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._range(index)[1], self.max)
+        return self.max
+
+    def mean(self):
+        """
+        Get the mean of the recorded values, using the middle of each bucket.
+
+        :returns: float
+        """
+        if not self.total:
+            return 0.0
+        total = 0.0
+        for index, count in enumerate(self.counts):
+            if count:
+                low, high = self._range(index)
+                total += count * (low + high) / 2.0
+        return total / self.total
+
+    def cdf(self):
+        """
+        Get the cumulative distribution of the recorded values.
+
+        :returns: list - [(highest bucket value, fraction of values <= it), ...]
+            for every non-empty bucket
+        """
+        points = []
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                seen += count
+                points.append((self._range(index)[1], seen / float(self.total)))
+        return points
+
+    def encode(self):
+        """
+        Encode this histogram as a compact single line string.
+
+        :returns: str
+        """
+        buckets = ",".join(
+            "%x:%x" % (index, count) for index, count in enumerate(self.counts) if count
+        )
+        data = "%s;%s;%s;%s" % (self.precision, self.min or 0, self.max or 0, buckets)
+        return base64.b64encode(zlib.compress(data))
+
+    @classmethod
+    def decode(cls, data):
+        """
+        Create a histogram from the output of :func:`encode`.
+
+        :param data: the encoded histogram
+        :type data: str
+        :returns: :class:`employ.commands.histogram.Histogram`
+        """
+        precision, low, high, buckets = zlib.decompress(base64.b64decode(data)).split(";")
+        histogram = cls(precision=int(precision))
+        for bucket in buckets.split(","):
+            if not bucket:
+                continue
+            index, count = bucket.split(":")
+            index, count = int(index, 16), int(count, 16)
+            histogram._grow(index + 1)
+            histogram.counts[index] = count
+            histogram.total += count
+        if histogram.total:
+            histogram.min = int(low)
+            histogram.max = int(high)
+        return histogram
+
+    @classmethod
+    def from_output(cls, output):
+        """
+        Merge all histograms printed in `output` on lines starting with `marker`.
+
+        :param output: the output of a command
+        :type output: str
+        :returns: :class:`employ.commands.histogram.Histogram` - or None if
+            `output` contains no histograms
+        """
+        histogram = None
+        for line in output.splitlines():
+            line = line.strip()
+            if line.startswith(cls.marker):
+                decoded = cls.decode(line[len(cls.marker):].strip())
+                histogram = decoded if histogram is None else histogram.merge(decoded)
+        return histogram
+
+
+def _cdf(points, value):
+    """
+    Helper function to get the cumulative fraction of requests at `value`
+    from a list of (value, fraction) points by linear interpolation
+    """
+    if value < points[0][0]:
+        return 0.0
+    for (low, low_fraction), (high, high_fraction) in zip(points, points[1:]):
+        if value < high:
+            if high == low:
+                return high_fraction
+            return low_fraction + (high_fraction - low_fraction) * (value - low) / (high - low)
+    return 1.0
+
+
+def mixture_quantile(tables, fraction):
+    """
+    Get the value at `fraction` of the combined distribution of several
+    distributions which are only known by a few of their percentiles,
+    such as the percentile tables printed by `ab` or `wrk`.
+
+    Each distribution is linearly interpolated between its known points.
+
+    :param tables: [(weight, [(value, fraction), ...]), ...] where weight
+        is usually the number of requests and points are sorted by value
+    :type tables: list
+    :param fraction: the fraction to get the value of, 0 - 1
+    :type fraction: float
+    :returns: float
+    """
+    total = float(sum(weight for weight, points in tables))
+    values = sorted(set(value for weight, points in tables for value, _ in points))
+    previous_value, previous_fraction = values[0], 0.0
+    for value in values:
+        current = sum(weight * _cdf(points, value) for weight, points in tables) / total
+        if current >= fraction:
+            if current == previous_fraction:
+                return value
+            return previous_value + (value - previous_value) * (
+                (fraction - previous_fraction) / (current - previous_fraction)
+            )
+        previous_value, previous_fraction = value, current
+    return values[-1]
+
+
+def mixture_cdf(tables, values=None):
+    """
+    Get the combined cumulative distribution of several distributions
+    which are only known by a few of their points, see :func:`mixture_quantile`
+
+    :param tables: [(weight, [(value, fraction), ...]), ...]
+    :type tables: list
+    :param values: the values to get the cumulative fraction at,
+        defaults to every value known for any distribution
+    :type values: list
+    :returns: list - [(value, fraction of the combined distribution <= value), ...]
+    """
+    total = float(sum(weight for weight, points in tables))
+    if values is None:
+        values = sorted(set(value for weight, points in tables for value, _ in points))
+    if not total:
+        return [(value, 0.0) for value in values]
+    return [
+        (value, sum(weight * _cdf(points, value) for weight, points in tables if points) / total)
+        for value in values
+    ]
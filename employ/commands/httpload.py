@@ -0,0 +1,296 @@
+import os
+import re
+from pipes import quote
+
+from employ.commands import Command, percentile_metrics
+from employ.commands.histogram import Histogram
+from employ.logger import logger
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts", "httpload.py")
+
+
+class HTTPLoadCommand(Command):
+    """
+    :class:`employ.commands.Command` used to run employ's built in HTTP load generator
+
+    The load generator is a Python 3 asyncio script which is sent along
+    with the command, instances only need `python3` (3.5+) installed.
+
+    Requests are sent at a fixed `rate` per instance no matter how fast
+    the target responds, spread over `connections` keepalive connections
+    and `processes` processes on each instance, at most one process per
+    connection. Latency is measured from when each request was scheduled
+    to be sent, so it includes any time spent waiting for a free connection.
+
+    Command Settings::
+
+      [httpload]
+      target=<target>
+      rate=<requests per second per instance, or schedule>
+      duration=<seconds>
+      connections=<connections per instance>
+      processes=<processes per instance, 0 for one per cpu>
+      timeout=<request timeout seconds>
+      python=<python executable>
+
+    `rate` can be a schedule, "<value>,<value>,..." and/or
+    "<start>-<stop>:<step>" ramps, to run one stage per value one after
+    another, each for `duration` seconds.
+
+    Example::
+
+      ; run_httpload.ini
+      [httpload]
+      target=http://127.0.0.1:8000/test.html
+      rate=2000
+      duration=30
+      connections=200
+      processes=0
+      timeout=10
+      python=python3
+
+    Running::
+
+      employ <manager> run run_httpload.ini
+
+    """
+    name = "httpload"
+    schedule = "rate"
+    _combined = None
+
+    def __init__(
+            self, target, rate=100, duration=10, connections=10,
+            processes=0, timeout=10, python="python3"
+    ):
+        """
+        Constructor for this command
+
+        :param target: the http[s]://<domain>:<port>/<path> to send requests to
+        :type target: str
+        :param rate: requests per second to send from each instance
+        :type rate: float
+        :param duration: seconds to send requests for
+        :type duration: float
+        :param connections: number of keepalive connections on each instance
+        :type connections: int
+        :param processes: number of processes on each instance, 0 for one per cpu
+        :type processes: int
+        :param timeout: seconds to wait for each response
+        :type timeout: float
+        :param python: the python 3 executable on each instance
+        :type python: str
+        """
+        self.target = target
+        self.rate = rate
+        self.duration = duration
+        self.connections = connections
+        self.processes = processes
+        self.timeout = timeout
+        self.python = python
+
+    def command(self):
+        """
+        Generate the command to run the load generator
+
+        :returns: str
+        """
+        with open(SCRIPT, "r") as fp:
+            script = fp.read()
+        args = "--url %s --rate %s --duration %s --connections %s --processes %s --timeout %s" % (
+            quote(self.target), float(self.rate), float(self.duration),
+            int(self.connections), int(self.processes), float(self.timeout),
+        )
+        # the script is passed on stdin so nothing needs to be uploaded
+        return "%s - %s <<'EMPLOY_HTTPLOAD'\n%s\nEMPLOY_HTTPLOAD" % (
+            quote(self.python), args, script
+        )
+
+    def _parse_result(self, stdout):
+        """
+        Internal method used to parse the output of the load generator
+
+        :param stdout: the stdout of the command
+        :type stdout: str
+        :returns: dict - with the keys "requests", "errors", "bytes", "elapsed",
+            "requests_per_second", "statuses" ({status: count}) and "histogram"
+        """
+        stats = {
+            "requests": 0,
+            "errors": 0,
+            "bytes": 0,
+            "elapsed": 0.0,
+            "requests_per_second": 0.0,
+            "statuses": {},
+            "histogram": Histogram.from_output(stdout),
+        }
+        for key, value in re.findall("^(requests|errors|bytes):\\s+([0-9]+)", stdout, re.MULTILINE):
+            stats[key] = int(value)
+        for key, value in re.findall(
+                "^(elapsed|requests_per_second):\\s+([0-9\\.]+)", stdout, re.MULTILINE
+        ):
+            stats[key] = float(value)
+        for status, count in re.findall("^status_([0-9]+):\\s+([0-9]+)", stdout, re.MULTILINE):
+            stats["statuses"][int(status)] = int(count)
+        return stats
+
+    def metrics(self, result):
+        """
+        Parse the numbers from a single execution of the load generator
+
+        :param result: the result of running :func:`command`
+        :type result: :class:`employ.result.Result`
+        :returns: dict
+        """
+        stats = self.parse(result)
+        histogram = stats["histogram"]
+        metrics = dict(
+            ("status_%s" % status, count) for status, count in stats["statuses"].iteritems()
+        )
+        metrics.update(
+            (key, value) for key, value in stats.iteritems() if key not in ("histogram", "statuses")
+        )
+        # no histogram is printed when the load generator did not run
+        if histogram is not None and histogram.total:
+            metrics["latency_mean_ms"] = histogram.mean() / 1000.0
+            metrics.update(percentile_metrics(
+                (level, histogram.percentile(level) / 1000.0) for level in HTTPLoadResult.levels
+            ))
+        return metrics
+
+    def aggregate(self, results):
+        """
+        Aggregate the results of multiple executions of the load generator
+
+        :param results: the results of running :func:`command`
+        :type results: list - [:class:`employ.result.Result`, ...]
+        :returns: :class:`employ.commands.httpload.HTTPLoadResult`
+        """
+        self.begin()
+        for result in results:
+            self.add(result)
+        return self.finish()
+
+    def begin(self):
+        """
+        Start combining the results of multiple executions of the load generator
+        """
+        self._combined = HTTPLoadResult()
+
+    def add(self, result):
+        """
+        Add the result of a single execution of the load generator
+
+        :param result: the result of running :func:`command`
+        :type result: :class:`employ.result.Result`
+        """
+        self._combined.add(self.parse(result))
+        logger.info(
+            "provisional results from %s instances: %s requests, %.2f requests per second",
+            self._combined.hosts, self._combined.requests,
+            self._combined.requests_per_second,
+        )
+
+    def finish(self):
+        """
+        Print and return the combined results of all executions of the load generator
+
+        :returns: :class:`employ.commands.httpload.HTTPLoadResult`
+        """
+        combined, self._combined = self._combined, None
+        print combined
+        return combined
+
+
+class HTTPLoadResult(object):
+    """
+    Results of the load generator combined across instances.
+
+    Throughput is summed across instances and latencies are merged
+    into a single :class:`employ.commands.histogram.Histogram`.
+    """
+    # the percentiles to report
+    levels = (50, 75, 90, 99, 99.9, 99.99, 100)
+
+    def __init__(self):
+        """
+        Constructor for :class:`employ.commands.httpload.HTTPLoadResult`
+        """
+        self.hosts = 0
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.requests_per_second = 0.0
+        self.statuses = {}
+        self.histogram = Histogram()
+        self.host_requests_per_second = []
+
+    def add(self, stats):
+        """
+        Add the results of running the load generator on a single instance.
+
+        :param stats: the parsed results of running the load generator
+        :type stats: dict
+        """
+        self.hosts += 1
+        self.requests += stats["requests"]
+        self.errors += stats["errors"]
+        self.bytes += stats["bytes"]
+        self.requests_per_second += stats["requests_per_second"]
+        self.host_requests_per_second.append(stats["requests_per_second"])
+        for status, count in stats["statuses"].iteritems():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        self.histogram.merge(stats["histogram"])
+
+    @property
+    def percentiles(self):
+        """
+        Latency percentiles in ms across all instances.
+
+        :returns: list - [(percent, ms), ...]
+        """
+        if not self.histogram.total:
+            return []
+        return [(level, self.histogram.percentile(level) / 1000.0) for level in self.levels]
+
+    def to_dict(self):
+        """
+        Export the combined results, see :class:`employ.store.ResultStore`
+
+        :returns: dict - with the keys "hosts", "requests", "errors", "bytes",
+            "requests_per_second", "statuses", "mean_latency" (ms), "percentiles"
+            ([[percent, ms], ...]), "latency_cdf" ([[ms, fraction], ...])
+            and "host_requests_per_second"
+        """
+        return {
+            "hosts": self.hosts,
+            "requests": self.requests,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "requests_per_second": self.requests_per_second,
+            "statuses": dict((str(status), count) for status, count in self.statuses.iteritems()),
+            "mean_latency": self.histogram.mean() / 1000.0,
+            "percentiles": [list(point) for point in self.percentiles],
+            "latency_cdf": [
+                [value / 1000.0, fraction] for value, fraction in self.histogram.cdf()
+            ],
+            "host_requests_per_second": list(self.host_requests_per_second),
+        }
+
+    def __str__(self):
+        lines = [
+            "Results:",
+            "  Total Requests: %s" % self.requests,
+            "  Total Errors: %s" % self.errors,
+            "  Total Requests per Second: %.2f" % self.requests_per_second,
+            "  Mean Latency: %.3f [ms]" % (self.histogram.mean() / 1000.0),
+        ]
+        if self.statuses:
+            lines.append("  Status Codes:")
+            for status, count in sorted(self.statuses.iteritems()):
+                lines.append("    %s: %s" % (status, count))
+        percentiles = self.percentiles
+        if percentiles:
+            lines.append("  Latency Distribution (ms):")
+            for percent, value in percentiles:
+                lines.append("    %7s%% %10.3f" % (percent, value))
+        return "\n".join(lines)
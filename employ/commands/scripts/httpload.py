@@ -0,0 +1,279 @@
+"""
+Self-contained HTTP/1.1 load generator run on instances by
+:class:`employ.commands.httpload.HTTPLoadCommand`.
+
+Requires Python 3.5+ and nothing outside of the standard library.
+
+Requests are scheduled at a fixed rate no matter how fast responses
+arrive (an open model) and latency is measured from when each request
+was scheduled to be sent, so time spent waiting for a free connection
+is included instead of hidden (coordinated omission).
+
+Latencies are recorded in microseconds into a histogram using the same
+buckets and encoding as :class:`employ.commands.histogram.Histogram`,
+printed on a line starting with "employ-histogram:".
+"""
+import argparse
+import asyncio
+import base64
+import multiprocessing
+import os
+import ssl
+import time
+import zlib
+from urllib.parse import urlsplit
+
+
+class Histogram(object):
+    """
+    Log-linear histogram, see :class:`employ.commands.histogram.Histogram`
+    """
+    def __init__(self, precision):
+        self.precision = precision
+        self.counts = []
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        value = max(int(value), 0)
+        if value < 1 << self.precision:
+            index = value
+        else:
+            shift = value.bit_length() - self.precision
+            half = 1 << (self.precision - 1)
+            index = (1 << self.precision) + (shift - 1) * half + (value >> shift) - half
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def encode(self):
+        buckets = ",".join(
+            "%x:%x" % (index, count) for index, count in enumerate(self.counts) if count
+        )
+        data = "%s;%s;%s;%s" % (self.precision, self.min or 0, self.max or 0, buckets)
+        return base64.b64encode(zlib.compress(data.encode())).decode()
+
+
+class Stats(object):
+    def __init__(self, precision):
+        self.histogram = Histogram(precision)
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.statuses = {}
+
+    def merge(self, other):
+        self.histogram.merge(other.histogram)
+        self.requests += other.requests
+        self.errors += other.errors
+        self.bytes += other.bytes
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+
+
+class Connection(object):
+    """
+    A single keepalive HTTP/1.1 connection
+    """
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        path = url.path or "/"
+        if url.query:
+            path += "?" + url.query
+        self.request = (
+            "GET %s HTTP/1.1\r\n"
+            "Host: %s\r\n"
+            "User-Agent: employ-httpload\r\n"
+            "Connection: keep-alive\r\n\r\n" % (path, url.netloc)
+        ).encode()
+
+    async def connect(self):
+        context = None
+        if self.url.scheme == "https":
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        port = self.url.port or (443 if self.url.scheme == "https" else 80)
+        self.reader, self.writer = await asyncio.open_connection(
+            self.url.hostname, port, ssl=context
+        )
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def send(self):
+        """
+        Send a request, returning (status, response size)
+
+        A request on a reused connection which the server already closed
+        is retried once on a new connection.
+        """
+        if self.writer:
+            try:
+                return await self._send()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.close()
+        await self.connect()
+        return await self._send()
+
+    async def _send(self):
+        self.writer.write(self.request)
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        version, status = lines[0].split(" ", 2)[:2]
+        status = int(status)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip().lower()
+
+        size = len(head)
+        if headers.get("transfer-encoding") == "chunked":
+            while True:
+                line = await self.reader.readuntil(b"\r\n")
+                length = int(line.split(b";")[0], 16)
+                size += len(line) + length + 2
+                await self.reader.readexactly(length + 2)
+                if not length:
+                    break
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            await self.reader.readexactly(length)
+            size += length
+        else:
+            body = await self.reader.read()
+            size += len(body)
+            headers["connection"] = "close"
+
+        if version == "HTTP/1.0" and headers.get("connection") != "keep-alive":
+            headers["connection"] = "close"
+        if headers.get("connection") == "close":
+            self.close()
+        return status, size
+
+
+async def worker(url, timeout, queue, stats):
+    connection = Connection(url, timeout)
+    while True:
+        scheduled = await queue.get()
+        if scheduled is None:
+            queue.task_done()
+            break
+        try:
+            status, size = await asyncio.wait_for(connection.send(), timeout)
+        except Exception:
+            stats.errors += 1
+            connection.close()
+        else:
+            # latency from when the request should have been sent
+            stats.histogram.record((time.monotonic() - scheduled) * 1000000)
+            stats.requests += 1
+            stats.bytes += size
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        queue.task_done()
+    connection.close()
+
+
+async def generate(url, rate, duration, connections, timeout, precision):
+    stats = Stats(precision)
+    queue = asyncio.Queue()
+    start = time.monotonic()
+    workers = [
+        asyncio.ensure_future(worker(url, timeout, queue, stats))
+        for _ in range(connections)
+    ]
+    interval = 1.0 / rate
+    sent = 0
+    while True:
+        scheduled = start + sent * interval
+        if scheduled - start >= duration:
+            break
+        delay = scheduled - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        queue.put_nowait(scheduled)
+        sent += 1
+    for _ in workers:
+        queue.put_nowait(None)
+    await asyncio.gather(*workers)
+    return stats, time.monotonic() - start
+
+
+def run(args):
+    url, rate, duration, connections, timeout, precision = args
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(
+            generate(urlsplit(url), rate, duration, connections, timeout, precision)
+        )
+    finally:
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--rate", type=float, required=True)
+    parser.add_argument("--duration", type=float, required=True)
+    parser.add_argument("--connections", type=int, default=10)
+    parser.add_argument("--processes", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--precision", type=int, default=8)
+    args = parser.parse_args()
+
+    connections = max(1, args.connections)
+    # every process needs a connection of its own
+    processes = min(args.processes or os.cpu_count() or 1, connections)
+    # share out the connections so their total matches --connections,
+    # each process sends the share of the rate of its connections
+    work = []
+    for index in range(processes):
+        share = connections // processes + (1 if index < connections % processes else 0)
+        work.append((
+            args.url, args.rate * share / connections, args.duration, share,
+            args.timeout, args.precision
+        ))
+    if processes == 1:
+        results = [run(work[0])]
+    else:
+        with multiprocessing.get_context("fork").Pool(processes) as pool:
+            results = pool.map(run, work)
+
+    stats = Stats(args.precision)
+    elapsed = 0
+    for process_stats, process_elapsed in results:
+        stats.merge(process_stats)
+        elapsed = max(elapsed, process_elapsed)
+
+    print("processes: %s" % processes)
+    print("requests: %s" % stats.requests)
+    print("errors: %s" % stats.errors)
+    print("bytes: %s" % stats.bytes)
+    print("elapsed: %.6f" % elapsed)
+    print("requests_per_second: %.3f" % (stats.requests / elapsed if elapsed else 0))
+    for status, count in sorted(stats.statuses.items()):
+        print("status_%s: %s" % (status, count))
+    print("employ-histogram: %s" % stats.histogram.encode())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+import re
+from pipes import quote
+
+from employ.commands import Command, percentile_metrics
+from employ.commands.histogram import mixture_cdf, mixture_quantile
+from employ.logger import logger
+
+# multipliers to convert wrk's units to ms and bytes
+TIME_UNITS = {"us": 0.001, "ms": 1.0, "s": 1000.0, "m": 60000.0, "h": 3600000.0}
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+
+
+class WrkCommand(Command):
+    """
+    :class:`employ.commands.Command` used to run wrk
+
+    Command Settings::
+
+      [wrk]
+      target=<target>
+      threads=<threads>
+      connections=<connections or schedule>
+      duration=<duration>
+      timeout=<timeout>
+      script=<lua script on the instances>
+
+    `connections` can be a schedule, "<value>,<value>,..." and/or
+    "<start>-<stop>:<step>" ramps, to run one stage per value one after
+    another, each for `duration`.
+
+    Example::
+
+      ; run_wrk.ini
+      [wrk]
+      target=http://127.0.0.1:8000/test.html
+      threads=4
+      connections=400
+      duration=30s
+
+    Running::
+
+      employ <manager> run run_wrk.ini
+
+    """
+    name = "wrk"
+    schedule = "connections"
+    _combined = None
+
+    def __init__(self, target, threads=2, connections=10, duration="10s", timeout=None, script=None):
+        """
+        Constructor for this command
+
+        :param target: the http[s]://<domain>:<port>/<path> to run `wrk` against
+        :type target: str
+        :param threads: number of threads to use
+        :type threads: int
+        :param connections: number of connections to keep open
+        :type connections: int
+        :param duration: how long to run for, e.g. "30s", "2m"
+        :type duration: str
+        :param timeout: socket/request timeout, e.g. "2s"
+        :type timeout: str
+        :param script: the filename of a lua script on the instances to load
+        :type script: str
+        """
+        self.target = target
+        self.threads = threads
+        self.connections = connections
+        self.duration = duration
+        self.timeout = timeout
+        self.script = script
+
+    def command(self):
+        """
+        Generate the proper `wrk` command to execute
+
+        :returns: str
+        """
+        options = ""
+        if self.timeout:
+            options += " --timeout %s" % quote(str(self.timeout))
+        if self.script:
+            options += " -s %s" % quote(self.script)
+        return "wrk -t %s -c %s -d %s --latency%s %s" % (
+            self.threads, self.connections, quote(str(self.duration)), options, quote(self.target)
+        )
+
+    def _parse_result(self, stdout):
+        """
+        Internal method used to parse the results of running `wrk`
+
+        :param stdout: the stdout of the command
+        :type stdout: str
+        :returns: dict - with the keys "requests", "duration", "bytes",
+            "requests_per_second", "transfer_per_second" (bytes),
+            "latency" ((avg, stdev, max) in ms), "percentiles"
+            ([(percent, ms), ...]), "errors" ({kind: count}) and "non_2xx_3xx"
+        """
+        stats = {
+            "requests": 0,
+            "duration": 0.0,
+            "bytes": 0,
+            "requests_per_second": 0.0,
+            "transfer_per_second": 0.0,
+            "latency": None,
+            "percentiles": [],
+            "errors": {"connect": 0, "read": 0, "write": 0, "timeout": 0},
+            "non_2xx_3xx": 0,
+        }
+
+        time = "([0-9\\.]+)(us|ms|s|m|h)"
+        match = re.search("Latency\\s+%s\\s+%s\\s+%s" % (time, time, time), stdout)
+        if match:
+            values = match.groups()
+            stats["latency"] = tuple(
+                float(values[index]) * TIME_UNITS[values[index + 1]] for index in (0, 2, 4)
+            )
+
+        for percent, value, unit in re.findall(
+                "^\\s*([0-9\\.]+)%\\s+([0-9\\.]+)(us|ms|s|m|h)\\s*$", stdout, re.MULTILINE
+        ):
+            stats["percentiles"].append((float(percent), float(value) * TIME_UNITS[unit]))
+
+        match = re.search(
+            "([0-9]+) requests in ([0-9\\.]+)(us|ms|s|m|h), ([0-9\\.]+)(B|KB|MB|GB|TB) read",
+            stdout
+        )
+        if match:
+            stats["requests"] = int(match.group(1))
+            stats["duration"] = float(match.group(2)) * TIME_UNITS[match.group(3)] / 1000.0
+            stats["bytes"] = int(float(match.group(4)) * SIZE_UNITS[match.group(5)])
+
+        match = re.search(
+            "Socket errors: connect ([0-9]+), read ([0-9]+), write ([0-9]+), timeout ([0-9]+)",
+            stdout
+        )
+        if match:
+            for kind, count in zip(("connect", "read", "write", "timeout"), match.groups()):
+                stats["errors"][kind] = int(count)
+
+        match = re.search("Non-2xx or 3xx responses:\\s+([0-9]+)", stdout)
+        if match:
+            stats["non_2xx_3xx"] = int(match.group(1))
+
+        match = re.search("Requests/sec:\\s+([0-9\\.]+)", stdout)
+        if match:
+            stats["requests_per_second"] = float(match.group(1))
+
+        match = re.search("Transfer/sec:\\s+([0-9\\.]+)(B|KB|MB|GB|TB)", stdout)
+        if match:
+            stats["transfer_per_second"] = float(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+        return stats
+
+    def metrics(self, result):
+        """
+        Parse the numbers from a single execution of `wrk`
+
+        :param result: the result of running :func:`command`
+        :type result: :class:`employ.result.Result`
+        :returns: dict
+        """
+        stats = self.parse(result)
+        metrics = percentile_metrics(stats["percentiles"])
+        for key in (
+                "requests", "duration", "bytes", "requests_per_second",
+                "transfer_per_second", "non_2xx_3xx",
+        ):
+            metrics[key] = stats[key]
+        if stats["latency"]:
+            for name, value in zip(("mean", "stdev", "max"), stats["latency"]):
+                metrics["latency_%s_ms" % name] = value
+        for kind, count in stats["errors"].iteritems():
+            metrics["errors_%s" % kind] = count
+        return metrics
+
+    def aggregate(self, results):
+        """
+        Aggregate the results of multiple executions of `wrk`
+
+        :param results: the results of running :func:`command`
+        :type results: list - [:class:`employ.result.Result`, ...]
+        :returns: :class:`employ.commands.wrk.WrkResult`
+        """
+        self.begin()
+        for result in results:
+            self.add(result)
+        return self.finish()
+
+    def begin(self):
+        """
+        Start combining the results of multiple executions of `wrk`
+        """
+        self._combined = WrkResult()
+
+    def add(self, result):
+        """
+        Add the result of a single execution of `wrk`, only the parsed
+        numbers are kept
+
+        :param result: the result of running :func:`command`
+        :type result: :class:`employ.result.Result`
+        """
+        self._combined.add(self.parse(result))
+        logger.info(
+            "provisional results from %s instances: %s requests, %.2f requests per second",
+            self._combined.hosts, self._combined.requests,
+            self._combined.requests_per_second,
+        )
+
+    def finish(self):
+        """
+        Print and return the combined results of all executions of `wrk`
+
+        :returns: :class:`employ.commands.wrk.WrkResult`
+        """
+        combined, self._combined = self._combined, None
+        print combined
+        return combined
+
+
+class WrkResult(object):
+    """
+    Results of `wrk` combined across instances.
+
+    Throughput and errors are summed across instances, mean latency
+    is weighted by the number of requests on each instance and the
+    percentiles are those of the combined latency distribution.
+    """
+    # the percentiles reported by `wrk --latency`
+    levels = (50, 75, 90, 99, 100)
+
+    def __init__(self):
+        """
+        Constructor for :class:`employ.commands.wrk.WrkResult`
+        """
+        self.hosts = 0
+        self.requests = 0
+        self.bytes = 0
+        self.requests_per_second = 0.0
+        self.transfer_per_second = 0.0
+        self.errors = {"connect": 0, "read": 0, "write": 0, "timeout": 0}
+        self.non_2xx_3xx = 0
+        self.max_latency = 0.0
+        self._weight = 0
+        self._latency = 0.0
+        self._squares = 0.0
+        self._tables = []
+        self.host_requests_per_second = []
+
+    def add(self, stats):
+        """
+        Add the results of running `wrk` on a single instance.
+
+        :param stats: the parsed results of running `wrk`
+        :type stats: dict
+        """
+        requests = stats["requests"]
+        self.hosts += 1
+        self.requests += requests
+        self.bytes += stats["bytes"]
+        self.requests_per_second += stats["requests_per_second"]
+        self.host_requests_per_second.append(stats["requests_per_second"])
+        self.transfer_per_second += stats["transfer_per_second"]
+        self.non_2xx_3xx += stats["non_2xx_3xx"]
+        for kind, count in stats["errors"].iteritems():
+            self.errors[kind] += count
+
+        if stats["latency"] and requests:
+            mean, stdev, highest = stats["latency"]
+            self.max_latency = max(self.max_latency, highest)
+            self._weight += requests
+            self._latency += mean * requests
+            self._squares += (stdev ** 2 + mean ** 2) * requests
+            if stats["percentiles"]:
+                points = [(0.0, 0.0)] + [
+                    (value, percent / 100.0) for percent, value in stats["percentiles"]
+                ] + [(highest, 1.0)]
+                self._tables.append((requests, points))
+
+    @property
+    def latency(self):
+        """
+        Mean and standard deviation of latency in ms across all instances.
+
+        :returns: tuple - (mean, stdev)
+        """
+        if not self._weight:
+            return (0.0, 0.0)
+        mean = self._latency / self._weight
+        variance = self._squares / self._weight - mean ** 2
+        return (mean, max(variance, 0.0) ** 0.5)
+
+    @property
+    def percentiles(self):
+        """
+        Percentiles in ms of the combined latency distribution.
+
+        :returns: list - [(percent, ms), ...]
+        """
+        if not self._tables:
+            return []
+        return [(level, mixture_quantile(self._tables, level / 100.0)) for level in self.levels]
+
+    def to_dict(self):
+        """
+        Export the combined results, see :class:`employ.store.ResultStore`
+
+        :returns: dict - with the keys "hosts", "requests", "bytes",
+            "requests_per_second", "transfer_per_second", "errors", "non_2xx_3xx",
+            "latency" ([mean, stdev] in ms), "max_latency", "percentiles"
+            ([[percent, ms], ...]), "latency_cdf" ([[ms, fraction], ...])
+            and "host_requests_per_second"
+        """
+        return {
+            "hosts": self.hosts,
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "requests_per_second": self.requests_per_second,
+            "transfer_per_second": self.transfer_per_second,
+            "errors": dict(self.errors),
+            "non_2xx_3xx": self.non_2xx_3xx,
+            "latency": list(self.latency),
+            "max_latency": self.max_latency,
+            "percentiles": [list(point) for point in self.percentiles],
+            "latency_cdf": [list(point) for point in mixture_cdf(self._tables)],
+            "host_requests_per_second": list(self.host_requests_per_second),
+        }
+
+    def __str__(self):
+        mean, stdev = self.latency
+        lines = [
+            "Results:",
+            "  Total Requests: %s" % self.requests,
+            "  Total Requests per Second: %.2f" % self.requests_per_second,
+            "  Total Transfer per Second: %.2f [Kbytes/sec]" % (self.transfer_per_second / 1024),
+            "  Latency: %.3f [ms] mean, %.3f [ms] stdev, %.3f [ms] max" % (
+                mean, stdev, self.max_latency
+            ),
+            "  Socket Errors: connect %(connect)s, read %(read)s, write %(write)s, "
+            "timeout %(timeout)s" % self.errors,
+            "  Non-2xx or 3xx Responses: %s" % self.non_2xx_3xx,
+        ]
+        percentiles = self.percentiles
+        if percentiles:
+            lines.append("  Latency Distribution (ms):")
+            for percent, value in percentiles:
+                lines.append("    %3s%% %10.3f" % (percent, value))
+        return "\n".join(lines)
@@ -0,0 +1,222 @@
+import math
+import random
+
+from employ.commands.histogram import mixture_cdf
+
+
+class Comparison(object):
+    """
+    Comparison of the combined results of one command or stage of a
+    candidate run against those of a baseline run.
+
+    Throughput is compared by a bootstrap confidence interval of the
+    change in total requests per second, resampling the requests per
+    second of each instance, see :func:`bootstrap_interval`. It regressed
+    when it dropped by more than `threshold` percent and the whole
+    interval is below no change. With a single instance per run the
+    interval has no width and only the threshold applies.
+
+    Latency is compared by the Kolmogorov-Smirnov test of the latency
+    distributions, see :func:`ks_test`. The 99th percentile regressed when
+    it rose by more than `p99_threshold` percent and the distributions
+    differ at the `confidence` level.
+    """
+
+    def __init__(self, label, baseline, candidate, threshold=5.0, p99_threshold=10.0,
+                 confidence=0.95):
+        """
+        Constructor for :class:`employ.compare.Comparison`
+
+        :param label: the command and stage being compared, e.g. "ab concurrency=100"
+        :type label: str
+        :param baseline: the baseline's result, see :class:`employ.store.ResultStore`
+        :type baseline: dict
+        :param candidate: the candidate's result
+        :type candidate: dict
+        :param threshold: percent drop in throughput which is a regression
+        :type threshold: float
+        :param p99_threshold: percent rise of the 99th percentile which is a regression
+        :type p99_threshold: float
+        :param confidence: the confidence level of the interval and test, 0 - 1
+        :type confidence: float
+        """
+        self.label = label
+        self.confidence = confidence
+
+        self.baseline_throughput = baseline["requests_per_second"]
+        self.candidate_throughput = candidate["requests_per_second"]
+        self.throughput_change = _change(self.baseline_throughput, self.candidate_throughput)
+        self.interval = bootstrap_interval(
+            baseline.get("host_requests_per_second") or [self.baseline_throughput],
+            candidate.get("host_requests_per_second") or [self.candidate_throughput],
+            confidence,
+        )
+
+        self.baseline_p99 = dict(map(tuple, baseline.get("percentiles") or [])).get(99)
+        self.candidate_p99 = dict(map(tuple, candidate.get("percentiles") or [])).get(99)
+        self.p99_change = None
+        if self.baseline_p99 is not None and self.candidate_p99 is not None:
+            self.p99_change = _change(self.baseline_p99, self.candidate_p99)
+        self.statistic, self.p_value = ks_test(
+            baseline.get("latency_cdf") or [], baseline.get("requests", 0),
+            candidate.get("latency_cdf") or [], candidate.get("requests", 0),
+        )
+
+        self.regressions = []
+        if self.throughput_change * 100 < -threshold and self.interval[1] < 0:
+            self.regressions.append("throughput")
+        if (
+                self.p99_change is not None and self.p99_change * 100 > p99_threshold and
+                self.p_value < 1.0 - confidence
+        ):
+            self.regressions.append("p99")
+
+    def __str__(self):
+        lines = [
+            "%s:" % self.label,
+            "  Requests per Second: %.2f -> %.2f (%+.1f%%, %g%% CI %+.1f%% to %+.1f%%)%s" % (
+                self.baseline_throughput, self.candidate_throughput,
+                self.throughput_change * 100, self.confidence * 100,
+                self.interval[0] * 100, self.interval[1] * 100,
+                "  REGRESSION" if "throughput" in self.regressions else "",
+            ),
+        ]
+        if self.p99_change is not None:
+            lines.append("  99%% Latency: %.3f -> %.3f [ms] (%+.1f%%)%s" % (
+                self.baseline_p99, self.candidate_p99, self.p99_change * 100,
+                "  REGRESSION" if "p99" in self.regressions else "",
+            ))
+        lines.append("  Latency Distribution: KS D=%.4f, p=%.4g" % (self.statistic, self.p_value))
+        return "\n".join(lines)
+
+
+def compare_runs(baseline, candidate, **settings):
+    """
+    Compare every command and stage of two runs saved by :class:`employ.store.ResultStore`
+
+    Commands and stages are matched by their config section and scheduled value.
+
+    :param baseline: the saved baseline run
+    :type baseline: dict
+    :param candidate: the saved candidate run
+    :type candidate: dict
+    :param settings: the thresholds and confidence, see :class:`employ.compare.Comparison`
+    :returns: tuple - ([:class:`employ.compare.Comparison`, ...], [labels missing from `candidate`])
+    """
+    candidates = dict((_key(entry), entry) for entry in candidate["commands"])
+    comparisons = []
+    missing = []
+    for entry in baseline["commands"]:
+        label = entry["section"]
+        if entry.get("schedule"):
+            label = "%s %s=%s" % (label, entry["schedule"], entry["stage"])
+        match = candidates.get(_key(entry))
+        if match is None:
+            missing.append(label)
+        else:
+            comparisons.append(Comparison(label, entry["result"], match["result"], **settings))
+    return comparisons, missing
+
+
+def bootstrap_interval(baseline, candidate, confidence=0.95, resamples=2000, seed=0):
+    """
+    Bootstrap confidence interval of the relative change from the total
+    of `baseline` to the total of `candidate`
+
+    Each resample draws as many samples as each side has, with replacement.
+    The same seed always gives the same interval.
+
+    :param baseline: samples of the baseline, e.g. requests per second of each instance
+    :type baseline: list - [float, ...]
+    :param candidate: samples of the candidate
+    :type candidate: list - [float, ...]
+    :param confidence: the confidence level of the interval, 0 - 1
+    :type confidence: float
+    :param resamples: number of resamples to draw
+    :type resamples: int
+    :param seed: the seed for drawing resamples
+    :type seed: int
+    :returns: tuple - (low, high), e.g. (-0.08, -0.02) for 8% to 2% lower
+    """
+    generator = random.Random(seed)
+    changes = []
+    for _ in xrange(resamples):
+        total = sum(generator.choice(baseline) for _ in baseline)
+        if total:
+            changes.append(sum(generator.choice(candidate) for _ in candidate) / float(total) - 1)
+    if not changes:
+        return (0.0, 0.0)
+    changes.sort()
+    tail = (1.0 - confidence) / 2
+    return (
+        changes[int(tail * (len(changes) - 1))],
+        changes[int(math.ceil((1.0 - tail) * (len(changes) - 1)))],
+    )
+
+
+def ks_test(baseline_cdf, baseline_count, candidate_cdf, candidate_count):
+    """
+    Two sample Kolmogorov-Smirnov test of two latency distributions
+
+    The distributions are interpolated between their known points and
+    the p-value uses the asymptotic Kolmogorov distribution. With the
+    number of requests of a load test even small differences are
+    significant, so compare the statistic or the percentiles to judge
+    whether a difference matters.
+
+    :param baseline_cdf: the baseline distribution
+    :type baseline_cdf: list - [(ms, fraction of requests <= ms), ...]
+    :param baseline_count: number of requests in the baseline
+    :type baseline_count: int
+    :param candidate_cdf: the candidate distribution
+    :type candidate_cdf: list - [(ms, fraction of requests <= ms), ...]
+    :param candidate_count: number of requests in the candidate
+    :type candidate_count: int
+    :returns: tuple - (statistic, p-value), the statistic is the largest
+        difference between the distributions, 0 - 1
+    """
+    if not baseline_cdf or not candidate_cdf:
+        return (0.0, 1.0)
+    values = sorted(set(value for value, _ in baseline_cdf) | set(value for value, _ in candidate_cdf))
+    statistic = max(
+        abs(base - other)
+        for (_, base), (_, other) in zip(
+            mixture_cdf([(1, baseline_cdf)], values), mixture_cdf([(1, candidate_cdf)], values)
+        )
+    )
+    if not baseline_count or not candidate_count:
+        return (statistic, 1.0)
+    effective = math.sqrt(baseline_count * candidate_count / float(baseline_count + candidate_count))
+    return (statistic, _kolmogorov((effective + 0.12 + 0.11 / effective) * statistic))
+
+
+def _kolmogorov(value):
+    """
+    Helper function for the survival function of the Kolmogorov distribution
+    """
+    # the series converges slowly for small values, where it is 1
+    if value < 0.27:
+        return 1.0
+    total = 0.0
+    for index in xrange(1, 101):
+        term = 2 * (-1) ** (index - 1) * math.exp(-2 * index * index * value * value)
+        total += term
+        if abs(term) < 1e-12:
+            break
+    return min(max(total, 0.0), 1.0)
+
+
+def _change(baseline, candidate):
+    """
+    Helper function to get the relative change from `baseline` to `candidate`
+    """
+    if not baseline:
+        return 0.0
+    return candidate / float(baseline) - 1
+
+
+def _key(entry):
+    """
+    Helper function to match the commands and stages of saved runs
+    """
+    return (entry["section"], entry.get("stage"))
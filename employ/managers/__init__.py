@@ -1,14 +1,55 @@
 from pkgutil import extend_path
 __path__ = extend_path(__path__, __name__)
 
-from employ.exceptions import ExecutionError
+import copy
+import hashlib
+import itertools
+import json
+import os
+import threading
+
+from Queue import Queue
+
+from concurrent.futures import ThreadPoolExecutor
+
+from employ.exceptions import EmployError, ExecutionError
+from employ.logger import logger
+from employ.result import now
+from employ.trace import tracer
+
+# held while printing results, so the results of commands
+# running at the same time are not printed on top of each other
+output_lock = threading.RLock()
 
 
 class Manager(object):
     """
     Base Manager class that all Manager plugins must inherit from.
+
+    Work fanned out to instances is run on a single thread pool which
+    lives as long as the manager, at most `max_parallel` tasks run at once
+    unless more have to, see :func:`ensure_parallel`.
+
+    Managers can keep a warm pool of instances between invocations, see
+    :func:`up` and :func:`down`. While a warm pool exists, using the
+    manager as a context manager attaches to the pool's instances instead
+    of creating new ones and leaves them running afterwards. The pool is
+    recorded in `state_file`, which can be set in the manager's config
+    section and defaults to `~/.employ/<name>.json`.
     """
     name = "manager"
+    max_parallel = 10
+    state_file = None
+    warm = False
+    # {section: {group label: result}}, see :func:`collect_results`
+    group_results = None
+    # :class:`employ.sinks.Sink` every result is written to, see :func:`collect_results`
+    sink = None
+    _executor = None
+    _executor_size = None
+    _executor_lock = threading.Lock()
+    _retired_executors = ()
+    _scripts = None
 
     @classmethod
     def from_config(cls, config):
@@ -23,7 +64,11 @@ class Manager(object):
         settings = {}
         if config.has_section(cls.name):
             settings = dict(config.items(cls.name))
-        return cls(**settings)
+        state_file = settings.pop("state_file", None)
+        manager = cls(**settings)
+        if state_file:
+            manager.state_file = state_file
+        return manager
 
     def setup_instances(self):
         """
@@ -42,8 +87,19 @@ class Manager(object):
 
         with manager:
             # instances are connected to
+
+        If a warm pool exists its instances are attached to instead.
         """
-        self.setup_instances()
+        state = self.load_state()
+        if state:
+            logger.info("attaching to warm pool from %s", self.state_path())
+            with tracer.span("attach_instances", manager=self.name):
+                self.attach_instances(state["instances"])
+            self.warm = True
+            self._scripts = state["scripts"]
+        else:
+            with tracer.span("setup_instances", manager=self.name):
+                self.setup_instances()
 
     def cleanup_instances(self):
         """
@@ -63,8 +119,300 @@ class Manager(object):
         with manager:
             # instances are available
         # instances are destroyed
+
+        Instances from a warm pool are only detached from.
         """
+        try:
+            if self.warm:
+                with tracer.span("detach_instances", manager=self.name):
+                    self.detach_instances()
+            else:
+                with tracer.span("cleanup_instances", manager=self.name):
+                    self.cleanup_instances()
+        finally:
+            self.shutdown()
+
+    def instance_state(self):
+        """
+        Method called to get the state needed to re-attach to the current instances.
+
+        Must be implemented by children which support warm pools.
+
+        :returns: json serializable object
+        :raises: :class:`employ.exceptions.EmployError` when warm pools are not supported
+        """
+        raise self._no_warm_pools()
+
+    def attach_instances(self, state, connect=True):
+        """
+        Method called to attach to the instances of a warm pool.
+
+        Must be implemented by children which support warm pools.
+
+        The result of this method should be that the instances described
+        by `state` are in use and, if `connect` is set, are healthy and
+        connected to.
+
+        :param state: the state returned by :func:`instance_state`
+        :param connect: whether or not to connect to the instances
+        :type connect: bool
+        :raises: :class:`employ.exceptions.EmployError` when warm pools are not supported
+        """
+        raise self._no_warm_pools()
+
+    def detach_instances(self):
+        """
+        Method called to disconnect from instances without destroying them.
+
+        Must be implemented by children which support warm pools.
+
+        :raises: :class:`employ.exceptions.EmployError` when warm pools are not supported
+        """
+        raise self._no_warm_pools()
+
+    def supports_warm_pools(self):
+        """
+        Check whether this manager implements :func:`instance_state`,
+        :func:`attach_instances` and :func:`detach_instances`.
+
+        :returns: bool
+        """
+        return all(
+            getattr(type(self), method).__func__ is not getattr(Manager, method).__func__
+            for method in ("instance_state", "attach_instances", "detach_instances")
+        )
+
+    def _no_warm_pools(self):
+        """
+        Helper method to create the error for managers without warm pools
+        """
+        return EmployError("The '%s' manager does not support warm pools" % self.name)
+
+    def state_path(self):
+        """
+        Get the filename of the warm pool state file.
+
+        :returns: str
+        """
+        return os.path.expanduser(self.state_file or "~/.employ/%s.json" % self.name)
+
+    def load_state(self):
+        """
+        Load the warm pool state.
+
+        :returns: dict - the state or None if there is no warm pool
+        """
+        path = self.state_path()
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as fp:
+            return json.load(fp)
+
+    def save_state(self):
+        """
+        Save the current instances and setup scripts as the warm pool state.
+        """
+        path = self.state_path()
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        state = {
+            "instances": self.instance_state(),
+            "scripts": self._scripts or {},
+        }
+        with open(path, "w") as fp:
+            json.dump(state, fp, indent=2)
+
+    def clear_state(self):
+        """
+        Remove the warm pool state.
+        """
+        path = self.state_path()
+        if os.path.exists(path):
+            os.remove(path)
+
+    def up(self, scripts, artifacts=()):
+        """
+        Create a warm pool, setup instances, upload `artifacts` and run
+        setup `scripts` on them, leaving them running for later runs to
+        attach to.
+
+        :param scripts: filenames of setup scripts to run
+        :type scripts: list
+        :param artifacts: files, directories or tarballs to upload
+        :type artifacts: list
+        :raises: :class:`employ.exceptions.EmployError`
+        """
+        if not self.supports_warm_pools():
+            raise self._no_warm_pools()
+        if self.load_state():
+            raise EmployError("A warm pool already exists: %s" % self.state_path())
+        self.setup_instances()
+        self.warm = True
+        try:
+            self.save_state()
+            for artifact in artifacts:
+                self.upload(artifact)
+            for script in scripts:
+                self.setup(script)
+        finally:
+            self.detach_instances()
+            self.shutdown()
+
+    def down(self):
+        """
+        Destroy the warm pool's instances and remove its state.
+
+        :raises: :class:`employ.exceptions.EmployError`
+        """
+        if not self.supports_warm_pools():
+            raise self._no_warm_pools()
+        state = self.load_state()
+        if not state:
+            raise EmployError("No warm pool found: %s" % self.state_path())
+        self.attach_instances(state["instances"], connect=False)
         self.cleanup_instances()
+        self.clear_state()
+
+    def setup_changed(self, script):
+        """
+        Check whether `script` needs to be run.
+
+        Setup scripts always need to be run unless they have already been
+        run on the warm pool and have not changed since.
+
+        :param script: the filename of the setup script
+        :type script: str
+        :returns: bool
+        """
+        if not self.warm:
+            return True
+        return (self._scripts or {}).get(os.path.abspath(script)) != file_digest(script)
+
+    def setup_done(self, script):
+        """
+        Record that `script` was run successfully, updating the warm pool state.
+
+        :param script: the filename of the setup script
+        :type script: str
+        """
+        if self._scripts is None:
+            self._scripts = {}
+        self._scripts[os.path.abspath(script)] = file_digest(script)
+        if self.warm:
+            self.save_state()
+
+    def executor(self):
+        """
+        Get the thread pool used to run tasks against instances.
+
+        The pool is created on first use and reused until :func:`shutdown`.
+
+        :returns: :class:`concurrent.futures.ThreadPoolExecutor`
+        """
+        with self._executor_lock:
+            if not self._executor:
+                self._executor_size = int(self.max_parallel)
+                self._executor = ThreadPoolExecutor(max_workers=self._executor_size)
+            return self._executor
+
+    def ensure_parallel(self, count):
+        """
+        Make sure at least `count` tasks can run on :func:`executor` at once.
+
+        Used when tasks must all be running at the same time, e.g.
+        commands started at the same instant, when `count` is more than
+        `max_parallel` the pool is replaced by a larger one. Tasks already
+        submitted to the old pool still finish on it.
+
+        :param count: the number of tasks which must be able to run at once
+        :type count: int
+        """
+        with self._executor_lock:
+            size = self._executor_size or int(self.max_parallel)
+            if count <= size:
+                return
+            logger.info("running up to %s tasks at once instead of %s", count, size)
+            if self._executor:
+                # callers may still be submitting to it, so only shut it down later
+                self._retired_executors = list(self._retired_executors) + [self._executor]
+            self._executor_size = count
+            self._executor = ThreadPoolExecutor(max_workers=count)
+
+    def shutdown(self):
+        """
+        Shutdown the thread pool used to run tasks against instances.
+        """
+        with self._executor_lock:
+            executors = list(self._retired_executors)
+            if self._executor:
+                executors.append(self._executor)
+            self._executor = None
+            self._executor_size = None
+            self._retired_executors = ()
+        for executor in executors:
+            executor.shutdown(wait=True)
+
+    def map_hosts(self, func, hosts, *args):
+        """
+        Call `func(host, *args)` for every host in `hosts` using :func:`executor`.
+
+        Blocks until all calls have finished, if any call raised an
+        exception it is re-raised here.
+
+        :param func: the function to call for each host
+        :type func: callable
+        :param hosts: the hosts to call `func` for
+        :type hosts: list
+        :returns: list - [(host, result), ...] in the same order as `hosts`
+        """
+        executor = self.executor()
+        futures = [(host, executor.submit(func, host, *args)) for host in hosts]
+        return [(host, future.result()) for host, future in futures]
+
+    def imap_hosts(self, func, hosts, *args):
+        """
+        Call `func(host, *args)` for every host in `hosts` using :func:`executor`,
+        yielding each result as soon as it is available.
+
+        Results are only held onto until they have been yielded, if any
+        call raised an exception it is re-raised when its result is reached.
+
+        :param func: the function to call for each host
+        :type func: callable
+        :param hosts: the hosts to call `func` for
+        :type hosts: list
+        :returns: generator - (host, result) in the order calls finish
+        """
+        return self._imap_hosts(self.executor(), func, hosts, *args)
+
+    def _imap_hosts(self, executor, func, hosts, *args):
+        """
+        Helper method for :func:`imap_hosts` which submits the calls to `executor`
+        """
+        done = Queue()
+        count = 0
+        for host in hosts:
+            future = executor.submit(func, host, *args)
+            future.add_done_callback(lambda future, host=host: done.put((host, future)))
+            count += 1
+        for _ in xrange(count):
+            host, future = done.get()
+            yield (host, future.result())
+
+    def upload(self, path, remote_path=None):
+        """
+        Make the file, directory or tarball at `path` available on all instances.
+
+        All children must implement this method.
+
+        :param path: the local file, directory or tarball to upload
+        :type path: str
+        :param remote_path: where to put `path` on each instance
+        :type remote_path: str
+        :returns: str - where `path` is on each instance
+        """
+        raise NotImplementedError()
 
     def setup(self, script):
         """
@@ -77,37 +425,195 @@ class Manager(object):
         """
         raise NotImplementedError()
 
-    def run(self, command):
+    def run(self, command, hosts=None):
         """
-        Execute `command` on all instances.
+        Execute `command` on all instances, or only on `hosts`.
 
         All children must implement this method.
 
         This method should execute `command.commad()` on all instances
-        as well as sending the results of all instances to `command.aggregate`
-
-        The results will be in the following format::
+        as well as sending the results of all instances to `command`
+        as they arrive, see :func:`collect_results`.
 
-            [(status, stdout, stderr), ...]
+        The results will be :class:`employ.result.Result`,
+        one for each instance.
 
         :param command: the command to run on the instances
         :type command: :class:`employ.commands.Command`
+        :param hosts: only run `command` on these hosts, see :func:`partition_hosts`
+        :type hosts: list
         """
         raise NotImplementedError()
 
+    def hosts(self):
+        """
+        Get the hosts commands are run on.
+
+        All children must implement this method.
+
+        :returns: list
+        """
+        raise NotImplementedError()
+
+    def partition_hosts(self, shares):
+        """
+        Split the hosts into separate groups, one for each share.
+
+        Each share is either a number of hosts, e.g. "4", or a percentage
+        of all hosts, e.g. "30%", every group gets at least one host. When
+        hosts are in groups, see :func:`host_groups`, each share is spread
+        evenly across the groups. Since the groups run commands at the same
+        time, the thread pool is enlarged to fit all of their hosts, see
+        :func:`ensure_parallel`.
+
+        :param shares: the share of hosts for each group
+        :type shares: list - [str, ...]
+        :returns: list - [[host, ...], ...] in the same order as `shares`
+        :raises: :class:`employ.exceptions.EmployError`
+        """
+        hosts = self.hosts()
+        groups = self.host_groups()
+        if groups:
+            # interleave so every share has hosts from every group
+            rows = itertools.izip_longest(*[groups[label] for label in sorted(groups)])
+            hosts = [host for row in rows for host in row if host is not None]
+
+        sizes = []
+        for share in shares:
+            share = str(share).strip()
+            try:
+                if share.endswith("%"):
+                    size = int(round(len(hosts) * float(share[:-1]) / 100.0))
+                else:
+                    size = int(share)
+            except ValueError:
+                raise EmployError("Invalid share of instances: '%s'" % share)
+            sizes.append(max(size, 1))
+        if sum(sizes) > len(hosts):
+            raise EmployError(
+                "Shares of instances need %s instances but there are only %s" % (
+                    sum(sizes), len(hosts)
+                )
+            )
+        # the groups run at the same time, so every host needs a thread
+        self.ensure_parallel(sum(sizes))
+
+        partitions = []
+        start = 0
+        for size in sizes:
+            partitions.append(hosts[start:start + size])
+            start += size
+        return partitions
+
+    def host_groups(self):
+        """
+        Get groups of hosts whose results are also combined separately.
+
+        Children with hosts in distinct places, e.g. regions, can
+        override this, by default there are no groups.
+
+        :returns: dict - {label: [host, ...]}
+        """
+        return {}
+
+    def collect_results(self, command, results, execute):
+        """
+        Helper method to validate and pass each result to `command` as it arrives.
+
+        Calls `command.begin()`, then `command.add(result)` for each
+        result and finally `command.finish()`. Each host's run of the
+        command and the time spent combining results are traced. When
+        `sink` is set every result, including failed ones, is written
+        to it before being validated.
+
+        The results of each group from :func:`host_groups` are also
+        combined by their own copy of `command`, which are finished
+        first and kept in `group_results` under the command's section,
+        so commands running at the same time each keep their own.
+
+        :param command: the command that was run
+        :type command: :class:`employ.commands.Command`
+        :param results: the results from running `command`
+        :type results: iterable - [:class:`employ.result.Result`, ...]
+        :param execute: the raw str command that was run
+        :type execute: str
+        :returns: the result of `command.finish`
+        :raises: :class:`employ.exections.ExecutionError`
+        """
+        labels = dict(
+            (host, label) for label, hosts in self.host_groups().iteritems() for host in hosts
+        )
+        group_commands = {}
+        command.begin()
+        for result in results:
+            tracer.add("command", result.start, result.end, result.host, command=command.name)
+            start = now()
+            if self.sink is not None:
+                self.sink.add(command, result)
+                tracer.add("write_result", start, now(), result.host, command=command.name)
+            self.validate_results([result], execute)
+            start = now()
+            command.add(result)
+            label = labels.get(result.host)
+            if label is not None:
+                if label not in group_commands:
+                    group_commands[label] = copy.copy(command)
+                    group_commands[label].begin()
+                group_commands[label].add(result)
+            tracer.add("add_result", start, now(), result.host, command=command.name)
+        with tracer.span("aggregate", command=command.name), output_lock:
+            if command.instances:
+                print "%s (instances=%s):" % (command.section or command.name, command.instances)
+            groups = {}
+            for label in sorted(group_commands):
+                print "%s:" % label
+                groups[label] = group_commands[label].finish()
+            if self.group_results is None:
+                self.group_results = {}
+            self.group_results[command.section or command.name] = groups
+            if group_commands:
+                print "All Instances:"
+            return command.finish()
+
     def validate_results(self, results, command):
         """
         Helper method to validate the results of running commands.
 
-        :param results: the (status, stdout, stderr) results from running `command`
-        :type results: list
+        :param results: the results from running `command`
+        :type results: list - [:class:`employ.result.Result`, ...]
         :param command: the raw str command that was run
         :type command: str
         :raises: :class:`employ.exections.ExecutionError`
         """
-        for status, stdout, stderr in results:
-            if status != 0:
+        for result in results:
+            if result.status != 0:
                 raise ExecutionError(
-                    "Non-Zero status code from executing command: %s" % command,
-                    command, status, stdout, stderr,
+                    "Non-Zero status code from executing command on %s: %s" % (
+                        result.host, command
+                    ),
+                    command, result.status, result.stdout, result.stderr,
                 )
+
+
+def file_digest(filename):
+    """
+    Helper function to get the sha256 hex digest of the contents of `filename`
+
+    :returns: str
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as fp:
+        for chunk in iter(lambda: fp.read(65536), ""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def to_bool(value):
+    """
+    Helper function to convert a config setting to a bool
+
+    :returns: bool
+    """
+    if isinstance(value, basestring):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
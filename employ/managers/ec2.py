@@ -1,17 +1,21 @@
+import re
 import time
-from os.path import basename
-from threading import Thread
-from Queue import Queue
 
 import boto.ec2
-import paramiko
+import boto.exception
+from concurrent.futures import ThreadPoolExecutor
 
 from employ.logger import logger
-from employ.exceptions import SSHConnectionError
-from employ.managers import Manager
+from employ.exceptions import EmployError
+from employ.managers.ssh import SSHManager
+from employ.result import now
+from employ.trace import tracer
 
+# states instances never leave to become "running"
+STOPPED_STATES = ("shutting-down", "terminated", "stopping", "stopped")
 
-class EC2Manager(Manager):
+
+class EC2Manager(SSHManager):
     """
     Employ Manager which creates instances in EC2
 
@@ -29,14 +33,57 @@ class EC2Manager(Manager):
       host_key = ~/.ssh/known_hosts
       ssh_pwd = None
 
+      ; start instances in several regions or availability zones at
+      ; once, a comma separated list of <region or zone>:<count>[:<ami>]
+      ; which replaces region, num_instances and ami_image_id, the
+      ; key and security group must exist in every region, results
+      ; are combined per region as well as for all instances
+      ; regions = us-east-1:20,us-west-2a:10,us-west-2b:10:ami-0123abcd
+
       ; when starting instances this manager will block until
       ; all instances have the state "running", this interval
       ; is how long the manager will wait between checking states
+      ; and wait_timeout is how long to wait in total before giving up
       wait_interval = 5
+      wait_timeout = 600
 
       ; when attempting to gain an ssh connection, fail after
-      ; connection_attempts attempts
+      ; connection_attempts attempts, the wait between attempts
+      ; doubles every attempt up to max_backoff seconds
       connection_attempts = 10
+      max_backoff = 30
+      connect_timeout = 10
+
+      ; seconds between ssh keepalive packets, 0 to disable
+      keepalive = 30
+
+      ; whether or not to compress ssh traffic, including uploads
+      compress = False
+
+      ; max number of instances to connect to, upload to or run setup
+      ; on at once, commands always run on all instances at once
+      max_parallel = 10
+
+      ; how to collect command output, "threads" uses a thread
+      ; per instance, "poll" uses a single thread for all instances
+      backend = threads
+
+      ; how to upload artifacts, "direct" uploads to every instance,
+      ; "tree" uploads to `seeds` instances which then pass uploads on
+      ; to `fanout` instances at a time over their private addresses,
+      ; or public addresses when using several regions,
+      ; serving them on `distribution_port` and the ports after it
+      distribution = direct
+      seeds = 1
+      fanout = 2
+      distribution_port = 8765
+
+      ; whether commands wait to start on all instances at the same
+      ; instant, each instance's clock offset is measured and logged
+      ; first, start_delay is the seconds between sending the
+      ; command and starting it, long enough to reach every instance
+      synchronized_start = False
+      start_delay = 2
 
     """
     name = "ec2"
@@ -47,7 +94,12 @@ class EC2Manager(Manager):
             instance_type="t1.micro", key_name=None,
             security_group="default", user_name="root",
             host_key="~/.ssh/known_hosts", ssh_pwd=None,
-            wait_interval=5, connection_attempts=10
+            wait_interval=5, connection_attempts=10, max_backoff=30,
+            connect_timeout=10, keepalive=30, compress=False,
+            max_parallel=10, backend="threads", distribution="direct",
+            seeds=1, fanout=2, distribution_port=8765,
+            synchronized_start=False, start_delay=2, regions=None,
+            wait_timeout=600
     ):
         """
         Construct for :class:`employ.managers.EC2Manager`
@@ -57,9 +109,22 @@ class EC2Manager(Manager):
         :param num_instances: the number of ec2 instances to start
         :type num_instances: int
         :param instance_name: the name to assign to each instance
+        :param regions: optional "<region or zone>:<count>[:<ami>],..."
+            to start instances in, see :func:`parse_regions`
+        :type regions: str
+        :param wait_timeout: seconds to wait for instances to be "running"
+        :type wait_timeout: float
         """
+        super(EC2Manager, self).__init__(
+            user_name=user_name, host_key=host_key, ssh_pwd=ssh_pwd,
+            connection_attempts=connection_attempts, max_backoff=max_backoff,
+            connect_timeout=connect_timeout, keepalive=keepalive,
+            compress=compress, max_parallel=max_parallel, backend=backend,
+            distribution=distribution, seeds=seeds, fanout=fanout,
+            distribution_port=distribution_port,
+            synchronized_start=synchronized_start, start_delay=start_delay,
+        )
         self.instances = []
-        self.client_connections = []
         self.ami_image_id = ami_image_id
         self.num_instances = num_instances
         self.instance_name = instance_name
@@ -67,165 +132,415 @@ class EC2Manager(Manager):
         self.instance_type = instance_type
         self.key_name = key_name
         self.security_groups = [security_group] if security_group else []
-        self.user_name = user_name
-        self.host_key = host_key
-        self.ssh_pwd = ssh_pwd
-        self.wait_interval = wait_interval
-        self.connection_attempts = connection_attempts
-        self._connection = None
+        self.wait_interval = float(wait_interval)
+        self.wait_timeout = float(wait_timeout)
+        if regions:
+            self.placements = parse_regions(regions, ami_image_id)
+        else:
+            self.placements = [(region, None, int(num_instances), ami_image_id)]
+        self.instance_regions = {}
+        self._connections = {}
 
-    def connection(self):
+    def connection(self, region=None):
         """
         Returns a boto connection.
 
+        :param region: the region to connect to, defaults to `region`
+        :type region: str
         :returns: :class:`boto.ec2.connection.EC2Connection`
         """
-        if not self._connection:
-            self._connection = boto.ec2.connect_to_region(self.region)
-        return self._connection
+        region = region or self.region
+        if region not in self._connections:
+            self._connections[region] = boto.ec2.connect_to_region(region)
+        return self._connections[region]
 
-    def instance_ids(self):
+    def regions(self):
+        """
+        Get the regions instances are started in
+
+        :returns: list
+        """
+        regions = []
+        for region, zone, count, ami_image_id in self.placements:
+            if region not in regions:
+                regions.append(region)
+        return regions
+
+    def instance_ids(self, region=None):
         """
         Get list of client instance ids
 
+        :param region: only get the ids of instances in this region
+        :type region: str
         :returns: list
         """
-        return [instance.id for instance in self.instances]
+        return [
+            instance.id for instance in self.instances
+            if region is None or self.instance_regions.get(instance.id) == region
+        ]
+
+    def hosts(self):
+        """
+        Get list of instance ip addresses
+
+        :returns: list
+        """
+        return [instance.ip_address for instance in self.instances]
+
+    def host_groups(self):
+        """
+        Get the ip addresses of the instances in each region, when
+        instances are in more than one region
+
+        :returns: dict - {"Region <region>": [ip address, ...]}
+        """
+        if len(self.regions()) < 2:
+            return {}
+        groups = {}
+        for instance in self.instances:
+            label = "Region %s" % self.instance_regions.get(instance.id)
+            groups.setdefault(label, []).append(instance.ip_address)
+        return groups
+
+    def peer_address(self, host):
+        """
+        Get the private ip address of the instance with the ip address `host`
+
+        Private addresses are not reachable from other regions, so with
+        several regions `host` itself is used.
+
+        :param host: the ip address of the instance
+        :type host: str
+        :returns: str
+        """
+        if len(self.regions()) > 1:
+            return host
+        for instance in self.instances:
+            if instance.ip_address == host and instance.private_ip_address:
+                return instance.private_ip_address
+        return host
 
     def setup_instances(self):
         """
-        Starts `self.num_instances` new EC2 instances and establish SSH connections to each
-        """
-        logger.info("starting %s instances", self.num_instances)
-        connection = self.connection()
-        reservation = connection.run_instances(
-            image_id=self.ami_image_id,
-            min_count=self.num_instances,
-            max_count=self.num_instances,
-            instance_type=self.instance_type,
-            key_name=self.key_name,
-            security_groups=self.security_groups,
+        Starts new EC2 instances in every region and establish SSH connections to each
+
+        Instances are started and waited on in all regions in parallel,
+        if starting instances fails in any region, any instance stops or
+        terminates while starting, they are not all "running" after
+        `wait_timeout` seconds or connecting to any fails all instances
+        are terminated.
+
+        :raises: :class:`employ.exceptions.EmployError`,
+            :class:`employ.exceptions.SSHConnectionError`
+        """
+        total = sum(count for region, zone, count, ami_image_id in self.placements)
+        logger.info("starting %s instances in %s", total, ", ".join(self.regions()))
+        pool = ThreadPoolExecutor(max_workers=len(self.placements))
+        try:
+            launches = [pool.submit(self._launch, *placement) for placement in self.placements]
+            self.instances = []
+            errors = []
+            for launch in launches:
+                try:
+                    self.instances.extend(launch.result())
+                except Exception, e:
+                    errors.append(e)
+            if errors:
+                logger.info("terminating all instances after failing to start some")
+                self.cleanup_instances()
+                raise errors[0]
+            connecting = {}
+            try:
+                start = self._wait_running(pool, connecting)
+            except Exception:
+                logger.warning("terminating all instances after failing to start some")
+                self._abort_setup(connecting)
+                raise
+        finally:
+            pool.shutdown(wait=True)
+
+        try:
+            self.instances = [connecting[instance.id][0] for instance in self.instances]
+            for instance in self.instances:
+                self.client_connections[instance.ip_address] = connecting[instance.id][1].result()
+        except Exception:
+            logger.warning("terminating all instances after failing to connect to some")
+            self._abort_setup(connecting)
+            raise
+        self.connect_time = time.time() - start
+        logger.info(
+            "established %s ssh connections in %.2f seconds",
+            len(self.client_connections), self.connect_time
         )
-        self.instances = reservation.instances
-        connection.create_tags(self.instance_ids(), {"Name": self.instance_name})
 
-        logger.info("waiting until all instances are all 'running'")
-        while not all(instance.update() == "running" for instance in self.instances):
-            time.sleep(self.wait_interval)
+    def _abort_setup(self, connecting):
+        """
+        Helper method to give up on new instances, stopping connections
+        still being made, closing those already made and terminating all
+        instances
 
-        # connections usually take a bit, might as well wait
-        # a little bit before making the first attempt
-        time.sleep(self.wait_interval)
-        logger.info("establishing ssh connections")
+        :param connecting: {instance id: (instance, future ssh connection)}
+        :type connecting: dict
+        """
+        self._stop_connecting.set()
+        try:
+            for instance, future in connecting.values():
+                future.cancel()
+            # waits for connections being retried to give up
+            self.shutdown()
+            for instance, future in connecting.values():
+                if not future.cancelled() and future.exception() is None:
+                    future.result().close()
+            self.cleanup_instances()
+        finally:
+            self._stop_connecting.clear()
+
+    def _wait_running(self, pool, connecting):
+        """
+        Helper method to wait for all instances to be "running", connecting
+        to each instance as soon as it is
+
+        :param pool: the thread pool to check each region's instances on
+        :type pool: :class:`concurrent.futures.ThreadPoolExecutor`
+        :param connecting: filled in with {instance id: (instance, future ssh connection)}
+            as instances are seen running, so connections can be stopped on failure
+        :type connecting: dict
+        :returns: float - time.time() the first connection started
+        :raises: :class:`employ.exceptions.EmployError`
+        """
+        launched = now()
+        logger.info("waiting until all instances are all 'running'")
+        # instances start connecting as soon as they are seen running
+        # so slow instances do not hold up the rest
+        executor = self.executor()
+        pending = {}
         for instance in self.instances:
-            for _ in xrange(self.connection_attempts):
-                logger.info(
-                    "Attempting connection to %s@%s",
-                    self.user_name, instance.ip_address
-                )
-                client = paramiko.SSHClient()
-                client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                try:
-                    client.connect(
-                        instance.ip_address, username=self.user_name,
-                        key_filename=self.host_key
+            pending.setdefault(self.instance_regions[instance.id], set()).add(instance.id)
+        start = None
+        while pending:
+            polls = [
+                (region, pool.submit(self._running_instances, instance_ids, region))
+                for region, instance_ids in pending.items()
+            ]
+            for region, poll in polls:
+                for instance in poll.result():
+                    pending[region].discard(instance.id)
+                    # only accurate to within wait_interval
+                    tracer.add(
+                        "wait_running", launched, now(), instance.ip_address,
+                        id=instance.id, region=region
+                    )
+                    if start is None:
+                        logger.info("establishing ssh connections")
+                        start = time.time()
+                    connecting[instance.id] = (
+                        instance, executor.submit(self._connect, instance.ip_address)
+                    )
+                if not pending[region]:
+                    del pending[region]
+            if pending:
+                if now() - launched >= self.wait_timeout:
+                    raise EmployError(
+                        "Instances not 'running' after %s seconds: %s" % (
+                            self.wait_timeout,
+                            ", ".join(sorted(set.union(*pending.values()))),
+                        )
                     )
-                    self.client_connections.append(client)
-                    break
-                except Exception:
-                    pass
                 time.sleep(self.wait_interval)
-            else:
-                raise SSHConnectionError(
-                    "Could not establish ssh connection to %s@%s after %s attempts",
-                    self.user_name, instance.ip_address, self.connection_attempts
-                )
+        return start
 
-    def cleanup_instances(self):
+    def instance_state(self):
         """
-        Close all open SSH connections and terminate all instances.
-        """
-        for client in self.client_connections:
-            client.close()
+        Get the ids of all instances in each region
 
-        connection = self.connection()
-        connection.terminate_instances(instance_ids=self.instance_ids())
+        :returns: dict
+        """
+        return {
+            "regions": dict(
+                (region, self.instance_ids(region)) for region in self.regions()
+            ),
+        }
 
-    def setup(self, script):
+    def attach_instances(self, state, connect=True):
         """
-        Run setup `script` on all instances.
+        Use the instances of a warm pool, checking they are still running
 
-        Upload `script` to each instance and execute.
+        Without `connect`, e.g. to destroy the warm pool, instances which
+        no longer exist are skipped so the rest can still be terminated.
 
-        :param script: the filename of the script to upload and run
-        :type script: str
+        :param state: the state from :func:`instance_state`
+        :type state: dict
+        :param connect: whether or not to connect to the instances
+        :type connect: bool
+        :raises: :class:`employ.exceptions.EmployError` when connecting and
+            an instance no longer exists or is not running
         """
-        remote_file = "/tmp/%s" % basename(script)
-        workers = []
-        for client in self.client_connections:
-            worker = Thread(target=self._put_file, args=(client, script, remote_file))
-            worker.daemon = True
-            worker.start()
-            workers.append(worker)
-        for worker in workers:
-            worker.join()
+        regions = state.get("regions")
+        if regions is None:
+            # warm pools from before instances could be in several regions
+            regions = {state["region"]: state["instance_ids"]}
+        self.placements = [
+            (region, None, len(instance_ids), None)
+            for region, instance_ids in sorted(regions.iteritems())
+        ]
+        self.instances = []
+        for region, instance_ids in sorted(regions.iteritems()):
+            instances = self._find_instances(instance_ids, region)
+            for instance_id in instance_ids:
+                if instance_id not in instances:
+                    if connect:
+                        raise EmployError(
+                            "Warm pool instance %s no longer exists in %s" % (instance_id, region)
+                        )
+                    logger.warning(
+                        "warm pool instance %s no longer exists in %s", instance_id, region
+                    )
+                    continue
+                self.instances.append(instances[instance_id])
+                self.instance_regions[instance_id] = region
+        if not connect:
+            return
 
-        command = "/bin/sh %s" % remote_file
-        results = self._run_multi(command)
-        self.validate_results(results, command)
+        for instance in self.instances:
+            if instance.state != "running":
+                raise EmployError(
+                    "Warm pool instance %s is '%s'" % (instance.id, instance.state)
+                )
+        self.connect_all(self.hosts())
 
-    def run(self, command):
+    def _find_instances(self, instance_ids, region=None):
         """
-        Run :class:`employ.commands.Command` `command` on all instances.
-        """
-        execute = command.command()
-        results = self._run_multi(execute)
-        self.validate_results(results, execute)
-        command.aggregate(results)
+        Helper method to look up the instances from `instance_ids` which still exist
 
-    def _run_command(self, client, command, results):
+        :param instance_ids: the ids of the instances to look up
+        :type instance_ids: list
+        :param region: the region of the instances, defaults to `region`
+        :type region: str
+        :returns: dict - {instance id: :class:`boto.ec2.instance.Instance`}
         """
-        Helper method for executing a single command on a client
+        try:
+            reservations = self.connection(region).get_all_instances(
+                instance_ids=list(instance_ids)
+            )
+        except boto.exception.EC2ResponseError, e:
+            if e.error_code != "InvalidInstanceID.NotFound":
+                raise
+            # the whole request fails when any instance is missing,
+            # so find out which ones still exist one at a time
+            if len(instance_ids) < 2:
+                return {}
+            instances = {}
+            for instance_id in instance_ids:
+                instances.update(self._find_instances([instance_id], region))
+            return instances
+        return dict(
+            (instance.id, instance)
+            for reservation in reservations
+            for instance in reservation.instances
+        )
+
+    def _launch(self, region, zone, count, ami_image_id):
         """
-        transport = client.get_transport()
-        channel = transport.open_session()
-        logger.info("executing command %s", command)
-        channel.get_pty()
-        channel.exec_command(command)
-        status = int(channel.recv_exit_status())
-        stdout = ""
-        while channel.recv_ready():
-            stdout += channel.recv(1024)
-        stderr = ""
-        while channel.recv_stderr_ready():
-            stderr += channel.recv_stderr(1024)
-        results.put((status, stdout, stderr))
+        Helper method to start `count` instances in a single region
 
-    def _run_multi(self, command):
+        :param zone: the availability zone to start the instances in, or None
+        :type zone: str
+        :returns: list - [:class:`boto.ec2.instance.Instance`, ...]
         """
-        Helper method for executing a command across all instances
+        logger.info("starting %s instances in %s", count, zone or region)
+        connection = self.connection(region)
+        with tracer.span("run_instances", region=region, count=count):
+            reservation = connection.run_instances(
+                image_id=ami_image_id,
+                min_count=count,
+                max_count=count,
+                instance_type=self.instance_type,
+                key_name=self.key_name,
+                security_groups=self.security_groups,
+                placement=zone,
+            )
+            instances = reservation.instances
+            for instance in instances:
+                self.instance_regions[instance.id] = region
+            connection.create_tags(
+                [instance.id for instance in instances], {"Name": self.instance_name}
+            )
+        return instances
+
+    def _running_instances(self, instance_ids, region=None):
         """
-        results = Queue()
-        workers = []
-        for client in self.client_connections:
-            worker = Thread(target=self._run_command, args=(client, command, results))
-            worker.daemon = True
-            worker.start()
-            workers.append(worker)
+        Helper method to get the instances from `instance_ids` which are "running"
 
-        for worker in workers:
-            worker.join()
+        Uses a single request for all of `instance_ids`.
 
-        all_results = []
-        while not results.empty():
-            all_results.append(results.get())
-        return all_results
+        :param instance_ids: the ids of the instances to check
+        :type instance_ids: list
+        :param region: the region of the instances, defaults to `region`
+        :type region: str
+        :returns: list - [:class:`boto.ec2.instance.Instance`, ...]
+        :raises: :class:`employ.exceptions.EmployError` when an instance
+            is stopping or terminating, it will never be "running"
+        """
+        try:
+            reservations = self.connection(region).get_all_instances(
+                instance_ids=list(instance_ids)
+            )
+        except boto.exception.EC2ResponseError, e:
+            # newly started instances might not be visible yet
+            if e.error_code == "InvalidInstanceID.NotFound":
+                return []
+            raise
+        instances = [
+            instance for reservation in reservations for instance in reservation.instances
+        ]
+        for instance in instances:
+            if instance.state in STOPPED_STATES:
+                raise EmployError("Instance %s is '%s'" % (instance.id, instance.state))
+        return [instance for instance in instances if instance.state == "running"]
 
-    def _put_file(self, client, script, remote_file):
+    def cleanup_instances(self):
         """
-        Helper method to upload a file to an instance
+        Close all open SSH connections and terminate all instances.
         """
-        fp = open(script, "r")
-        transport = client.get_transport()
-        sftp_client = paramiko.SFTPClient.from_transport(transport)
-        sftp_client.putfo(fp, remote_file)
+        self.close_connections()
+
+        for region in self.regions():
+            instance_ids = self.instance_ids(region)
+            if instance_ids:
+                self.connection(region).terminate_instances(instance_ids=instance_ids)
+
+
+def parse_regions(regions, ami_image_id=None):
+    """
+    Helper function to parse where to start instances
+
+    `regions` is a comma separated list of "<region or zone>:<count>[:<ami>]",
+    e.g. "us-east-1:20,us-west-2a:10:ami-0123abcd". Availability zones
+    are regions followed by a letter.
+
+    :param regions: where to start instances
+    :type regions: str
+    :param ami_image_id: the ami to use when none is given
+    :type ami_image_id: str
+    :returns: list - [(region, zone or None, count, ami), ...]
+    :raises: :class:`employ.exceptions.EmployError`
+    """
+    placements = []
+    for placement in regions.split(","):
+        placement = placement.strip()
+        if not placement:
+            continue
+        parts = placement.split(":")
+        match = re.match("^(.+-[0-9]+)([a-z]?)$", parts[0])
+        if not match or len(parts) > 3:
+            raise EmployError("Invalid region: '%s'" % placement)
+        try:
+            count = int(parts[1]) if len(parts) > 1 else 1
+        except ValueError:
+            raise EmployError("Invalid region: '%s'" % placement)
+        region = match.group(1)
+        zone = parts[0] if match.group(2) else None
+        placements.append((region, zone, count, parts[2] if len(parts) > 2 else ami_image_id))
+    if not placements:
+        raise EmployError("Invalid regions: '%s'" % regions)
+    return placements
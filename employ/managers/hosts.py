@@ -0,0 +1,114 @@
+from employ.logger import logger
+from employ.managers.ssh import SSHManager
+
+
+class HostsManager(SSHManager):
+    """
+    Employ Manager which uses an existing list of hosts
+
+    Hosts are never created or destroyed, this manager only opens and
+    closes SSH connections to them. Connections are kept alive between
+    runs and re-established if they drop.
+
+    Config Parameters::
+
+      [hosts]
+      ; comma separated list of <address> or <address>:<port>
+      hosts = 10.0.0.1, 10.0.0.2, loadgen.example.com:2222
+      user_name = root
+      host_key = ~/.ssh/id_rsa
+      ssh_pwd = None
+
+      ; when attempting to gain an ssh connection, fail after
+      ; connection_attempts attempts, the wait between attempts
+      ; doubles every attempt up to max_backoff seconds
+      connection_attempts = 10
+      max_backoff = 30
+      connect_timeout = 10
+
+      ; seconds between ssh keepalive packets, 0 to disable
+      keepalive = 30
+
+      ; whether or not to compress ssh traffic, including uploads
+      compress = False
+
+      ; max number of hosts to connect to, upload to or run setup
+      ; on at once, commands always run on all hosts at once
+      max_parallel = 10
+
+      ; how to collect command output, "threads" uses a thread
+      ; per host, "poll" uses a single thread for all hosts
+      backend = threads
+
+      ; how to upload artifacts, "direct" uploads to every host,
+      ; "tree" uploads to `seeds` hosts which then pass uploads on
+      ; to `fanout` hosts at a time, serving them on
+      ; `distribution_port` and the ports after it
+      distribution = direct
+      seeds = 1
+      fanout = 2
+      distribution_port = 8765
+
+      ; whether commands wait to start on all hosts at the same
+      ; instant, each host's clock offset is measured and logged
+      ; first, start_delay is the seconds between sending the
+      ; command and starting it, long enough to reach every host
+      synchronized_start = False
+      start_delay = 2
+
+    """
+    name = "hosts"
+
+    def __init__(self, hosts="", **kwargs):
+        """
+        Constructor for :class:`employ.managers.hosts.HostsManager`
+
+        :param hosts: comma separated list of hosts to connect to
+        :type hosts: str
+        """
+        super(HostsManager, self).__init__(**kwargs)
+        if isinstance(hosts, basestring):
+            hosts = hosts.split(",")
+        self.host_list = [host.strip() for host in hosts if host.strip()]
+
+    def hosts(self):
+        """
+        Get list of configured hosts
+
+        :returns: list
+        """
+        return self.host_list
+
+    def setup_instances(self):
+        """
+        Establish SSH connections to all hosts
+        """
+        logger.info("using %s hosts", len(self.host_list))
+        self.connect_all(self.host_list)
+
+    def instance_state(self):
+        """
+        Get the list of hosts in use
+
+        :returns: list
+        """
+        return self.host_list
+
+    def attach_instances(self, state, connect=True):
+        """
+        Use the hosts from a warm pool
+
+        :param state: the hosts from :func:`instance_state`
+        :type state: list
+        :param connect: whether or not to connect to the hosts
+        :type connect: bool
+        """
+        self.host_list = state
+        if connect:
+            self.connect_all(self.host_list)
+
+    def cleanup_instances(self):
+        """
+        Close all open SSH connections.
+        """
+        self.close_connections()
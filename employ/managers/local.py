@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import subprocess
+
+from employ.logger import logger
+from employ.managers import Manager
+from employ.result import Result, now
+from employ.trace import tracer
+
+
+class LocalManager(Manager):
+    """
+    Employ Manager which runs commands as subprocesses on this machine
+
+    Config Parameters::
+
+      [local]
+      ; number of processes to run each command in,
+      ; defaults to the number of cpus on this machine
+      num_workers = 4
+
+      ; max number of processes to run at once,
+      ; defaults to num_workers
+      max_parallel = 4
+
+    """
+    name = "local"
+
+    def __init__(self, num_workers=None, max_parallel=None):
+        """
+        Constructor for :class:`employ.managers.local.LocalManager`
+
+        :param num_workers: the number of processes to run each command in
+        :type num_workers: int
+        :param max_parallel: the max number of processes to run at once
+        :type max_parallel: int
+        """
+        self.workers = []
+        self.num_workers = int(num_workers or multiprocessing.cpu_count())
+        self.max_parallel = int(max_parallel or self.num_workers)
+
+    def setup_instances(self):
+        """
+        Create `self.num_workers` workers.
+        """
+        logger.info("using %s local workers", self.num_workers)
+        self.workers = ["local-%s" % worker for worker in xrange(self.num_workers)]
+
+    def cleanup_instances(self):
+        """
+        Remove all workers.
+        """
+        self.workers = []
+
+    def hosts(self):
+        """
+        Get the names of all workers
+
+        :returns: list
+        """
+        return self.workers
+
+    def upload(self, path, remote_path=None):
+        """
+        Nothing needs uploading since all workers share this machine.
+
+        :param path: the local file, directory or tarball
+        :type path: str
+        :param remote_path: ignored
+        :type remote_path: str
+        :returns: str - `path`
+        """
+        return os.path.abspath(path)
+
+    def setup(self, script):
+        """
+        Run setup `script` once, since all workers share this machine.
+
+        :param script: the filename of the script to run
+        :type script: str
+        """
+        command = "/bin/sh %s" % script
+        with tracer.span("setup", script=script):
+            results = [self._run_command("local", command)]
+        for result in results:
+            tracer.add("setup_script", result.start, result.end, result.host, script=script)
+        self.validate_results(results, command)
+
+    def run(self, command, hosts=None):
+        """
+        Run :class:`employ.commands.Command` `command` in every worker.
+
+        :param hosts: only run `command` in these workers
+        :type hosts: list
+        :returns: the result of `command.finish`
+        """
+        execute = command.command()
+        workers = self.workers if hosts is None else hosts
+        results = self.imap_hosts(self._run_command, workers, execute)
+        return self.collect_results(command, (result for worker, result in results), execute)
+
+    def _run_command(self, worker, command):
+        """
+        Helper method for executing a single command in a subprocess
+
+        :returns: :class:`employ.result.Result`
+        """
+        logger.info("executing command %s", command)
+        start = now()
+        process = subprocess.Popen(
+            command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout, stderr = process.communicate()
+        return Result(worker, process.returncode, stdout, stderr, start, now())
+
+    def _run_multi(self, command):
+        """
+        Helper method for executing a command in all workers
+        """
+        results = self.map_hosts(self._run_command, self.workers, command)
+        return [result for worker, result in results]
@@ -0,0 +1,864 @@
+import hashlib
+import os
+import random
+import select
+import socket
+import tarfile
+import tempfile
+import threading
+import time
+from pipes import quote
+
+import paramiko
+from concurrent.futures import ThreadPoolExecutor
+
+from employ.logger import logger
+from employ.exceptions import EmployError, SSHConnectionError
+from employ.managers import Manager, file_digest, to_bool
+from employ.result import Result, now
+from employ.trace import tracer
+
+# exit statuses of the command fetching uploads from other hosts
+FETCH_DOWNLOAD_FAILED = 90
+FETCH_DIGEST_MISMATCH = 91
+
+
+class SSHManager(Manager):
+    """
+    Base class for managers which run commands on instances over SSH.
+
+    This is not a manager plugin itself, children must implement
+    :func:`hosts`, :func:`setup_instances` and :func:`cleanup_instances`
+    and use :func:`connect_all` and :func:`close_connections` to manage
+    the SSH connections to each host.
+
+    Hosts are given as "<address>" or "<address>:<port>".
+
+    Connections are kept open for the life of the manager and are
+    transparently re-established when they drop.
+    """
+    # number of bytes to read from a channel at a time
+    recv_size = 32768
+    # max seconds to wait for channel output before checking exit status
+    poll_interval = 0.1
+    # seconds to wait before the first ssh connection retry
+    backoff_base = 1
+    ssh_port = 22
+    # extensions of files which are extracted by :func:`upload`
+    tarball_extensions = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2")
+    # file recording the digest of uploaded directories and tarballs
+    digest_file = ".employ-digest"
+
+    def __init__(
+            self, user_name="root", host_key="~/.ssh/known_hosts", ssh_pwd=None,
+            connection_attempts=10, max_backoff=30, connect_timeout=10,
+            keepalive=30, compress=False, max_parallel=10, backend="threads",
+            distribution="direct", seeds=1, fanout=2, distribution_port=8765,
+            synchronized_start=False, start_delay=2
+    ):
+        """
+        Constructor for :class:`employ.managers.ssh.SSHManager`
+
+        :param user_name: the user to connect as
+        :type user_name: str
+        :param host_key: the private key file to authenticate with
+        :type host_key: str
+        :param ssh_pwd: the password to authenticate or unlock `host_key` with
+        :type ssh_pwd: str
+        :param connection_attempts: number of attempts before failing to connect
+        :type connection_attempts: int
+        :param max_backoff: max seconds to wait between connection attempts
+        :type max_backoff: float
+        :param connect_timeout: seconds to wait for a connection to open
+        :type connect_timeout: float
+        :param keepalive: seconds between keepalive packets, 0 to disable
+        :type keepalive: int
+        :param compress: whether or not to compress all ssh traffic
+        :type compress: bool
+        :param max_parallel: max number of hosts to connect to, upload to or
+            run setup on at once, commands always run on all hosts at once
+        :type max_parallel: int
+        :param backend: "threads" to collect output with a thread per host,
+            or "poll" to collect output from all hosts in a single thread
+        :type backend: str
+        :param distribution: "direct" to upload to every host from here,
+            or "tree" to upload to `seeds` hosts which pass it on to the rest
+        :type distribution: str
+        :param seeds: number of hosts to upload to from here with "tree"
+        :type seeds: int
+        :param fanout: number of hosts each host passes uploads on to at once
+        :type fanout: int
+        :param distribution_port: first port hosts serve uploads on with "tree"
+        :type distribution_port: int
+        :param synchronized_start: whether commands should wait and start
+            on all hosts at the same time, corrected for each host's clock
+        :type synchronized_start: bool
+        :param start_delay: seconds from sending a synchronized command
+            until it starts, must cover connecting to every host
+        :type start_delay: float
+        """
+        if backend not in ("threads", "poll"):
+            raise EmployError("Unknown backend: '%s'" % backend)
+        if distribution not in ("direct", "tree"):
+            raise EmployError("Unknown distribution: '%s'" % distribution)
+        self.client_connections = {}
+        self._sftp_clients = {}
+        self.user_name = user_name
+        self.host_key = host_key
+        self.ssh_pwd = ssh_pwd
+        self.connection_attempts = int(connection_attempts)
+        self.max_backoff = float(max_backoff)
+        self.connect_timeout = float(connect_timeout)
+        self.keepalive = int(keepalive)
+        self.compress = to_bool(compress)
+        self.max_parallel = int(max_parallel)
+        self.backend = backend
+        self.distribution = distribution
+        self.seeds = max(1, int(seeds))
+        self.fanout = max(1, int(fanout))
+        self.distribution_port = int(distribution_port)
+        self.synchronized_start = to_bool(synchronized_start)
+        self.start_delay = float(start_delay)
+        self.clock_offsets = {}
+        self.connect_time = None
+        # set to make connections still being retried give up
+        self._stop_connecting = threading.Event()
+
+    def hosts(self):
+        """
+        Get the list of hosts to run commands on.
+
+        All children must implement this method.
+
+        :returns: list
+        """
+        raise NotImplementedError()
+
+    def connect_all(self, hosts):
+        """
+        Establish SSH connections to all `hosts` in parallel.
+
+        :param hosts: the hosts to connect to
+        :type hosts: list
+        """
+        logger.info("establishing ssh connections")
+        start = time.time()
+        for host, client in self.map_hosts(self._connect, hosts):
+            self.client_connections[host] = client
+        self.connect_time = time.time() - start
+        logger.info(
+            "established %s ssh connections in %.2f seconds",
+            len(hosts), self.connect_time
+        )
+
+    def close_connections(self):
+        """
+        Close all open SSH connections.
+        """
+        for client, sftp_client in self._sftp_clients.values():
+            sftp_client.close()
+        self._sftp_clients = {}
+        for client in self.client_connections.values():
+            client.close()
+        self.client_connections = {}
+
+    def detach_instances(self):
+        """
+        Close all open SSH connections, leaving the hosts running.
+        """
+        self.close_connections()
+
+    def client(self, host):
+        """
+        Get the SSH connection for `host`, reconnecting if it was dropped.
+
+        :param host: the host to get the connection for
+        :type host: str
+        :returns: :class:`paramiko.SSHClient`
+        """
+        client = self.client_connections.get(host)
+        transport = client.get_transport() if client else None
+        if not transport or not transport.is_active():
+            if client:
+                logger.info("reconnecting to %s@%s", self.user_name, host)
+                client.close()
+            client = self.client_connections[host] = self._connect(host)
+        return client
+
+    def sftp(self, host):
+        """
+        Get an SFTP session for `host`, the same session is reused until
+        the connection to `host` is closed.
+
+        :param host: the host to get the session for
+        :type host: str
+        :returns: :class:`paramiko.SFTPClient`
+        """
+        client = self.client(host)
+        cached = self._sftp_clients.get(host)
+        if cached and cached[0] is client:
+            return cached[1]
+        sftp_client = client.open_sftp()
+        self._sftp_clients[host] = (client, sftp_client)
+        return sftp_client
+
+    def upload(self, path, remote_path=None):
+        """
+        Upload the file, directory or tarball at `path` to all hosts.
+
+        Directories and tarballs are extracted into `remote_path` on each
+        host. Hosts which already have an identical copy, by sha256 digest,
+        are skipped.
+
+        With the "tree" distribution `path` is only uploaded to `seeds`
+        hosts from here, every host which has a copy then serves it over
+        HTTP to `fanout` more hosts at a time until all hosts have it.
+        Hosts need `python` or `python3` to serve and `curl` or `wget`
+        to fetch, and must be able to reach each other on
+        `distribution_port` and the ports after it. Every copy is checked
+        against the sha256 digest of the original.
+
+        By default files are uploaded to `/tmp/<name>`, directories to
+        `/tmp/<name>/` and tarballs are extracted into `/tmp/<name>/`,
+        where <name> is the tarball's name without its extension.
+
+        :param path: the local file, directory or tarball to upload
+        :type path: str
+        :param remote_path: where to put `path` on each host
+        :type remote_path: str
+        :returns: str - where `path` is on each host
+        """
+        path = os.path.abspath(path)
+        name = os.path.basename(path)
+        tarball = self._is_tarball(path)
+        if tarball:
+            name = name[:-len(tarball)]
+        if remote_path is None:
+            remote_path = "/tmp/%s" % name
+        with tracer.span("upload", path=path):
+            digest = path_digest(path)
+            hosts = []
+            for host, current in self.map_hosts(
+                    self._remote_digest, self.hosts(), path, remote_path
+            ):
+                if current == digest:
+                    logger.info("%s is up to date on %s", remote_path, host)
+                else:
+                    hosts.append(host)
+
+            if self.distribution == "tree" and len(hosts) > self.seeds:
+                self._distribute(hosts, path, remote_path, digest)
+            else:
+                self.map_hosts(self._upload, hosts, path, remote_path, digest)
+        return remote_path
+
+    def peer_address(self, host):
+        """
+        Get the address other hosts should use to reach `host`.
+
+        :param host: the host to get the address of
+        :type host: str
+        :returns: str
+        """
+        return self._address(host)[0]
+
+    def setup(self, script):
+        """
+        Run setup `script` on all hosts.
+
+        Upload `script` to each host and execute.
+
+        :param script: the filename of the script to upload and run
+        :type script: str
+        """
+        if not self.setup_changed(script):
+            logger.info("skipping unchanged setup script %s", script)
+            return
+
+        with tracer.span("setup", script=script):
+            remote_file = self.upload(script)
+
+            command = "/bin/sh %s" % remote_file
+            results = self._run_multi(command)
+            for result in results:
+                tracer.add("setup_script", result.start, result.end, result.host, script=script)
+            self.validate_results(results, command)
+        self.setup_done(script)
+
+    def run(self, command, hosts=None):
+        """
+        Run :class:`employ.commands.Command` `command` on all hosts.
+
+        `command` runs on all hosts at once, `max_parallel` only limits
+        connecting, uploading and setup. With the "threads" backend
+        `command` runs on its own pool with a thread for every host.
+
+        With `synchronized_start` the clock of every host is measured
+        first and `command` then starts on all hosts at the same instant,
+        `start_delay` seconds from now.
+
+        :param hosts: only run `command` on these hosts
+        :type hosts: list
+        :returns: the result of `command.finish`
+        """
+        if hosts is None:
+            hosts = self.hosts()
+        execute = command.command()
+        start_at = None
+        if self.synchronized_start:
+            self.measure_clock_offsets(hosts)
+            start_at = time.time() + self.start_delay
+            logger.info("starting on all hosts in %.2f seconds", self.start_delay)
+        executor = None
+        if self.backend == "threads" and hosts:
+            executor = ThreadPoolExecutor(max_workers=len(hosts))
+        try:
+            results = self._iter_multi(
+                execute, callback=command.output, start_at=start_at, hosts=hosts,
+                executor=executor,
+            )
+            return self.collect_results(command, results, execute)
+        finally:
+            if executor:
+                # commands left running after a failure finish in the background
+                executor.shutdown(wait=False)
+
+    def measure_clock_offsets(self, hosts=None):
+        """
+        Measure how far the clock of each host is ahead of the local clock
+
+        Each host's clock is read a few times and the reading with the
+        shortest round trip is compared against the middle of that round
+        trip, so each offset is accurate to within half of its round trip.
+
+        :param hosts: only measure these hosts, defaults to all hosts
+        :type hosts: list
+        :returns: dict - {host: offset in seconds, ...}
+        """
+        with tracer.span("clock_offsets"):
+            offsets = self.map_hosts(self._clock_offset, hosts or self.hosts())
+        measured = {}
+        for host, (offset, round_trip) in offsets:
+            logger.info(
+                "clock on %s is %+.4f seconds off (+/- %.4f)", host, offset, round_trip / 2
+            )
+            measured[host] = offset
+        self.clock_offsets.update(measured)
+        return measured
+
+    def _address(self, host):
+        """
+        Helper method to split `host` into its address and port
+
+        :returns: tuple - (address, port)
+        """
+        address, _, port = host.partition(":")
+        return (address, int(port or self.ssh_port))
+
+    def _ssh_port_ready(self, host):
+        """
+        Helper method to check whether `host` accepts connections on its ssh port
+
+        :returns: bool
+        """
+        try:
+            sock = socket.create_connection(self._address(host), self.connect_timeout)
+        except socket.error:
+            return False
+        sock.close()
+        return True
+
+    def _backoff(self, attempt):
+        """
+        Helper method to get the number of seconds to wait before retrying a connection
+
+        Doubles with every attempt up to `max_backoff`, with half of
+        the delay randomized so hosts do not retry in lockstep.
+
+        :param attempt: the number of attempts already made
+        :type attempt: int
+        :returns: float
+        """
+        delay = min(self.max_backoff, self.backoff_base * 2 ** attempt)
+        return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+    def _connect(self, host):
+        """
+        Helper method to establish an ssh connection to `host`
+
+        An attempt is made as soon as the host's ssh port accepts
+        connections, retrying with :func:`_backoff` between attempts.
+        Retrying stops early once `_stop_connecting` is set.
+
+        :returns: :class:`paramiko.SSHClient`
+        :raises: :class:`employ.exceptions.SSHConnectionError`
+        """
+        address, port = self._address(host)
+        start = now()
+        for attempt in xrange(self.connection_attempts):
+            if self._stop_connecting.is_set():
+                tracer.add("connect", start, now(), host, attempts=attempt, failed=True)
+                raise SSHConnectionError("Stopped connecting to %s@%s" % (self.user_name, host))
+            if self._ssh_port_ready(host):
+                logger.info("Attempting connection to %s@%s", self.user_name, host)
+                client = paramiko.SSHClient()
+                client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                try:
+                    client.connect(
+                        address, port=port, username=self.user_name,
+                        key_filename=self.host_key, password=self.ssh_pwd,
+                        timeout=self.connect_timeout, compress=self.compress
+                    )
+                    if self.keepalive:
+                        client.get_transport().set_keepalive(self.keepalive)
+                    tracer.add("connect", start, now(), host, attempts=attempt + 1)
+                    return client
+                except Exception:
+                    client.close()
+            if attempt + 1 < self.connection_attempts:
+                self._stop_connecting.wait(self._backoff(attempt))
+        tracer.add("connect", start, now(), host, attempts=self.connection_attempts, failed=True)
+        raise SSHConnectionError(
+            "Could not establish ssh connection to %s@%s after %s attempts" % (
+                self.user_name, host, self.connection_attempts
+            )
+        )
+
+    def _clock_offset(self, host, samples=3):
+        """
+        Helper method to measure the clock offset of a single host
+
+        :returns: tuple - (offset, round trip) in seconds
+        """
+        best = None
+        for _ in xrange(samples):
+            sent = time.time()
+            output = self._run_command(host, "date +%s.%N").stdout.strip()
+            received = time.time()
+            try:
+                remote = float(output)
+            except ValueError:
+                raise EmployError("Could not read the clock on %s: %r" % (host, output))
+            round_trip = received - sent
+            if best is None or round_trip < best[1]:
+                best = (remote - (sent + received) / 2.0, round_trip)
+        return best
+
+    def _wait_until(self, host, start_at, command):
+        """
+        Helper method to make `command` wait on `host` until the local
+        time `start_at` before starting
+        """
+        deadline = start_at + self.clock_offsets.get(host, 0)
+        return (
+            "sleep $(echo \"%.6f $(date +%%s.%%N)\" | "
+            "awk '{d = $1 - $2; print (d > 0 ? d : 0)}'); %s"
+        ) % (deadline, command)
+
+    def _open_channel(self, host, command, start_at=None):
+        """
+        Helper method for starting a single command on a host
+
+        :param start_at: optional local time.time() for the command to start at
+        :type start_at: float
+        :returns: tuple - (:class:`paramiko.Channel`, start time)
+        """
+        start = now()
+        if start_at is not None:
+            wait = start_at - time.time()
+            if wait < 0:
+                logger.warning("%s started %.3f seconds late", host, -wait)
+            start += max(wait, 0)
+        transport = self.client(host).get_transport()
+        channel = transport.open_session()
+        logger.info("executing command %s", command)
+        if start_at is not None:
+            command = self._wait_until(host, start_at, command)
+        channel.get_pty()
+        channel.exec_command(command)
+        return (channel, start)
+
+    def _read_channel(self, channel, stdout, stderr, callback=None):
+        """
+        Helper method for reading any available output from `channel`
+
+        Output is appended to the `stdout` and `stderr` lists.
+
+        :returns: bool - whether anything was read
+        """
+        read = False
+        if channel.recv_ready():
+            data = channel.recv(self.recv_size)
+            stdout.append(data)
+            read = True
+            if callback:
+                callback("stdout", data)
+        if channel.recv_stderr_ready():
+            data = channel.recv_stderr(self.recv_size)
+            stderr.append(data)
+            read = True
+            if callback:
+                callback("stderr", data)
+        return read
+
+    def _channel_done(self, channel):
+        """
+        Helper method to check whether the command on `channel` exited
+        and all of its output has been read
+
+        :returns: bool
+        """
+        return (
+            channel.exit_status_ready() and
+            not channel.recv_ready() and
+            not channel.recv_stderr_ready()
+        )
+
+    def _close_channel(self, host, channel, start, stdout, stderr):
+        """
+        Helper method for closing a finished `channel`
+
+        :returns: :class:`employ.result.Result`
+        """
+        status = int(channel.recv_exit_status())
+        channel.close()
+        return Result(host, status, "".join(stdout), "".join(stderr), start, now())
+
+    def _run_command(self, host, command, callback=None, start_at=None):
+        """
+        Helper method for executing a single command on a host
+
+        stdout and stderr are read together while the command is running,
+        so the remote side never blocks on a full channel window.
+
+        :param callback: optional callable called as `callback(stream, data)`
+            with each chunk read, where `stream` is "stdout" or "stderr"
+        :type callback: callable
+        :param start_at: optional local time.time() for the command to start at
+        :type start_at: float
+        :returns: :class:`employ.result.Result`
+        """
+        channel, start = self._open_channel(host, command, start_at)
+        stdout = []
+        stderr = []
+        while not self._channel_done(channel):
+            if not self._read_channel(channel, stdout, stderr, callback):
+                select.select([channel], [], [], self.poll_interval)
+        return self._close_channel(host, channel, start, stdout, stderr)
+
+    def _run_multi(self, command, callback=None):
+        """
+        Helper method for executing a command across all hosts
+
+        :param callback: optional callable passed to :func:`_run_command`
+        :type callback: callable
+        :returns: list - [:class:`employ.result.Result`, ...]
+        """
+        return list(self._iter_multi(command, callback))
+
+    def _iter_multi(self, command, callback=None, start_at=None, hosts=None, executor=None):
+        """
+        Helper method for executing a command across all hosts, yielding
+        each :class:`employ.result.Result` as soon as its host finishes
+
+        :param callback: optional callable passed to :func:`_run_command`
+        :type callback: callable
+        :param start_at: optional local time.time() for the command to start at
+        :type start_at: float
+        :param hosts: only execute the command on these hosts
+        :type hosts: list
+        :param executor: the thread pool to run the "threads" backend on,
+            defaults to :func:`executor`
+        :type executor: :class:`concurrent.futures.ThreadPoolExecutor`
+        """
+        if hosts is None:
+            hosts = self.hosts()
+        if self.backend == "poll":
+            return self._iter_multi_poll(command, callback, start_at, hosts)
+        results = self._imap_hosts(
+            executor or self.executor(), self._run_command, hosts, command, callback, start_at
+        )
+        return (result for host, result in results)
+
+    def _iter_multi_poll(self, command, callback=None, start_at=None, hosts=None):
+        """
+        Helper method for executing a command across all hosts from one thread
+
+        Commands are started using the thread pool, after which the output
+        from every host is collected by a single poll loop rather than
+        by a thread per host.
+
+        :param callback: optional callable called as `callback(stream, data)`
+        :type callback: callable
+        :param start_at: optional local time.time() for the command to start at
+        :type start_at: float
+        :param hosts: only execute the command on these hosts
+        :type hosts: list
+        """
+        poller = select.poll()
+        running = {}
+        opened = self.map_hosts(
+            self._open_channel, self.hosts() if hosts is None else hosts, command, start_at
+        )
+        for host, (channel, start) in opened:
+            running[channel.fileno()] = (host, channel, start, [], [])
+            poller.register(channel, select.POLLIN)
+
+        try:
+            while running:
+                idle = True
+                for fileno, (host, channel, start, stdout, stderr) in running.items():
+                    if self._read_channel(channel, stdout, stderr, callback):
+                        idle = False
+                    elif self._channel_done(channel):
+                        poller.unregister(fileno)
+                        del running[fileno]
+                        yield self._close_channel(host, channel, start, stdout, stderr)
+                if idle and running:
+                    poller.poll(self.poll_interval * 1000)
+        finally:
+            for host, channel, start, stdout, stderr in running.values():
+                channel.close()
+
+    def _is_tarball(self, path):
+        """
+        Helper method to get the tarball extension of `path`
+
+        :returns: str - the extension or None if `path` is not a tarball
+        """
+        if os.path.isfile(path):
+            for extension in self.tarball_extensions:
+                if path.endswith(extension):
+                    return extension
+        return None
+
+    def _remote_digest(self, host, path, remote_path):
+        """
+        Helper method to get the digest of the copy of `path` on `host`
+
+        :returns: str - the digest or None if there is no copy
+        """
+        if os.path.isdir(path) or self._is_tarball(path):
+            command = "cat %s 2>/dev/null" % quote("%s/%s" % (remote_path, self.digest_file))
+        else:
+            command = "sha256sum %s 2>/dev/null" % quote(remote_path)
+        output = self._run_command(host, command).stdout.split()
+        return output[0] if output else None
+
+    def _staging_path(self, path, digest):
+        """
+        Helper method to get where to upload `path` on a host before
+        it is moved or extracted into place
+        """
+        extension = ".tar.gz" if os.path.isdir(path) else self._is_tarball(path) or ""
+        return "/tmp/employ-%s%s" % (digest, extension)
+
+    def _upload(self, host, path, remote_path, digest):
+        """
+        Helper method to upload `path` to a single host
+        """
+        logger.info("uploading %s to %s:%s", path, host, remote_path)
+        if not self._is_tarball(path) and not os.path.isdir(path):
+            self._put_file(host, path, remote_path)
+            return
+
+        staging = self._staging_path(path, digest)
+        if os.path.isdir(path):
+            # stream a compressed tarball of the directory
+            with tracer.span("put_file", host, path=path):
+                remote_fp = self.sftp(host).open(staging, "wb")
+                try:
+                    with tarfile.open(fileobj=remote_fp, mode="w|gz") as archive:
+                        archive.add(path, arcname=".")
+                finally:
+                    remote_fp.close()
+        else:
+            self._put_file(host, path, staging)
+        self._place(host, path, staging, remote_path, digest)
+
+    def _place(self, host, path, staging, remote_path, digest):
+        """
+        Helper method to move or extract an upload of `path` from
+        `staging` to `remote_path` on a host
+        """
+        if not self._is_tarball(path) and not os.path.isdir(path):
+            command = "mv -f %s %s" % (quote(staging), quote(remote_path))
+        else:
+            # extract next to `remote_path` and then swap it in
+            extracted = quote(remote_path + ".employ-new")
+            command = (
+                "rm -rf {extracted} && mkdir -p {extracted} && "
+                "tar xf {staging} -C {extracted} && "
+                "printf %s {digest} > {extracted}/{digest_file} && rm -f {staging} && "
+                "rm -rf {remote} && mv {extracted} {remote}"
+            ).format(
+                extracted=extracted, staging=quote(staging), digest=digest,
+                digest_file=self.digest_file, remote=quote(remote_path),
+            )
+        with tracer.span("place", host, path=path):
+            result = self._run_command(host, command)
+        self.validate_results([result], command)
+
+    def _distribute(self, hosts, path, remote_path, digest):
+        """
+        Helper method to upload `path` to `seeds` of `hosts` and have
+        hosts pass it on to each other until all of `hosts` have it
+        """
+        staging = self._staging_path(path, digest)
+        payload = path
+        if os.path.isdir(path):
+            fd, payload = tempfile.mkstemp(suffix=".tar.gz")
+            with os.fdopen(fd, "wb") as fp:
+                with tarfile.open(fileobj=fp, mode="w:gz") as archive:
+                    archive.add(path, arcname=".")
+
+        try:
+            payload_digest = file_digest(payload)
+            sources = hosts[:self.seeds]
+            pending = hosts[self.seeds:]
+            logger.info("uploading %s to %s seed hosts", path, len(sources))
+            self.map_hosts(self._put_file, sources, payload, staging)
+
+            servers = {}
+            failed = []
+            try:
+                while pending:
+                    for source in sources:
+                        if source not in servers:
+                            port = self.distribution_port + len(servers)
+                            servers[source] = (port, self._serve(source, staging, port))
+
+                    assigned = {}
+                    for source in sources:
+                        for _ in xrange(self.fanout):
+                            if pending:
+                                assigned[pending.pop(0)] = source
+                    logger.info(
+                        "passing %s on from %s hosts to %s hosts",
+                        path, len(sources), len(assigned)
+                    )
+                    fetched = self.map_hosts(
+                        self._fetch, assigned.keys(), assigned, servers, staging, payload_digest
+                    )
+                    for host, ok in fetched:
+                        if ok:
+                            sources.append(host)
+                        else:
+                            failed.append(host)
+            finally:
+                self.map_hosts(self._stop_serving, servers.keys(), servers, staging)
+
+            if failed:
+                logger.warning(
+                    "tree distribution of %s failed on %s of %s hosts, uploading directly to %s",
+                    path, len(failed), len(hosts), ", ".join(failed)
+                )
+                start = now()
+                self.map_hosts(self._put_file, failed, payload, staging)
+                # one span per host so the profile counts the fallbacks
+                end = now()
+                for host in failed:
+                    tracer.add("fallback_upload", start, end, host, path=path)
+            self.map_hosts(self._place, hosts, path, staging, remote_path, digest)
+        finally:
+            if payload != path:
+                os.remove(payload)
+
+    def _serve(self, host, staging, port):
+        """
+        Helper method to start serving `staging` over HTTP on `port` of `host`
+
+        :returns: str - the pid of the server
+        """
+        directory = "%s.employ-serve" % staging
+        command = (
+            "mkdir -p {directory} && ln -f {staging} {directory}/ && cd {directory} && "
+            "if command -v python3 >/dev/null 2>&1; then server='python3 -m http.server'; "
+            "else server='python -m SimpleHTTPServer'; fi && "
+            "(nohup $server {port} >/dev/null 2>&1 & echo $!)"
+        ).format(directory=quote(directory), staging=quote(staging), port=port)
+        result = self._run_command(host, command)
+        self.validate_results([result], command)
+        return result.stdout.strip()
+
+    def _stop_serving(self, host, servers, staging):
+        """
+        Helper method to stop the HTTP server started by :func:`_serve`
+        """
+        port, pid = servers[host]
+        directory = "%s.employ-serve" % staging
+        self._run_command(host, "kill %s; rm -rf %s" % (quote(pid), quote(directory)))
+
+    def _fetch(self, host, assigned, servers, staging, payload_digest):
+        """
+        Helper method to fetch `staging` on `host` from the host it was assigned
+
+        Failures are logged as warnings with their reason and recorded
+        on the host's "fetch" span.
+
+        :returns: bool - whether the fetched copy matches `payload_digest`
+        """
+        source = assigned[host]
+        port, pid = servers[source]
+        url = "http://%s:%s/%s" % (
+            self.peer_address(source), port, os.path.basename(staging)
+        )
+        partial = "%s.employ-partial" % staging
+        command = (
+            "fetched=; for attempt in 1 2 3 4 5; do "
+            "(curl -sf -o {partial} {url} || wget -q -O {partial} {url}) && fetched=1 && break; "
+            "sleep 1; done; [ -n \"$fetched\" ] || exit {download}; "
+            "echo '{digest}  {partial}' | sha256sum -c - >/dev/null 2>&1 || exit {mismatch}; "
+            "mv -f {partial} {staging}"
+        ).format(
+            partial=quote(partial), url=quote(url), digest=payload_digest,
+            staging=quote(staging), download=FETCH_DOWNLOAD_FAILED,
+            mismatch=FETCH_DIGEST_MISMATCH,
+        )
+        start = now()
+        result = self._run_command(host, command)
+        reason = None
+        if result.status == FETCH_DOWNLOAD_FAILED:
+            reason = "download failed after 5 attempts"
+        elif result.status == FETCH_DIGEST_MISMATCH:
+            reason = "sha256 of the download does not match"
+        elif result.status != 0:
+            reason = "exit status %s: %s" % (result.status, result.stderr.strip())
+        tracer.add(
+            "fetch", start, now(), host, source=source,
+            failed=reason is not None, reason=reason,
+        )
+        if reason is not None:
+            logger.warning("failed to fetch %s on %s from %s: %s", url, host, source, reason)
+        return reason is None
+
+    def _put_file(self, host, script, remote_file):
+        """
+        Helper method to upload a file to a host
+        """
+        with tracer.span("put_file", host, path=script):
+            with open(script, "rb") as fp:
+                self.sftp(host).putfo(fp, remote_file)
+
+
+def path_digest(path):
+    """
+    Helper function to get the sha256 hex digest of a file or directory
+
+    The digest of a directory covers the names and contents of all files in it.
+
+    :returns: str
+    """
+    if not os.path.isdir(path):
+        return file_digest(path)
+    digest = hashlib.sha256()
+    for root, directories, files in os.walk(path):
+        directories.sort()
+        for name in sorted(files):
+            filename = os.path.join(root, name)
+            relative = os.path.relpath(filename, path)
+            if os.path.islink(filename):
+                digest.update("%s -> %s\n" % (relative, os.readlink(filename)))
+            else:
+                digest.update("%s %s\n" % (relative, file_digest(filename)))
+    return digest.hexdigest()
@@ -0,0 +1,178 @@
+import ast
+import collections
+import importlib
+import json
+import os
+
+from employ.exceptions import EmployError
+from employ.logger import logger
+
+# set to the filename of a json file to cache plugin indexes in
+CACHE_ENV = "EMPLOY_PLUGIN_CACHE"
+
+
+class PluginRegistry(collections.Mapping):
+    """
+    Lazy mapping of plugin names to plugin classes in a namespace package.
+
+    The modules of the namespace package are read, not imported, to find
+    every class with a `name = "<name>"` attribute, which gives an index
+    of names to import paths. A plugin's module is only imported when the
+    plugin itself is looked up, so listing plugins never imports them.
+
+    When the environment variable `EMPLOY_PLUGIN_CACHE` is set to a
+    filename, indexes are cached in it and only rebuilt once a module
+    in the namespace package changes.
+    """
+
+    def __init__(self, namespace, base_cls):
+        """
+        Constructor for :class:`employ.plugins.PluginRegistry`
+
+        :param namespace: the namespace package to find plugins in
+        :type namespace: str
+        :param base_cls: the class all plugins must inherit from
+        :type base_cls: type
+        """
+        self.namespace = namespace
+        self.base_cls = base_cls
+        self._index = None
+        self._loaded = {}
+
+    def index(self):
+        """
+        Get the index of all plugins in the namespace package
+
+        :returns: dict - {name: "<module>:<class>"}
+        """
+        if self._index is None:
+            self._index = self._build_index()
+        return self._index
+
+    def load(self, name):
+        """
+        Import and return the plugin class called `name`
+
+        :param name: the name of the plugin
+        :type name: str
+        :returns: type
+        :raises: KeyError when there is no such plugin,
+            :class:`employ.exceptions.EmployError` when it cannot be imported
+        """
+        if name not in self._loaded:
+            module_name, _, cls_name = self.index()[name].partition(":")
+            try:
+                module = importlib.import_module(module_name)
+            except ImportError, e:
+                raise EmployError("Could not load '%s' from %s: %s" % (name, module_name, e))
+            cls = getattr(module, cls_name, None)
+            if not isinstance(cls, type) or not issubclass(cls, self.base_cls):
+                raise EmployError("'%s' in %s is not a plugin" % (cls_name, module_name))
+            self._loaded[name] = cls
+        return self._loaded[name]
+
+    def __getitem__(self, name):
+        return self.load(name)
+
+    def __contains__(self, name):
+        return name in self.index()
+
+    def __iter__(self):
+        return iter(sorted(self.index()))
+
+    def __len__(self):
+        return len(self.index())
+
+    def _modules(self):
+        """
+        Helper method to find the modules of the namespace package
+
+        Modules found first win, like they do when importing.
+
+        :returns: list - [(module name, filename), ...]
+        """
+        package = importlib.import_module(self.namespace)
+        modules = []
+        seen = set()
+        for directory in package.__path__:
+            if not os.path.isdir(directory):
+                continue
+            for entry in sorted(os.listdir(directory)):
+                filename = os.path.join(directory, entry)
+                if os.path.isdir(filename):
+                    base = entry
+                    filename = os.path.join(filename, "__init__.py")
+                    if not os.path.isfile(filename):
+                        continue
+                else:
+                    base, extension = os.path.splitext(entry)
+                    if base == "__init__" or extension != ".py":
+                        continue
+                if base not in seen:
+                    seen.add(base)
+                    modules.append(("%s.%s" % (self.namespace, base), filename))
+        return modules
+
+    def _build_index(self):
+        """
+        Helper method to build the index, from the cache when it is up to date
+        """
+        modules = self._modules()
+        stamps = dict(
+            (filename, os.stat(filename).st_mtime) for module_name, filename in modules
+        )
+        cache_file = os.environ.get(CACHE_ENV)
+        cache = {}
+        if cache_file and os.path.isfile(cache_file):
+            try:
+                with open(cache_file, "r") as fp:
+                    cache = json.load(fp)
+            except ValueError:
+                cache = {}
+            cached = cache.get(self.namespace)
+            if cached and cached["stamps"] == stamps:
+                return cached["plugins"]
+
+        plugins = {}
+        for module_name, filename in modules:
+            for name, cls_name in _find_plugins(filename):
+                plugins.setdefault(name, "%s:%s" % (module_name, cls_name))
+
+        if cache_file:
+            cache[self.namespace] = {"stamps": stamps, "plugins": plugins}
+            try:
+                with open(cache_file, "w") as fp:
+                    json.dump(cache, fp)
+            except (IOError, OSError), e:
+                logger.info("could not write plugin cache %s: %s", cache_file, e)
+        return plugins
+
+
+def _find_plugins(filename):
+    """
+    Helper function to find the classes in a module which set a `name`
+
+    :returns: list - [(name, class name), ...]
+    """
+    with open(filename, "r") as fp:
+        source = fp.read()
+    try:
+        tree = ast.parse(source, filename)
+    except SyntaxError:
+        return []
+
+    plugins = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef) or not node.bases:
+            continue
+        for statement in node.body:
+            if (
+                    isinstance(statement, ast.Assign) and
+                    isinstance(statement.value, ast.Str) and
+                    any(
+                        isinstance(target, ast.Name) and target.id == "name"
+                        for target in statement.targets
+                    )
+            ):
+                plugins.append((statement.value.s, node.name))
+    return plugins
@@ -0,0 +1,67 @@
+import time
+
+# monotonic clock where available, wall clock otherwise
+now = getattr(time, "monotonic", time.time)
+
+
+class Result(object):
+    """
+    Result of running a command on a single host.
+
+    Results can be unpacked like the (status, stdout, stderr) tuples
+    used by older commands::
+
+      status, stdout, stderr = result
+
+    Commands which parse `stdout` keep the parsed output in `parsed`,
+    see :func:`employ.commands.Command.parse`.
+    """
+    __slots__ = ("host", "status", "stdout", "stderr", "start", "end", "transferred", "parsed")
+
+    def __init__(self, host, status, stdout, stderr, start, end, transferred=None):
+        """
+        Constructor for :class:`employ.result.Result`
+
+        :param host: the host the command was run on
+        :type host: str
+        :param status: the exit status of the command
+        :type status: int
+        :param stdout: the stdout of the command
+        :type stdout: str
+        :param stderr: the stderr of the command
+        :type stderr: str
+        :param start: when the command was started, from :func:`now`
+        :type start: float
+        :param end: when the command finished, from :func:`now`
+        :type end: float
+        :param transferred: number of bytes received from the host,
+            defaults to the size of `stdout` and `stderr`
+        :type transferred: int
+        """
+        self.host = host
+        self.status = status
+        self.stdout = stdout
+        self.stderr = stderr
+        self.start = start
+        self.end = end
+        if transferred is None:
+            transferred = len(stdout) + len(stderr)
+        self.transferred = transferred
+        self.parsed = None
+
+    @property
+    def duration(self):
+        """
+        Number of seconds the command took.
+
+        :returns: float
+        """
+        return self.end - self.start
+
+    def __iter__(self):
+        return iter((self.status, self.stdout, self.stderr))
+
+    def __repr__(self):
+        return "<Result host=%r status=%r duration=%.3f transferred=%r>" % (
+            self.host, self.status, self.duration, self.transferred
+        )
@@ -0,0 +1,310 @@
+import csv
+import gzip
+import json
+import os
+import threading
+import time
+
+from employ.exceptions import EmployError
+from employ.result import now
+
+# columns of the rows written by :class:`CSVSink` and :class:`ParquetSink`
+COLUMNS = (
+    "section", "command", "stage", "host", "status",
+    "start", "end", "duration", "metric", "value", "text",
+)
+
+
+class Sink(object):
+    """
+    Base class for writing the result from every host to a file as it arrives.
+
+    Each result is written and then dropped, so memory use does not
+    grow with the number of hosts, stages or runs. A result is written
+    as a record::
+
+      {
+        "section": "<config section>", "command": "<command name>",
+        "stage": <scheduled value or None>, "host": "<host>",
+        "status": <exit status>, "start": <unix time>, "end": <unix time>,
+        "duration": <seconds>, "metrics": {<metric>: <number>, ...},
+        "stdout": "<raw stdout>", "stderr": "<raw stderr>"
+      }
+
+    where "metrics" are parsed by :func:`employ.commands.Command.metrics`.
+    Sinks can be written to from multiple threads at once.
+    """
+
+    def __init__(self, filename, raw=True):
+        """
+        Constructor for :class:`employ.sinks.Sink`
+
+        :param filename: the file to write to
+        :type filename: str
+        :param raw: whether or not to write each host's stdout and stderr
+        :type raw: bool
+        """
+        self.filename = filename
+        self.raw = raw
+        self.records = 0
+        # offset from :func:`employ.result.now` to unix time
+        self._clock = time.time() - now()
+        self._lock = threading.Lock()
+
+    def add(self, command, result):
+        """
+        Write the result of running `command` on a single host
+
+        :param command: the command that was run
+        :type command: :class:`employ.commands.Command`
+        :param result: the result from a single host
+        :type result: :class:`employ.result.Result`
+        """
+        record = {
+            "section": command.section or command.name,
+            "command": command.name,
+            "stage": getattr(command, command.schedule) if command.schedule else None,
+            "host": result.host,
+            "status": result.status,
+            "start": result.start + self._clock,
+            "end": result.end + self._clock,
+            "duration": result.duration,
+            "metrics": command.metrics(result),
+        }
+        if self.raw:
+            record["stdout"] = _text(result.stdout)
+            record["stderr"] = _text(result.stderr)
+        with self._lock:
+            self.write(record)
+            self.records += 1
+
+    def write(self, record):
+        """
+        Method to write a single record, see :class:`employ.sinks.Sink`
+
+        All children must implement this method.
+
+        :param record: the record to write
+        :type record: dict
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Method to flush and close the file, called once all results were added
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class JSONLSink(Sink):
+    """
+    :class:`employ.sinks.Sink` writing one JSON record per line,
+    gzip compressed when `filename` ends with ".gz"
+
+    Loading::
+
+      pandas.read_json("results.jsonl.gz", lines=True)
+
+    """
+
+    def __init__(self, filename, raw=True):
+        super(JSONLSink, self).__init__(filename, raw)
+        self._fp = _open(filename)
+
+    def write(self, record):
+        self._fp.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def close(self):
+        self._fp.close()
+
+
+class CSVSink(Sink):
+    """
+    :class:`employ.sinks.Sink` writing CSV with one row per metric,
+    gzip compressed when `filename` ends with ".gz"
+
+    The columns are :data:`employ.sinks.COLUMNS`, which stay the same
+    whichever commands are run. Metrics are in the "metric" and
+    "value" columns, raw output is in the "text" column of the
+    "stdout" and "stderr" rows.
+
+    Loading::
+
+      frame = pandas.read_csv("results.csv.gz")
+      frame.pivot_table(index=["section", "stage", "host"], columns="metric", values="value")
+
+    """
+
+    def __init__(self, filename, raw=True):
+        super(CSVSink, self).__init__(filename, raw)
+        self._fp = _open(filename)
+        self._writer = csv.writer(self._fp)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, record):
+        for row in _rows(record):
+            self._writer.writerow([
+                value.encode("utf-8") if isinstance(value, unicode) else value
+                for value in row
+            ])
+
+    def close(self):
+        self._fp.close()
+
+
+class ParquetSink(Sink):
+    """
+    :class:`employ.sinks.Sink` writing compressed columnar Parquet with
+    the same rows and columns as :class:`employ.sinks.CSVSink`
+
+    Requires `pyarrow`. Rows are buffered and written `row_group_size`
+    at a time, so at most that many rows are held in memory.
+
+    Loading::
+
+      pandas.read_parquet("results.parquet")
+
+    """
+
+    def __init__(self, filename, raw=True, row_group_size=10000, compression="snappy"):
+        """
+        Constructor for :class:`employ.sinks.ParquetSink`
+
+        :param filename: the file to write to
+        :type filename: str
+        :param raw: whether or not to write each host's stdout and stderr
+        :type raw: bool
+        :param row_group_size: number of rows to buffer before writing them
+        :type row_group_size: int
+        :param compression: the Parquet compression codec to use
+        :type compression: str
+        :raises: :class:`employ.exceptions.EmployError` when `pyarrow` is not installed
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise EmployError("Writing Parquet requires pyarrow, `pip install pyarrow`")
+        super(ParquetSink, self).__init__(filename, raw)
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema([
+            pyarrow.field("section", pyarrow.string()),
+            pyarrow.field("command", pyarrow.string()),
+            pyarrow.field("stage", pyarrow.float64()),
+            pyarrow.field("host", pyarrow.string()),
+            pyarrow.field("status", pyarrow.int64()),
+            pyarrow.field("start", pyarrow.float64()),
+            pyarrow.field("end", pyarrow.float64()),
+            pyarrow.field("duration", pyarrow.float64()),
+            pyarrow.field("metric", pyarrow.string()),
+            pyarrow.field("value", pyarrow.float64()),
+            pyarrow.field("text", pyarrow.string()),
+        ])
+        self.row_group_size = int(row_group_size)
+        self._writer = pyarrow.parquet.ParquetWriter(
+            filename, self._schema, compression=compression
+        )
+        self._rows = []
+
+    def write(self, record):
+        self._rows.extend(_rows(record))
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        """
+        Helper method to write the buffered rows as a row group
+        """
+        if not self._rows:
+            return
+        columns = zip(*self._rows)
+        arrays = [
+            self._pyarrow.array(list(column), type=field.type)
+            for column, field in zip(columns, self._schema)
+        ]
+        self._writer.write_table(self._pyarrow.Table.from_arrays(arrays, schema=self._schema))
+        self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+# sinks by file extension, see :func:`open_sink`
+SINKS = {
+    ".jsonl": JSONLSink,
+    ".ndjson": JSONLSink,
+    ".csv": CSVSink,
+    ".parquet": ParquetSink,
+}
+
+
+def open_sink(filename, raw=True):
+    """
+    Helper function to create the sink for `filename` from its extension
+
+    ".jsonl" and ".ndjson" are written by :class:`employ.sinks.JSONLSink`,
+    ".csv" by :class:`employ.sinks.CSVSink`, either can be followed by
+    ".gz" to compress them, and ".parquet" by :class:`employ.sinks.ParquetSink`.
+
+    :param filename: the file to write to
+    :type filename: str
+    :param raw: whether or not to write each host's stdout and stderr
+    :type raw: bool
+    :returns: :class:`employ.sinks.Sink`
+    :raises: :class:`employ.exceptions.EmployError`
+    """
+    base = filename[:-3] if filename.endswith(".gz") else filename
+    extension = os.path.splitext(base)[1].lower()
+    cls = SINKS.get(extension)
+    if cls is None or (cls is ParquetSink and base != filename):
+        raise EmployError(
+            "Unknown output format: '%s', use .jsonl, .csv, .jsonl.gz, .csv.gz or .parquet" % (
+                filename
+            )
+        )
+    return cls(filename, raw=raw)
+
+
+def _open(filename):
+    """
+    Helper function to open `filename` for writing, gzip compressed when it ends with ".gz"
+    """
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "wb")
+    return open(filename, "wb")
+
+
+def _text(value):
+    """
+    Helper function to decode raw output so it can be written as text
+    """
+    if isinstance(value, str):
+        return value.decode("utf-8", "replace")
+    return value
+
+
+def _rows(record):
+    """
+    Helper function to split a record into one row per metric and raw output
+
+    :returns: list - [tuple of :data:`employ.sinks.COLUMNS`, ...]
+    """
+    common = tuple(
+        record[key] for key in (
+            "section", "command", "stage", "host", "status", "start", "end", "duration"
+        )
+    )
+    rows = [
+        common + (metric, value, None)
+        for metric, value in sorted(record["metrics"].iteritems())
+    ]
+    for stream in ("stdout", "stderr"):
+        if stream in record:
+            rows.append(common + (stream, None, record[stream]))
+    return rows
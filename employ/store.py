@@ -0,0 +1,122 @@
+import json
+import os
+import re
+import time
+
+from employ.exceptions import EmployError
+from employ.logger import logger
+
+# names runs can be saved under, they are used as filenames
+NAME_PATTERN = re.compile("^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+class ResultStore(object):
+    """
+    Local store of the combined results of runs, saved under a name.
+
+    Each run is a json file `<path>/<name>.json`, saving a run under a
+    name which already exists replaces it. A saved run looks like::
+
+      {
+        "name": "<name>", "saved": <unix time>, ...,
+        "commands": [
+          {"section": "ab", "command": "ab", "schedule": "concurrency",
+           "stage": 100, "result": {...}},
+          ...
+        ]
+      }
+
+    where "result" is the `to_dict()` of each command's combined results,
+    e.g. :func:`employ.commands.ab.ABResult.to_dict`.
+    """
+
+    def __init__(self, path=None):
+        """
+        Constructor for :class:`employ.store.ResultStore`
+
+        :param path: the directory to keep saved runs in, defaults to `~/.employ/results`
+        :type path: str
+        """
+        self.path = os.path.expanduser(path or "~/.employ/results")
+
+    def filename(self, name):
+        """
+        Get the filename of the run saved as `name`
+
+        :param name: the name of the run
+        :type name: str
+        :returns: str
+        :raises: :class:`employ.exceptions.EmployError` when `name` is not a valid name
+        """
+        if not NAME_PATTERN.match(name or ""):
+            raise EmployError(
+                "Invalid run name: '%s', use letters, numbers, '_', '.' and '-'" % name
+            )
+        return os.path.join(self.path, "%s.json" % name)
+
+    def save(self, name, results, **info):
+        """
+        Save the combined results of a run as `name`
+
+        Results which cannot be exported, because they have no
+        `to_dict()` method, are left out.
+
+        :param name: the name to save the run as
+        :type name: str
+        :param results: the commands which were run and their combined results
+        :type results: list - [(:class:`employ.commands.Command`, result), ...]
+        :param info: extra details to save with the run, e.g. the config file
+        :returns: str - the filename the run was saved to
+        """
+        filename = self.filename(name)
+        run = dict(info)
+        run["name"] = name
+        run["saved"] = time.time()
+        run["commands"] = []
+        for command, result in results:
+            if not hasattr(result, "to_dict"):
+                logger.info("not saving results of %s, they cannot be exported", command.name)
+                continue
+            run["commands"].append({
+                "section": command.section or command.name,
+                "command": command.name,
+                "schedule": command.schedule,
+                "stage": getattr(command, command.schedule) if command.schedule else None,
+                "result": result.to_dict(),
+            })
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        # write then rename so a run is never left half saved
+        partial = "%s.partial" % filename
+        with open(partial, "w") as fp:
+            json.dump(run, fp, indent=2, sort_keys=True)
+        os.rename(partial, filename)
+        return filename
+
+    def load(self, name):
+        """
+        Load the run saved as `name`
+
+        :param name: the name of the run
+        :type name: str
+        :returns: dict
+        :raises: :class:`employ.exceptions.EmployError` when there is no such run
+        """
+        filename = self.filename(name)
+        if not os.path.exists(filename):
+            raise EmployError("No run saved as '%s' in %s" % (name, self.path))
+        with open(filename, "r") as fp:
+            return json.load(fp)
+
+    def names(self):
+        """
+        Get the names of all saved runs
+
+        :returns: list - [name, ...]
+        """
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            entry[:-len(".json")] for entry in os.listdir(self.path) if entry.endswith(".json")
+        )
@@ -0,0 +1,214 @@
+import contextlib
+import json
+import threading
+
+from employ.result import now
+
+
+class Span(object):
+    """
+    A single timed phase of a run, optionally on a single host.
+    """
+    __slots__ = ("name", "host", "start", "end", "args")
+
+    def __init__(self, name, start, end, host=None, args=None):
+        """
+        Constructor for :class:`employ.trace.Span`
+
+        :param name: the name of the phase, e.g. "connect"
+        :type name: str
+        :param start: when the phase started, from :func:`employ.result.now`
+        :type start: float
+        :param end: when the phase ended, from :func:`employ.result.now`
+        :type end: float
+        :param host: the host the phase ran on, None for the whole run
+        :type host: str
+        :param args: extra details about the phase
+        :type args: dict
+        """
+        self.name = name
+        self.start = start
+        self.end = end
+        self.host = host
+        self.args = args or {}
+
+    @property
+    def duration(self):
+        """
+        Seconds the phase took
+
+        :returns: float
+        """
+        return self.end - self.start
+
+
+class Tracer(object):
+    """
+    Records spans for the phases of a run and exports them.
+
+    Spans are only recorded while the tracer is `enabled`, which
+    `employ --profile` and `employ --trace=<file>` turn on. Spans can be
+    recorded from any thread::
+
+      from employ.trace import tracer
+
+      with tracer.span("upload", host=host, path=path):
+          ...
+
+    """
+
+    def __init__(self):
+        """
+        Constructor for :class:`employ.trace.Tracer`
+        """
+        self.enabled = False
+        self.origin = now()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def enable(self):
+        """
+        Start recording spans, discarding any recorded before
+        """
+        with self._lock:
+            self.enabled = True
+            self.origin = now()
+            self.spans = []
+
+    def add(self, name, start, end, host=None, **args):
+        """
+        Record a span which already finished
+
+        :param name: the name of the phase
+        :type name: str
+        :param start: when the phase started, from :func:`employ.result.now`
+        :type start: float
+        :param end: when the phase ended, from :func:`employ.result.now`
+        :type end: float
+        :param host: the host the phase ran on, None for the whole run
+        :type host: str
+        """
+        if not self.enabled:
+            return
+        span = Span(name, start, end, host, args)
+        with self._lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, name, host=None, **args):
+        """
+        Context manager recording a span for the code it wraps,
+        the span is recorded even when the code raises
+
+        :param name: the name of the phase
+        :type name: str
+        :param host: the host the phase runs on, None for the whole run
+        :type host: str
+        """
+        start = now()
+        try:
+            yield
+        finally:
+            self.add(name, start, now(), host, **args)
+
+    def to_dict(self):
+        """
+        Export the recorded spans, times are in seconds since the tracer was enabled
+
+        :returns: dict - {"spans": [{"name", "host", "start", "end", "duration", "args"}, ...]}
+        """
+        return {
+            "spans": [
+                {
+                    "name": span.name,
+                    "host": span.host,
+                    "start": span.start - self.origin,
+                    "end": span.end - self.origin,
+                    "duration": span.duration,
+                    "args": span.args,
+                }
+                for span in sorted(self.spans, key=lambda span: span.start)
+            ],
+        }
+
+    def to_chrome(self):
+        """
+        Export the recorded spans in the Chrome trace event format, which
+        chrome://tracing and https://ui.perfetto.dev can open
+
+        Each host is shown as its own thread, spans for the whole run
+        are shown on the "employ" thread.
+
+        :returns: dict - {"traceEvents": [...], "displayTimeUnit": "ms"}
+        """
+        threads = {None: 0}
+        events = []
+        for span in sorted(self.spans, key=lambda span: span.start):
+            if span.host not in threads:
+                threads[span.host] = len(threads)
+            events.append({
+                "name": span.name,
+                "cat": "host" if span.host else "run",
+                "ph": "X",
+                "pid": 1,
+                "tid": threads[span.host],
+                "ts": (span.start - self.origin) * 1000000,
+                "dur": span.duration * 1000000,
+                "args": span.args,
+            })
+        for host, tid in threads.iteritems():
+            events.append({
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 1,
+                "tid": tid,
+                "args": {"name": host or "employ"},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, filename, format="chrome"):
+        """
+        Write the recorded spans to `filename`
+
+        :param filename: the file to write to
+        :type filename: str
+        :param format: "chrome" for :func:`to_chrome` or "json" for :func:`to_dict`
+        :type format: str
+        """
+        trace = self.to_chrome() if format == "chrome" else self.to_dict()
+        with open(filename, "w") as fp:
+            json.dump(trace, fp)
+
+    def summary(self):
+        """
+        Summarize the recorded spans by phase, slowest phases first
+
+        The total of a phase which runs on every host is summed over hosts.
+
+        :returns: str
+        """
+        phases = {}
+        for span in self.spans:
+            phase = phases.setdefault(span.name, [0, 0.0, None])
+            phase[0] += 1
+            phase[1] += span.duration
+            if phase[2] is None or span.duration > phase[2].duration:
+                phase[2] = span
+
+        lines = [
+            "Profile:",
+            "  %-20s %6s %10s %10s %10s  %s" % (
+                "Phase", "Count", "Total (s)", "Mean (s)", "Max (s)", "Slowest Host"
+            ),
+        ]
+        for name, (count, total, slowest) in sorted(
+                phases.iteritems(), key=lambda item: item[1][1], reverse=True
+        ):
+            lines.append("  %-20s %6s %10.3f %10.3f %10.3f  %s" % (
+                name, count, total, total / count, slowest.duration, slowest.host or "-"
+            ))
+        return "\n".join(lines)
+
+
+# the tracer all of employ records spans to
+tracer = Tracer()
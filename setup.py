@@ -9,7 +9,10 @@ setup(
     version=__version__,
     author="Brett Langdon",
     author_email="brett@blangdon.com",
-    packages=find_packages(),
+    packages=find_packages(exclude=["tests"]),
+    package_data={
+        "employ.commands": ["scripts/*.py"],
+    },
     namespace_packages=[
         "employ.commands",
         "employ.managers",
@@ -18,12 +21,13 @@ setup(
         "docopt>=0.6.0",
         "boto>=2.13.0",
         "paramiko>=1.11.0",
-        "straight.plugin>=1.4.0",
+        "futures>=2.1.0",
     ],
     scripts=[
         "bin/employ",
     ],
     setup_requires=[],
+    test_suite="tests",
     description="A distributed command execution framework.",
     license="MIT",
     url='https://github.com/brettlangdon/employ',
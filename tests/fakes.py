@@ -0,0 +1,144 @@
+"""
+Local stand-in for the parts of EC2 and boto employ uses
+"""
+import itertools
+import threading
+
+import boto.ec2
+import boto.exception
+
+from employ.exceptions import SSHConnectionError
+from employ.managers.ec2 import EC2Manager
+
+NOT_FOUND = (
+    "<Response><Errors><Error><Code>InvalidInstanceID.NotFound</Code>"
+    "<Message>The instance ID does not exist</Message></Error></Errors></Response>"
+)
+
+
+class FakeInstance(object):
+    def __init__(self, id, ip_address, states):
+        self.id = id
+        self.ip_address = ip_address
+        self.private_ip_address = None
+        self._states = list(states)
+        self.state = self._states[0]
+
+    def update(self):
+        if len(self._states) > 1:
+            self._states.pop(0)
+        self.state = self._states[0]
+
+
+class FakeReservation(object):
+    def __init__(self, instances):
+        self.instances = instances
+
+
+class FakeEC2(object):
+    """
+    Fake EC2 shared by the connections to every region
+
+    :param states: the states each new instance goes through, one per poll,
+        or a list of them for each new instance in the order they start
+    :param fail_regions: regions where starting instances fails
+    :param not_found: number of polls which do not see new instances yet
+    """
+
+    def __init__(self, states=("pending", "running"), fail_regions=(), not_found=0):
+        self.states = states
+        self.fail_regions = fail_regions
+        self.not_found = not_found
+        self.instances = {}
+        self.launched = []
+        self.terminated = []
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def connect_to_region(self, region):
+        return FakeConnection(self, region)
+
+    def add(self, region, states=("running", )):
+        with self._lock:
+            number = next(self._ids)
+        instance = FakeInstance("i-%s" % number, "10.0.0.%s" % number, states)
+        self.instances[instance.id] = (region, instance)
+        return instance
+
+
+class FakeConnection(object):
+    def __init__(self, ec2, region):
+        self.ec2 = ec2
+        self.region = region
+
+    def run_instances(self, image_id, min_count, max_count, placement=None, **kwargs):
+        self.ec2.launched.append((self.region, placement, image_id, min_count))
+        if self.region in self.ec2.fail_regions:
+            raise boto.exception.EC2ResponseError(500, "Internal Error", "")
+        states = self.ec2.states
+        if isinstance(states, list):
+            return FakeReservation([
+                self.ec2.add(self.region, states.pop(0)) for _ in xrange(min_count)
+            ])
+        return FakeReservation([
+            self.ec2.add(self.region, states) for _ in xrange(min_count)
+        ])
+
+    def create_tags(self, instance_ids, tags):
+        pass
+
+    def get_all_instances(self, instance_ids):
+        with self.ec2._lock:
+            missing = self.ec2.not_found > 0
+            if missing:
+                self.ec2.not_found -= 1
+        if missing or any(
+                self.ec2.instances.get(instance_id, (None, ))[0] != self.region
+                for instance_id in instance_ids
+        ):
+            raise boto.exception.EC2ResponseError(400, "Bad Request", NOT_FOUND)
+        instances = [self.ec2.instances[instance_id][1] for instance_id in instance_ids]
+        for instance in instances:
+            instance.update()
+        return [FakeReservation(instances)]
+
+    def terminate_instances(self, instance_ids):
+        self.ec2.terminated.append((self.region, sorted(instance_ids)))
+        for instance_id in instance_ids:
+            self.ec2.instances[instance_id][1].state = "terminated"
+
+
+class FakeClient(object):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeEC2Manager(EC2Manager):
+    """
+    :class:`employ.managers.ec2.EC2Manager` which does not connect over ssh
+
+    :param fail_hosts: hosts connecting to fails for
+    """
+
+    def __init__(self, fail_hosts=(), **kwargs):
+        super(FakeEC2Manager, self).__init__(**kwargs)
+        self.fail_hosts = fail_hosts
+        self.clients = []
+
+    def _connect(self, host):
+        if host in self.fail_hosts:
+            raise SSHConnectionError("Could not establish ssh connection to %s" % host)
+        client = FakeClient()
+        self.clients.append(client)
+        return client
+
+
+def patch_ec2(test, ec2):
+    """
+    Use `ec2` for every boto connection until `test` finishes
+    """
+    original = boto.ec2.connect_to_region
+    boto.ec2.connect_to_region = ec2.connect_to_region
+    test.addCleanup(setattr, boto.ec2, "connect_to_region", original)
@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from employ.commands.ab import ABCommand
+from employ.commands.httpload import HTTPLoadCommand
+from employ.commands.wrk import WrkCommand
+from employ.managers.local import LocalManager
+from employ.result import Result
+from employ.sinks import open_sink
+
+
+class FailedHostMetricsTest(unittest.TestCase):
+    commands = (
+        (ABCommand("http://127.0.0.1/", 100), "sh: ab: not found"),
+        (WrkCommand("http://127.0.0.1/"), "sh: wrk: not found"),
+        (HTTPLoadCommand("http://127.0.0.1/"), "sh: python3: not found"),
+    )
+
+    def test_metrics_of_failed_host(self):
+        for command, stdout in self.commands:
+            metrics = command.metrics(Result("host", 127, stdout, "", 0, 1))
+            self.assertEqual(metrics.get("requests_per_second"), 0, command.name)
+            self.assertFalse([key for key in metrics if key.startswith("latency_")], command.name)
+
+    def test_sink_records_failed_host(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, "results.jsonl")
+        with open_sink(filename) as sink:
+            for command, stdout in self.commands:
+                sink.add(command, Result("host", 127, stdout, "", 0, 1))
+        with open(filename, "r") as fp:
+            records = [json.loads(line) for line in fp]
+        self.assertEqual([record["command"] for record in records], ["ab", "wrk", "httpload"])
+        self.assertEqual([record["status"] for record in records], [127] * 3)
+
+
+class ParseOnceTest(unittest.TestCase):
+    def test_sink_and_results_share_parsed_output(self):
+        parsed = []
+
+        class CountingCommand(WrkCommand):
+            def _parse_result(self, stdout):
+                parsed.append(stdout)
+                return super(CountingCommand, self)._parse_result(stdout)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        manager = LocalManager()
+        manager.sink = open_sink(os.path.join(directory, "results.jsonl"))
+        self.addCleanup(manager.sink.close)
+        stdout = "  1000 requests in 10.00s, 1.00MB read\nRequests/sec:    100.00\n"
+        results = [Result(host, 0, stdout, "", 0, 1) for host in ("a", "b")]
+        combined = manager.collect_results(CountingCommand("http://127.0.0.1/"), results, "wrk")
+        self.assertEqual(len(parsed), 2)
+        self.assertEqual(combined.requests, 2000)
+
+
+if __name__ == "__main__":
+    unittest.main()
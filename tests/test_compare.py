@@ -0,0 +1,155 @@
+import math
+import unittest
+
+from employ.compare import Comparison, _kolmogorov, bootstrap_interval, compare_runs, ks_test
+
+UNIFORM = [(0.0, 0.0), (10.0, 1.0)]
+SHIFTED = [(5.0, 0.0), (15.0, 1.0)]
+
+
+def result(hosts, p99=10.0, cdf=UNIFORM, requests=100000):
+    """
+    Build a saved result with the requests per second of each host
+    """
+    return {
+        "requests": requests,
+        "requests_per_second": float(sum(hosts)),
+        "host_requests_per_second": hosts,
+        "percentiles": [[50, 5.0], [99, p99]],
+        "latency_cdf": cdf,
+    }
+
+
+class BootstrapIntervalTest(unittest.TestCase):
+    def test_same_seed_same_interval(self):
+        baseline = [100, 102, 98, 101, 99]
+        candidate = [97, 99, 95, 98, 96]
+        self.assertEqual(
+            bootstrap_interval(baseline, candidate), bootstrap_interval(baseline, candidate)
+        )
+
+    def test_single_sample_has_no_width(self):
+        low, high = bootstrap_interval([100], [90])
+        self.assertAlmostEqual(low, -0.1)
+        self.assertAlmostEqual(high, -0.1)
+
+    def test_no_baseline(self):
+        self.assertEqual(bootstrap_interval([0, 0], [10, 10]), (0.0, 0.0))
+
+
+class KSTest(unittest.TestCase):
+    def test_identical_distributions(self):
+        self.assertEqual(ks_test(UNIFORM, 1000, UNIFORM, 1000), (0.0, 1.0))
+
+    def test_shifted_distributions(self):
+        statistic, p_value = ks_test(UNIFORM, 100, SHIFTED, 100)
+        self.assertAlmostEqual(statistic, 0.5)
+        effective = math.sqrt(50)
+        expected = 2 * math.exp(-2 * ((effective + 0.12 + 0.11 / effective) * 0.5) ** 2)
+        self.assertAlmostEqual(p_value, expected, places=15)
+        self.assertLess(p_value, 1e-6)
+
+    def test_few_requests_are_not_significant(self):
+        statistic, p_value = ks_test(UNIFORM, 2, SHIFTED, 2)
+        self.assertAlmostEqual(statistic, 0.5)
+        self.assertGreater(p_value, 0.5)
+
+    def test_missing_distribution(self):
+        self.assertEqual(ks_test([], 0, UNIFORM, 100), (0.0, 1.0))
+        self.assertEqual(ks_test(UNIFORM, 0, SHIFTED, 100), (0.5, 1.0))
+
+    def test_kolmogorov(self):
+        # critical values of the Kolmogorov distribution
+        self.assertAlmostEqual(_kolmogorov(1.3581), 0.05, places=4)
+        self.assertAlmostEqual(_kolmogorov(1.6276), 0.01, places=4)
+        self.assertEqual(_kolmogorov(0.1), 1.0)
+        self.assertLess(_kolmogorov(10), 1e-80)
+
+
+class ComparisonTest(unittest.TestCase):
+    def test_identical_runs_pass(self):
+        hosts = [100.0, 102.0, 98.0, 101.0, 99.0]
+        comparison = Comparison("ab", result(hosts), result(hosts))
+        self.assertEqual(comparison.regressions, [])
+        self.assertEqual(comparison.throughput_change, 0.0)
+        self.assertLessEqual(comparison.interval[0], 0)
+        self.assertGreaterEqual(comparison.interval[1], 0)
+        self.assertEqual(comparison.p99_change, 0.0)
+        self.assertEqual(comparison.p_value, 1.0)
+        self.assertNotIn("REGRESSION", str(comparison))
+
+    def test_throughput_drop_across_hosts_fails(self):
+        comparison = Comparison(
+            "ab", result([100.0, 102.0, 98.0, 101.0, 99.0]), result([80.0, 82.0, 78.0, 81.0, 79.0])
+        )
+        self.assertEqual(comparison.regressions, ["throughput"])
+        self.assertAlmostEqual(comparison.throughput_change, -0.2)
+        self.assertLess(comparison.interval[0], comparison.interval[1])
+        self.assertLess(comparison.interval[1], 0)
+        self.assertIn("REGRESSION", str(comparison))
+
+    def test_noisy_hosts_do_not_fail(self):
+        # the total drops past the threshold, but not by more than the hosts vary
+        comparison = Comparison("ab", result([40.0, 160.0, 100.0]), result([150.0, 30.0, 100.0]))
+        self.assertLess(comparison.throughput_change * 100, -5)
+        self.assertGreater(comparison.interval[1], 0)
+        self.assertEqual(comparison.regressions, [])
+
+    def test_single_host_uses_threshold(self):
+        baseline = result([100.0])
+        del baseline["host_requests_per_second"]
+        comparison = Comparison("ab", baseline, result([94.0]))
+        self.assertAlmostEqual(comparison.interval[0], -0.06)
+        self.assertAlmostEqual(comparison.interval[1], -0.06)
+        self.assertEqual(comparison.regressions, ["throughput"])
+
+        comparison = Comparison("ab", baseline, result([96.0]))
+        self.assertEqual(comparison.regressions, [])
+        comparison = Comparison("ab", baseline, result([94.0]), threshold=10.0)
+        self.assertEqual(comparison.regressions, [])
+
+    def test_p99_rise_fails(self):
+        hosts = [100.0, 100.0]
+        comparison = Comparison(
+            "wrk", result(hosts), result(hosts, p99=15.0, cdf=SHIFTED)
+        )
+        self.assertEqual(comparison.regressions, ["p99"])
+        self.assertAlmostEqual(comparison.p99_change, 0.5)
+
+    def test_p99_rise_without_distributions_passes(self):
+        hosts = [100.0, 100.0]
+        comparison = Comparison("wrk", result(hosts, cdf=[]), result(hosts, p99=15.0, cdf=[]))
+        self.assertAlmostEqual(comparison.p99_change, 0.5)
+        self.assertEqual(comparison.regressions, [])
+
+
+class CompareRunsTest(unittest.TestCase):
+    def run_of(self, *stages):
+        return {"commands": [
+            {"section": "ab", "command": "ab", "schedule": "concurrency", "stage": stage,
+             "result": result([100.0, 100.0])}
+            for stage in stages
+        ] + [
+            {"section": "wrk", "command": "wrk", "schedule": None, "stage": None,
+             "result": result([100.0, 100.0])}
+        ]}
+
+    def test_missing_stages(self):
+        comparisons, missing = compare_runs(self.run_of(10, 100), self.run_of(10))
+        self.assertEqual(
+            [comparison.label for comparison in comparisons], ["ab concurrency=10", "wrk"]
+        )
+        self.assertEqual(missing, ["ab concurrency=100"])
+
+    def test_settings_are_passed_on(self):
+        candidate = self.run_of(10)
+        candidate["commands"][0]["result"] = result([94.0, 94.0])
+        comparisons, missing = compare_runs(self.run_of(10), candidate, threshold=1.0)
+        self.assertEqual(comparisons[0].regressions, ["throughput"])
+        comparisons, missing = compare_runs(self.run_of(10), candidate, threshold=10.0)
+        self.assertEqual(comparisons[0].regressions, [])
+        self.assertEqual(missing, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
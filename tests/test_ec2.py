@@ -0,0 +1,218 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import boto.exception
+
+from employ.exceptions import EmployError, SSHConnectionError
+from employ.managers.ec2 import parse_regions
+from employ.managers.ssh import SSHManager
+from tests.fakes import FakeEC2, FakeEC2Manager, patch_ec2
+
+
+class UnreachableEC2Manager(FakeEC2Manager):
+    """
+    :class:`tests.fakes.FakeEC2Manager` which keeps retrying to connect,
+    because no instance's ssh port ever accepts connections
+    """
+    _connect = SSHManager._connect
+
+    def _ssh_port_ready(self, host):
+        return False
+
+
+class RunningInstancesTest(unittest.TestCase):
+    def test_waits_until_new_instances_are_found(self):
+        ec2 = FakeEC2(not_found=2)
+        patch_ec2(self, ec2)
+        manager = FakeEC2Manager(num_instances=2, wait_interval=0)
+        manager.setup_instances()
+        self.assertEqual(len(manager.hosts()), 2)
+        self.assertEqual(len(manager.client_connections), 2)
+        self.assertEqual(ec2.not_found, 0)
+
+    def test_not_found_is_not_running(self):
+        ec2 = FakeEC2(not_found=1)
+        patch_ec2(self, ec2)
+        manager = FakeEC2Manager()
+        self.assertEqual(manager._running_instances(["i-0"]), [])
+
+    def test_terminal_state_raises(self):
+        ec2 = FakeEC2()
+        patch_ec2(self, ec2)
+        manager = FakeEC2Manager()
+        for state in ("terminated", "stopped", "shutting-down"):
+            instance = ec2.add("us-east-1", (state, ))
+            self.assertRaises(EmployError, manager._running_instances, [instance.id])
+
+    def test_terminated_while_starting_terminates_all(self):
+        ec2 = FakeEC2(states=("pending", "terminated"))
+        patch_ec2(self, ec2)
+        manager = FakeEC2Manager(num_instances=2, wait_interval=0)
+        self.assertRaises(EmployError, manager.setup_instances)
+        self.assertEqual(ec2.terminated, [("us-east-1", ["i-0", "i-1"])])
+
+    def test_terminated_while_connecting_stops_connecting(self):
+        ec2 = FakeEC2(states=[("running", ), ("pending", "terminated")])
+        patch_ec2(self, ec2)
+        manager = UnreachableEC2Manager(num_instances=2, wait_interval=0.1)
+        started = time.time()
+        self.assertRaises(EmployError, manager.setup_instances)
+        self.assertLess(time.time() - started, 2)
+        self.assertEqual(ec2.terminated, [("us-east-1", ["i-0", "i-1"])])
+        self.assertIsNone(manager._executor)
+
+    def test_pending_forever_times_out(self):
+        ec2 = FakeEC2(states=("pending", ))
+        patch_ec2(self, ec2)
+        manager = FakeEC2Manager(num_instances=1, wait_interval=0.01, wait_timeout=0.05)
+        self.assertRaises(EmployError, manager.setup_instances)
+        self.assertEqual(ec2.terminated, [("us-east-1", ["i-0"])])
+
+
+class ConnectFailureTest(unittest.TestCase):
+    def test_failed_connection_terminates_all(self):
+        ec2 = FakeEC2()
+        patch_ec2(self, ec2)
+        manager = FakeEC2Manager(num_instances=3, wait_interval=0, fail_hosts=("10.0.0.1", ))
+        self.assertRaises(SSHConnectionError, manager.__enter__)
+        self.assertEqual(ec2.terminated, [("us-east-1", ["i-0", "i-1", "i-2"])])
+        self.assertEqual(len(manager.clients), 2)
+        self.assertTrue(all(client.closed for client in manager.clients))
+        self.assertEqual(manager.client_connections, {})
+        self.assertIsNone(manager._executor)
+
+    def test_failed_connection_during_up_terminates_all(self):
+        ec2 = FakeEC2()
+        patch_ec2(self, ec2)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        manager = FakeEC2Manager(num_instances=2, wait_interval=0, fail_hosts=("10.0.0.0", ))
+        manager.state_file = os.path.join(directory, "ec2.json")
+        self.assertRaises(SSHConnectionError, manager.up, [])
+        self.assertEqual(ec2.terminated, [("us-east-1", ["i-0", "i-1"])])
+        self.assertFalse(os.path.exists(manager.state_file))
+
+
+class WarmPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.ec2 = FakeEC2()
+        patch_ec2(self, self.ec2)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.state_file = os.path.join(directory, "ec2.json")
+
+    def manager(self, state):
+        with open(self.state_file, "w") as fp:
+            json.dump({"instances": state, "scripts": {}}, fp)
+        manager = FakeEC2Manager(wait_interval=0)
+        manager.state_file = self.state_file
+        return manager
+
+    def test_down_skips_missing_instances(self):
+        instance = self.ec2.add("us-east-1")
+        manager = self.manager({"regions": {"us-east-1": [instance.id, "i-gone"]}})
+        manager.down()
+        self.assertEqual(self.ec2.terminated, [("us-east-1", [instance.id])])
+        self.assertFalse(os.path.exists(self.state_file))
+
+    def test_down_with_no_instances_left_clears_state(self):
+        manager = self.manager({"regions": {"us-east-1": ["i-gone"]}})
+        manager.down()
+        self.assertEqual(self.ec2.terminated, [])
+        self.assertFalse(os.path.exists(self.state_file))
+
+    def test_attach_missing_instance_raises(self):
+        instance = self.ec2.add("us-east-1")
+        manager = self.manager({"regions": {"us-east-1": [instance.id, "i-gone"]}})
+        with self.assertRaises(EmployError) as raised:
+            manager.__enter__()
+        self.assertIn("i-gone", str(raised.exception))
+
+
+class ParseRegionsTest(unittest.TestCase):
+    def test_regions_and_zones(self):
+        self.assertEqual(
+            parse_regions("us-east-1:20, us-west-2a:10:ami-0123abcd,eu-west-1", "ami-default"),
+            [
+                ("us-east-1", None, 20, "ami-default"),
+                ("us-west-2", "us-west-2a", 10, "ami-0123abcd"),
+                ("eu-west-1", None, 1, "ami-default"),
+            ]
+        )
+
+    def test_invalid_regions(self):
+        for regions in ("", "us-east-1:many", "useast:1", "us-east-1:1:ami:extra"):
+            self.assertRaises(EmployError, parse_regions, regions)
+
+
+class RegionsTest(unittest.TestCase):
+    def test_launches_every_region(self):
+        ec2 = FakeEC2()
+        patch_ec2(self, ec2)
+        manager = FakeEC2Manager(regions="us-east-1:2,us-west-2b:1", wait_interval=0)
+        manager.setup_instances()
+        self.assertEqual(sorted(ec2.launched), [
+            ("us-east-1", None, "ami-da0cf8b3", 2),
+            ("us-west-2", "us-west-2b", "ami-da0cf8b3", 1),
+        ])
+        groups = manager.host_groups()
+        self.assertEqual(sorted(groups), ["Region us-east-1", "Region us-west-2"])
+        self.assertEqual(len(groups["Region us-east-1"]), 2)
+        self.assertEqual(len(groups["Region us-west-2"]), 1)
+
+    def test_single_region_has_no_groups(self):
+        patch_ec2(self, FakeEC2())
+        manager = FakeEC2Manager(num_instances=2, wait_interval=0)
+        manager.setup_instances()
+        self.assertEqual(manager.host_groups(), {})
+
+    def test_failed_region_terminates_launched_regions(self):
+        ec2 = FakeEC2(fail_regions=("us-west-2", ))
+        patch_ec2(self, ec2)
+        manager = FakeEC2Manager(regions="us-east-1:2,eu-west-1:1,us-west-2:1", wait_interval=0)
+        self.assertRaises(boto.exception.EC2ResponseError, manager.setup_instances)
+        self.assertEqual(sorted(ec2.terminated), [
+            ("eu-west-1", [manager.instance_ids("eu-west-1")[0]]),
+            ("us-east-1", sorted(manager.instance_ids("us-east-1"))),
+        ])
+        self.assertEqual(
+            [instance.state for region, instance in ec2.instances.values()], ["terminated"] * 3
+        )
+
+
+class InstanceStateTest(unittest.TestCase):
+    def setUp(self):
+        self.ec2 = FakeEC2()
+        patch_ec2(self, self.ec2)
+
+    def test_round_trip(self):
+        manager = FakeEC2Manager(regions="us-east-1:2,us-west-2:1", wait_interval=0)
+        manager.setup_instances()
+        state = manager.instance_state()
+        self.assertEqual(sorted(state["regions"]), ["us-east-1", "us-west-2"])
+
+        attached = FakeEC2Manager()
+        attached.attach_instances(state)
+        self.assertEqual(attached.instance_state(), state)
+        self.assertEqual(sorted(attached.hosts()), sorted(manager.hosts()))
+        self.assertEqual(attached.host_groups(), manager.host_groups())
+
+    def test_old_single_region_format(self):
+        instances = [self.ec2.add("us-west-2") for _ in xrange(2)]
+        state = {"region": "us-west-2", "instance_ids": [instance.id for instance in instances]}
+        manager = FakeEC2Manager()
+        manager.attach_instances(state)
+        self.assertEqual(manager.hosts(), [instance.ip_address for instance in instances])
+        self.assertEqual(
+            manager.instance_state(), {"regions": {"us-west-2": state["instance_ids"]}}
+        )
+        manager.cleanup_instances()
+        self.assertEqual(self.ec2.terminated, [("us-west-2", state["instance_ids"])])
+
+
+if __name__ == "__main__":
+    unittest.main()
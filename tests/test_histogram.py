@@ -0,0 +1,180 @@
+import math
+import random
+import unittest
+
+from employ.commands.histogram import Histogram, mixture_cdf, mixture_quantile
+
+TABLE = [(0.0, 0.0), (5.0, 0.5), (9.0, 0.9), (20.0, 0.99), (50.0, 1.0)]
+
+
+def exact_percentile(values, percent):
+    """
+    Get the smallest value with at least `percent` of `values` at or below it
+    """
+    ordered = sorted(values)
+    rank = max(1, len(ordered) * percent / 100.0)
+    return ordered[int(math.ceil(rank)) - 1]
+
+
+class BucketTest(unittest.TestCase):
+    def test_bucket_contains_value(self):
+        for precision in (4, 8):
+            histogram = Histogram(precision=precision)
+            values = set([0, 1, (1 << 40) + 12345])
+            for bits in xrange(1, 32):
+                values.update(((1 << bits) - 1, 1 << bits, (1 << bits) + 1))
+            for value in sorted(values):
+                low, high = histogram._range(histogram._index(value))
+                self.assertTrue(low <= value <= high, (precision, value, low, high))
+                self.assertLessEqual(high - low, value * 2.0 ** -(precision - 1))
+
+    def test_boundaries(self):
+        histogram = Histogram()
+        self.assertEqual(histogram._range(histogram._index(255)), (255, 255))
+        self.assertEqual(histogram._range(histogram._index(256)), (256, 257))
+        self.assertEqual(histogram._range(histogram._index(511)), (510, 511))
+        self.assertEqual(histogram._range(histogram._index(512)), (512, 515))
+        self.assertEqual(histogram._index(256), histogram._index(255) + 1)
+        self.assertEqual(histogram._index(512), histogram._index(511) + 1)
+
+    def test_buckets_are_contiguous(self):
+        histogram = Histogram(precision=4)
+        previous = None
+        for index in xrange(200):
+            low, high = histogram._range(index)
+            if previous is not None:
+                self.assertEqual(low, previous + 1)
+            self.assertEqual(histogram._index(low), index)
+            self.assertEqual(histogram._index(high), index)
+            previous = high
+
+
+class PercentileTest(unittest.TestCase):
+    def test_error_within_precision(self):
+        generator = random.Random(0)
+        for precision in (4, 8):
+            values = [int(generator.lognormvariate(8, 1.5)) for _ in xrange(20000)]
+            histogram = Histogram(precision=precision)
+            for value in values:
+                histogram.record(value)
+            for percent in (0, 1, 25, 50, 90, 99, 99.9, 99.99, 100):
+                exact = exact_percentile(values, percent)
+                estimate = histogram.percentile(percent)
+                self.assertGreaterEqual(estimate, exact)
+                self.assertLessEqual(
+                    estimate - exact, exact * 2.0 ** -(precision - 1), (precision, percent)
+                )
+            self.assertEqual(histogram.percentile(100), max(values))
+
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertEqual(histogram.mean(), 0.0)
+        self.assertEqual(histogram.cdf(), [])
+
+    def test_negative_values(self):
+        self.assertRaises(ValueError, Histogram().record, -1)
+
+
+class HistogramTestCase(unittest.TestCase):
+    def assertSameHistogram(self, first, second):
+        self.assertEqual(first.precision, second.precision)
+        self.assertEqual(first.total, second.total)
+        self.assertEqual(first.min, second.min)
+        self.assertEqual(first.max, second.max)
+        self.assertEqual(
+            [count for count in first.counts if count], [count for count in second.counts if count]
+        )
+        self.assertEqual(first.cdf(), second.cdf())
+
+
+class EncodeTest(HistogramTestCase):
+    def test_round_trip(self):
+        generator = random.Random(1)
+        for precision in (4, 8, 12):
+            histogram = Histogram(precision=precision)
+            for _ in xrange(5000):
+                histogram.record(int(generator.expovariate(0.001)))
+            histogram.record(0, 3)
+            self.assertSameHistogram(Histogram.decode(histogram.encode()), histogram)
+
+    def test_empty_round_trip(self):
+        decoded = Histogram.decode(Histogram().encode())
+        self.assertEqual(decoded.total, 0)
+        self.assertIsNone(decoded.min)
+        self.assertIsNone(decoded.max)
+
+    def test_from_output(self):
+        first = Histogram()
+        first.record(100)
+        second = Histogram()
+        second.record(5000, 2)
+        output = "requests: 3\n%s %s\nnoise\n  %s %s\n" % (
+            Histogram.marker, first.encode(), Histogram.marker, second.encode()
+        )
+        histogram = Histogram.from_output(output)
+        self.assertEqual(histogram.total, 3)
+        self.assertEqual((histogram.min, histogram.max), (100, 5000))
+        self.assertIsNone(Histogram.from_output("requests: 0\n"))
+
+
+class MergeTest(HistogramTestCase):
+    def test_merge_equals_recording_together(self):
+        generator = random.Random(2)
+        together = Histogram()
+        merged = Histogram()
+        for _ in xrange(5):
+            part = Histogram()
+            for _ in xrange(1000):
+                value = int(generator.lognormvariate(7, 1))
+                part.record(value)
+                together.record(value)
+            merged.merge(part)
+        self.assertSameHistogram(merged, together)
+        self.assertEqual(merged.percentile(99), together.percentile(99))
+        self.assertEqual(merged.mean(), together.mean())
+
+    def test_merge_empty_and_none(self):
+        histogram = Histogram()
+        histogram.record(10)
+        self.assertIs(histogram.merge(None), histogram)
+        self.assertIs(histogram.merge(Histogram()), histogram)
+        self.assertEqual(histogram.total, 1)
+
+    def test_merge_precision_mismatch(self):
+        other = Histogram(precision=4)
+        other.record(10)
+        self.assertRaises(ValueError, Histogram().merge, other)
+
+
+class MixtureTest(unittest.TestCase):
+    def test_identical_tables(self):
+        tables = [(10, TABLE), (20, TABLE), (30, TABLE)]
+        for value, fraction in TABLE[1:]:
+            self.assertAlmostEqual(mixture_quantile(tables, fraction), value)
+
+    def test_interpolates_between_points(self):
+        self.assertAlmostEqual(mixture_quantile([(1, TABLE)], 0.25), 2.5)
+        self.assertAlmostEqual(mixture_quantile([(1, TABLE)], 0.7), 7.0)
+
+    def test_disjoint_tables(self):
+        # half of the requests are 0 - 10, the other half 10 - 20
+        tables = [(100, [(0.0, 0.0), (10.0, 1.0)]), (100, [(10.0, 0.0), (20.0, 1.0)])]
+        self.assertAlmostEqual(mixture_quantile(tables, 0.5), 10.0)
+        self.assertAlmostEqual(mixture_quantile(tables, 0.75), 15.0)
+        self.assertEqual(
+            mixture_cdf(tables, [0.0, 5.0, 10.0, 15.0, 20.0]),
+            [(0.0, 0.0), (5.0, 0.25), (10.0, 0.5), (15.0, 0.75), (20.0, 1.0)],
+        )
+
+    def test_weights(self):
+        tables = [(300, [(0.0, 0.0), (10.0, 1.0)]), (100, [(10.0, 0.0), (20.0, 1.0)])]
+        self.assertAlmostEqual(mixture_quantile(tables, 0.75), 10.0)
+
+    def test_cdf_of_identical_tables(self):
+        self.assertEqual(mixture_cdf([(10, TABLE), (30, TABLE)]), TABLE)
+        self.assertEqual(mixture_cdf([(0, TABLE)], [1.0]), [(1.0, 0.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
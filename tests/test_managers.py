@@ -0,0 +1,158 @@
+import threading
+import time
+import unittest
+
+from employ.commands import Command
+from employ.exceptions import EmployError
+from employ.managers import Manager
+from employ.managers.ec2 import EC2Manager
+from employ.managers.hosts import HostsManager
+from employ.managers.local import LocalManager
+from employ.result import Result
+
+
+class CountCommand(Command):
+    name = "count"
+
+    def aggregate(self, results):
+        return sorted(result.host for result in results)
+
+
+class RendezvousHostsManager(HostsManager):
+    """
+    :class:`employ.managers.hosts.HostsManager` whose commands wait for
+    every host's command to be running, instead of running over ssh
+    """
+    # seconds each command waits for the others
+    timeout = 5
+
+    def __init__(self, **kwargs):
+        super(RendezvousHostsManager, self).__init__(**kwargs)
+        self.running = 0
+        self.most_running = 0
+        self.condition = threading.Condition()
+
+    def _run_command(self, host, command, callback=None, start_at=None):
+        deadline = time.time() + self.timeout
+        with self.condition:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+            self.condition.notify_all()
+            if command == "rendezvous":
+                while self.most_running < len(self.hosts()) and time.time() < deadline:
+                    self.condition.wait(deadline - time.time())
+            self.running -= 1
+        return Result(host, 0, str(self.most_running), "", 0, 1)
+
+
+class GroupedManager(Manager):
+    def host_groups(self):
+        return {"A": ["a1", "a2"], "B": ["b1"]}
+
+
+class WarmPoolSupportTest(unittest.TestCase):
+    def test_local_manager_does_not_support_warm_pools(self):
+        manager = LocalManager()
+        self.assertFalse(manager.supports_warm_pools())
+        self.assertRaises(EmployError, manager.up, [])
+        self.assertRaises(EmployError, manager.down)
+        self.assertEqual(manager.workers, [])
+
+    def test_ssh_managers_support_warm_pools(self):
+        self.assertTrue(HostsManager(hosts="127.0.0.1").supports_warm_pools())
+        self.assertTrue(EC2Manager().supports_warm_pools())
+
+
+class EnsureParallelTest(unittest.TestCase):
+    def test_tasks_run_at_once_past_max_parallel(self):
+        manager = LocalManager(num_workers=1, max_parallel=2)
+        self.addCleanup(manager.shutdown)
+        old = manager.executor()
+        manager.ensure_parallel(4)
+        self.assertIsNot(manager.executor(), old)
+
+        started = []
+        condition = threading.Condition()
+
+        def task(host):
+            deadline = time.time() + 5
+            with condition:
+                started.append(host)
+                condition.notify_all()
+                while len(started) < 4 and time.time() < deadline:
+                    condition.wait(deadline - time.time())
+                return len(started) == 4
+
+        results = manager.map_hosts(task, range(4))
+        self.assertEqual([result for host, result in results], [True] * 4)
+
+    def test_smaller_count_keeps_pool(self):
+        manager = LocalManager(num_workers=1, max_parallel=4)
+        self.addCleanup(manager.shutdown)
+        executor = manager.executor()
+        manager.ensure_parallel(3)
+        self.assertIs(manager.executor(), executor)
+
+
+class SSHRunTest(unittest.TestCase):
+    def manager(self):
+        hosts = ",".join("10.0.0.%s" % number for number in xrange(12))
+        manager = RendezvousHostsManager(hosts=hosts, max_parallel=3)
+        self.addCleanup(manager.shutdown)
+        return manager
+
+    def test_commands_run_on_all_hosts_at_once(self):
+        manager = self.manager()
+        command = CountCommand()
+        command.command = lambda: "rendezvous"
+        manager.run(command)
+        self.assertEqual(manager.most_running, 12)
+
+    def test_setup_keeps_max_parallel(self):
+        manager = self.manager()
+        manager.timeout = 0.1
+        manager._run_multi("rendezvous")
+        self.assertEqual(manager.most_running, 3)
+        self.assertEqual(manager._executor_size, 3)
+
+
+class GroupResultsTest(unittest.TestCase):
+    def test_concurrent_sections_keep_their_groups(self):
+        manager = GroupedManager()
+        sections = {"count:reads": ["a1", "b1"], "count:writes": ["a2"]}
+        threads = []
+        for section, hosts in sections.items():
+            command = CountCommand()
+            command.section = section
+            results = [Result(host, 0, "", "", 0, 1) for host in hosts]
+            threads.append(threading.Thread(
+                target=manager.collect_results, args=(command, results, "count")
+            ))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(manager.group_results, {
+            "count:reads": {"A": ["a1"], "B": ["b1"]},
+            "count:writes": {"A": ["a2"]},
+        })
+
+
+class PartitionHostsTest(unittest.TestCase):
+    def test_pool_fits_every_partition(self):
+        manager = LocalManager(num_workers=10, max_parallel=2)
+        self.addCleanup(manager.shutdown)
+        manager.setup_instances()
+        partitions = manager.partition_hosts(["30%", "4"])
+        self.assertEqual([len(hosts) for hosts in partitions], [3, 4])
+        self.assertFalse(set(partitions[0]) & set(partitions[1]))
+        self.assertEqual(manager._executor_size, 7)
+
+    def test_too_many_hosts_raises(self):
+        manager = LocalManager(num_workers=2)
+        manager.setup_instances()
+        self.assertRaises(EmployError, manager.partition_hosts, ["1", "2"])
+
+
+if __name__ == "__main__":
+    unittest.main()